@@ -0,0 +1,64 @@
+import os
+import signal
+import threading
+
+from src import memory
+from src.lifecycle import lifecycle
+
+bind = "0.0.0.0:5000"
+
+# Threads beyond the concurrency limit let excess requests be shed with a
+# fast 503 instead of waiting in the listen backlog. The database pools are
+# sized from the same variable (``WORKER_THREADS`` in src/config.py).
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+# Workers are recycled on memory (see ``post_request``), not request count.
+max_requests = 0
+max_worker_rss = int(os.environ.get("MAX_WORKER_RSS_MB", "250")) * 2**20
+rss_check_interval = int(os.environ.get("RSS_CHECK_INTERVAL", "100"))
+
+# On SIGTERM a worker fails readiness for ``drain_seconds`` while still
+# serving, then stops accepting and finishes in-flight requests. Keep ECS's
+# ``stopTimeout`` above ``graceful_timeout``.
+drain_seconds = int(os.environ.get("DRAIN_SECONDS", "10"))
+graceful_timeout = drain_seconds + 20
+
+
+def post_worker_init(worker):
+    # Gunicorn resets signal handlers in each worker, so install ours here.
+    # ``kill -USR2 <worker pid>`` prints a tracemalloc diff to stderr.
+    memory.install_signal_handler()
+
+    def drain(signum, frame):
+        lifecycle.drain()
+        timer = threading.Timer(drain_seconds, worker.handle_exit, (signum, frame))
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, drain)
+
+    try:
+        lifecycle.warm_up()
+    except Exception:
+        # Serve anyway; ``/ready`` keeps failing and retries the warm-up.
+        worker.log.exception("Warm-up failed")
+
+
+def worker_exit(server, worker):
+    lifecycle.shutdown()
+
+
+def post_request(worker, req, environ, resp):
+    if worker.nr % rss_check_interval:
+        return
+    rss = memory.update_gauges()["rss"]
+    if rss > max_worker_rss:
+        worker.log.info(
+            "Worker %s RSS %.0f MiB exceeds %.0f MiB; recycling.",
+            worker.pid,
+            rss / 2**20,
+            max_worker_rss / 2**20,
+        )
+        # Finish in-flight requests, then exit; the arbiter forks a fresh worker.
+        worker.alive = False
@@ -1,7 +1,35 @@
+import datetime
+import json
+import random
+import signal
+import string
+import threading
+import time
+import tracemalloc
+
+import click
 from flask.cli import FlaskGroup
+from flask_restx import Model
 
-from src import create_app, db
+from src import create_app, db, shards
+from src.api import jobs
+from src.api.idempotency import purge_expired_keys
+from src.api.users import tasks
+from src.api.users.auth import login as login_model
+from src.api.users.autocomplete import AutocompleteIndex
+from src.api.users.crud import archive_users as archive_inactive_users
+from src.api.users.crud import get_user_by_email, get_user_by_id
+from src.api.users.events import purge_expired_events
+from src.api.users.export import COMPRESSIONS, FORMATS
+from src.api.users.export import export_users as export_users_to
 from src.api.users.models import User
+from src.api.users.passwords import build_breach_filter as build_filter
+from src.api.users.stats import rebuild_stats as rebuild_user_stats
+from src.api.validation import compiled_validator
+from src.benchmarks import http_load, load_capture, percentile
+from src.benchmarks import replay as replay_capture
+from src.benchmarks import time_per_call
+from src.bloom import BloomFilter
 
 app = create_app()
 cli = FlaskGroup(create_app=create_app)
@@ -12,6 +40,9 @@ def recreate_db():
     db.drop_all()
     db.create_all()
     db.session.commit()
+    if shards.enabled:
+        shards.drop_all()
+        shards.create_all()
 
 
 @cli.command("seed_db")
@@ -25,5 +56,283 @@ def seed_db():
     db.session.commit()
 
 
+@cli.command("archive_users")
+@click.option(
+    "--older-than-days",
+    default=30,
+    show_default=True,
+    help="Only archive users deactivated at least this many days ago.",
+)
+@click.option(
+    "--dormant-days",
+    type=int,
+    help="Also archive active users that have not logged in for this many days.",
+)
+@click.option("--batch-size", default=1000, show_default=True)
+@click.option("--background", is_flag=True, help="Queue a job for the worker.")
+def archive_users(older_than_days, dormant_days, batch_size, background):
+    if background:
+        queued = tasks.archive_users.enqueue(
+            older_than_days=older_than_days, dormant_days=dormant_days
+        )
+        click.echo(f"Queued job {queued.id}.")
+        return
+
+    archived = archive_inactive_users(
+        datetime.timedelta(days=older_than_days),
+        batch_size=batch_size,
+        dormant_for=datetime.timedelta(days=dormant_days) if dormant_days else None,
+    )
+    click.echo(f"Archived {archived} users.")
+
+
+@cli.command("reshard")
+@click.argument("buckets", type=int, nargs=-1, required=True)
+@click.option("--to", "target", required=True, help="Shard bind to move to.")
+@click.option(
+    "--wait",
+    type=float,
+    help="Seconds to wait for workers to reload the shard map.  [default: SHARD_MAP_TTL]",
+)
+def reshard(buckets, target, wait):
+    """Move the users in BUCKETS to another shard."""
+    if target not in shards.shard_ids():
+        raise click.BadParameter(f"Unknown shard {target}.", param_hint="--to")
+    for bucket in buckets:
+        moved = shards.move_bucket(bucket, target, wait=wait)
+        click.echo(f"Moved bucket {bucket} ({moved} users) to {target}.")
+
+
+@cli.command("export_users")
+@click.argument("path")
+@click.option("--format", "fmt", type=click.Choice(FORMATS), default="csv")
+@click.option(
+    "--compression", type=click.Choice(COMPRESSIONS), default="gzip", show_default=True
+)
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    help="Only export users created after this watermark.",
+)
+@click.option("--chunk-size", default=10000, show_default=True)
+@click.option(
+    "--lag",
+    default=300,
+    show_default=True,
+    help="Leave out users created this many seconds before the export.",
+)
+def export_users(path, fmt, compression, since, chunk_size, lag):
+    """Export users to PATH without going through the API."""
+    result = export_users_to(
+        path,
+        fmt=fmt,
+        compression=compression,
+        since=since,
+        chunk_size=chunk_size,
+        lag=lag,
+    )
+    click.echo(
+        f"Exported {result['rows']} users in {result['seconds']:.2f}s "
+        f"({result['rows_per_second']:.0f} rows/s)."
+    )
+    if result["watermark"] is not None:
+        click.echo(f"Next watermark: {result['watermark'].isoformat()}")
+
+
+@cli.command("import_users")
+@click.argument("path", type=click.File())
+@click.option("--chunk-size", default=500, show_default=True)
+def import_users(path, chunk_size):
+    """Queue jobs creating the users in PATH, one JSON object per line."""
+    users = [json.loads(line) for line in path if line.strip()]
+    queued, breached = tasks.queue_import(users, chunk_size)
+    click.echo(f"Queued {queued} users in {-(-queued // chunk_size)} jobs.")
+    if breached:
+        click.echo(f"Skipped {breached} users with breached passwords.")
+
+
+@cli.command("worker")
+@click.option("--concurrency", default=1, show_default=True)
+@click.option("--burst", is_flag=True, help="Exit once no job is due.")
+def worker(concurrency, burst):
+    """Run queued background jobs."""
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    processed = jobs.work(app, concurrency=concurrency, burst=burst, stop=stop)
+    click.echo(f"Processed {processed} jobs.")
+
+
+@cli.command("build_breach_filter")
+@click.argument("corpus", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option("--error-rate", default=1e-3, show_default=True)
+@click.option("--plaintext", is_flag=True, help="CORPUS lists passwords, not SHA-1s.")
+def build_breach_filter(corpus, output, error_rate, plaintext):
+    """Compile a breached password corpus for BREACHED_PASSWORDS_FILTER."""
+    started = time.perf_counter()
+    bloom = build_filter(corpus, output, error_rate=error_rate, plaintext=plaintext)
+    click.echo(
+        f"Wrote {output}: {bloom.num_bits // 8 / 2**20:.1f} MiB, "
+        f"{bloom.num_hashes} hashes, in {time.perf_counter() - started:.1f}s."
+    )
+
+    mapped = BloomFilter.open(output)
+    password = "correct horse battery staple"
+    digest = BloomFilter.digest(password)
+    lookup_us = time_per_call(lambda: digest in mapped, 100000)
+    hash_us = time_per_call(lambda: BloomFilter.digest(password), 100000)
+    click.echo(f"Lookup: {lookup_us:.2f} us, plus {hash_us:.2f} us to hash.")
+
+
+@cli.command("purge_idempotency_keys")
+def purge_idempotency_keys():
+    click.echo(f"Purged {purge_expired_keys()} expired idempotency keys.")
+
+
+@cli.command("purge_user_events")
+def purge_user_events():
+    click.echo(f"Purged {purge_expired_events()} expired user events.")
+
+
+@cli.command("rebuild_stats")
+def rebuild_stats():
+    click.echo(f"Counted users on {rebuild_user_stats()} days.")
+
+
+@cli.command("bench_concurrency")
+@click.option("--sync-url", default="http://localhost:5004", show_default=True)
+@click.option("--async-url", default="http://localhost:5005", show_default=True)
+@click.option("--path", default="/users/1", show_default=True)
+@click.option("--concurrency", "-c", multiple=True, type=int, default=(1, 16, 64, 256))
+@click.option("--duration", default=10.0, show_default=True)
+def bench_concurrency(sync_url, async_url, path, concurrency, duration):
+    """Compare throughput of the sync and async deployments."""
+    click.echo(f"{'server':<8}{'conns':>7}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for connections in concurrency:
+        for name, base_url in (("sync", sync_url), ("async", async_url)):
+            result = http_load(base_url + path, connections, duration)
+            click.echo(
+                f"{name:<8}{connections:>7}{result['rps']:>10.1f}"
+                f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                + (f"  ({result['errors']} errors)" if result["errors"] else "")
+            )
+
+
+@cli.command("bench_validation")
+@click.option("--iterations", default=20000, show_default=True)
+def bench_validation(iterations):
+    """Compare per-request and precompiled validation of the login payload."""
+    from src.api import api
+
+    payload = {"email": "jpinto@flask.com", "password": "mypassword123"}
+    definitions = {name: model.__schema__ for name, model in api.models.items()}
+    compiled = compiled_validator(login_model, definitions)
+
+    with app.test_request_context():
+        resolver = api.refresolver
+        default_us = time_per_call(
+            lambda: Model.validate(login_model, payload, resolver), iterations
+        )
+        compiled_us = time_per_call(lambda: compiled(payload), iterations)
+
+    click.echo(f"per-request jsonschema: {default_us:8.2f} us/validation")
+    click.echo(f"precompiled:            {compiled_us:8.2f} us/validation")
+    click.echo(f"speedup:                {default_us / compiled_us:8.1f}x")
+
+
+@cli.command("bench_lookups")
+@click.option("--iterations", default=5000, show_default=True)
+def bench_lookups(iterations):
+    """Compare per-lookup overhead of ORM queries and the cached lookups."""
+    user = User.query.filter(User.active).first()
+    if user is None:
+        raise click.ClickException("Seed at least one active user first.")
+    user_id, email = user.id, user.email
+    db.session.expire_all()
+
+    active = User.query.filter(User.active)
+    cases = [
+        ("orm query by id", None, lambda: active.filter_by(id=user_id).first()),
+        ("orm query by email", None, lambda: active.filter_by(email=email).first()),
+        ("cached by id", False, lambda: get_user_by_id(user_id)),
+        ("cached by email", False, lambda: get_user_by_email(email)),
+        ("prepared by id", True, lambda: get_user_by_id(user_id)),
+        ("prepared by email", True, lambda: get_user_by_email(email)),
+    ]
+
+    with app.test_request_context():
+        for name, prepared, lookup in cases:
+            app.config["PREPARED_STATEMENTS"] = prepared
+            lookup()
+            click.echo(f"{name:<20}{time_per_call(lookup, iterations):8.1f} us/lookup")
+        db.session.rollback()
+
+
+@cli.command("bench_autocomplete")
+@click.option("--users", default=200000, show_default=True)
+@click.option("--lookups", default=20000, show_default=True)
+def bench_autocomplete(users, lookups):
+    """Report autocomplete index memory and lookup latency on synthetic users."""
+    rng = random.Random(0)
+    alphabet = string.ascii_lowercase + string.digits
+    rows = [
+        (
+            user_id,
+            name := "".join(rng.choices(alphabet, k=rng.randint(6, 14))),
+            f"{name}.{user_id}@example.com",
+        )
+        for user_id in range(1, users + 1)
+    ]
+
+    index = AutocompleteIndex(app)
+    tracemalloc.start()
+    index.build(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = []
+    for _ in range(lookups):
+        _, name, _ = rows[rng.randrange(users)]
+        prefix = name[: rng.randint(1, 4)]
+        started = time.perf_counter()
+        index.search(prefix)
+        samples.append(time.perf_counter() - started)
+
+    click.echo(f"users:                {users}")
+    click.echo(f"memory per 1M users:  {size / users * 1e6 / 2**20:8.1f} MiB")
+    click.echo(f"p50 lookup:           {percentile(samples, 50) * 1e6:8.1f} us")
+    click.echo(f"p99 lookup:           {percentile(samples, 99) * 1e6:8.1f} us")
+
+
+@cli.command("replay")
+@click.argument("captures", nargs=-1, required=True, type=click.Path(dir_okay=False))
+@click.option("--base-url", default="http://localhost:5004", show_default=True)
+@click.option("--speed", default=1.0, show_default=True, help="E.g. 4 for 4x.")
+@click.option("--max-inflight", default=256, show_default=True)
+@click.option("--email", help="Log in as this user for authenticated requests.")
+@click.option("--password")
+def replay(captures, base_url, speed, max_inflight, email, password):
+    """Replay captured traffic against a running instance."""
+    records = load_capture(captures)
+    if not records:
+        raise click.UsageError(f"No captured requests in {', '.join(captures)}.")
+    click.echo(f"Replaying {len(records)} requests at {speed:g}x.")
+    results = replay_capture(
+        records,
+        base_url,
+        speed=speed,
+        max_inflight=max_inflight,
+        credentials=(email, password) if email else None,
+    )
+
+    click.echo(f"{'route':<28}{'reqs':>7}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for route, result in results.items():
+        click.echo(
+            f"{route:<28}{result['requests']:>7}{result['errors']:>8}"
+            f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+        )
+
+
 if __name__ == "__main__":
     cli()
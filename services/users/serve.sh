@@ -0,0 +1,19 @@
+#!/bin/sh
+# Entry point of Dockerfile.deploy: nginx, the async app for /users/events and
+# gunicorn in one container. The shell stays in the foreground so SIGTERM
+# from ECS reaches gunicorn, which drains (see gunicorn.conf.py).
+
+sed -i -e 's/$PORT/'"$PORT"'/g' /etc/nginx/conf.d/default.conf
+nginx
+
+uvicorn src.asgi:create_app --factory --host 127.0.0.1 --port 5001 &
+events=$!
+gunicorn -c gunicorn.conf.py manage:app &
+api=$!
+
+trap 'kill -TERM "$api" "$events"' TERM INT
+# A trapped signal ends the first wait early; the second waits for the drain.
+wait "$api"
+wait "$api"
+kill -TERM "$events" 2>/dev/null
+nginx -s quit
@@ -1,13 +1,18 @@
 import os
 
-from flask import Flask
+from flask import Flask, Response
 from flask_admin import Admin
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-db = SQLAlchemy()
+from src.concurrency import ConcurrencyLimiter
+from src.routing import ReplicaRouter, RoutingSQLAlchemy
+from src.sharding import ShardRouter
+
+db = RoutingSQLAlchemy()
+replicas = ReplicaRouter()
+shards = ShardRouter(db)
 cors = CORS()
 bcrypt = Bcrypt()
 admin = Admin(template_mode="bootstrap3")
@@ -24,17 +29,66 @@ def create_app(script_info=None):
 
     # Set up extensions
     db.init_app(app)
+    replicas.init_app(app)
+    shards.init_app(app)
     cors.init_app(app, resources={r"*": {"origins": "*"}})
     bcrypt.init_app(app)
 
     if os.getenv("FLASK_ENV") == "development":
         admin.init_app(app)
 
+    from src.api.users.login_events import login_events
+
+    login_events.init_app(app)
+
+    from src.api.users.autocomplete import autocomplete
+
+    autocomplete.init_app(app)
+
+    from src.api.users.emails import email_filter
+
+    email_filter.init_app(app)
+
+    from src.api.users.events import user_events
+
+    user_events.init_app(app)
+
+    from src.capture import capture
+
+    capture.init_app(app)
+
+    from src.deadlines import deadlines
+
+    deadlines.init_app(app)
+
     # register api
     from src.api import api
 
     api.init_app(app)
 
+    if app.config.get("VALIDATION_MODE") == "compiled":
+        from src.api.validation import compile_validators
+
+        compile_validators(api)
+
+    # Shed excess load per priority class instead of queueing it
+    app.wsgi_app = ConcurrencyLimiter(app.wsgi_app, app)
+
+    from src import memory
+    from src.lifecycle import lifecycle
+    from src.metrics import metrics
+
+    lifecycle.init_app(app)
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        memory.update_gauges()
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/ready")
+    def ready_endpoint():
+        return lifecycle.status()
+
     # Shell context for flask cli
     @app.shell_context_processor
     def ctx():
@@ -0,0 +1,168 @@
+import datetime
+import functools
+import hashlib
+
+from flask import current_app, request
+from flask_restx import abort
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from src import db
+from src.api.users.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+def client_id() -> str:
+    """Identify the caller by its credentials, or else its address."""
+    caller = request.headers.get("Authorization") or request.remote_addr or ""
+    return hashlib.sha256(caller.encode()).hexdigest()
+
+
+def _same_key(key: str, client: str, endpoint: str):
+    return and_(
+        IdempotencyKey.key == key,
+        IdempotencyKey.client == client,
+        IdempotencyKey.endpoint == endpoint,
+    )
+
+
+def reserve(key: str, client: str, endpoint: str, fingerprint: str):
+    """Claim ``key`` for the current request before it runs.
+
+    Returns ``None`` once claimed, or the row of the request already holding
+    the key. A key whose TTL passed, or whose request has been pending for
+    ``IDEMPOTENCY_PENDING_TIMEOUT`` seconds (its worker likely died), is
+    taken over.
+    """
+    config = current_app.config
+    while True:
+        now = datetime.datetime.utcnow()
+        db.session.add(
+            IdempotencyKey(
+                key=key,
+                client=client,
+                endpoint=endpoint,
+                fingerprint=fingerprint,
+                created_date=now,
+            )
+        )
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+        expired = now - datetime.timedelta(seconds=config["IDEMPOTENCY_KEY_TTL"])
+        abandoned = now - datetime.timedelta(
+            seconds=config["IDEMPOTENCY_PENDING_TIMEOUT"]
+        )
+        taken = db.session.execute(
+            update(IdempotencyKey)
+            .where(
+                _same_key(key, client, endpoint),
+                or_(
+                    IdempotencyKey.created_date <= expired,
+                    and_(
+                        IdempotencyKey.status_code.is_(None),
+                        IdempotencyKey.created_date <= abandoned,
+                    ),
+                ),
+            )
+            .values(
+                fingerprint=fingerprint,
+                status_code=None,
+                response=None,
+                created_date=now,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if taken:
+            return None
+
+        stored = IdempotencyKey.query.filter(_same_key(key, client, endpoint)).first()
+        if stored:
+            return stored
+        # Purged in between; try to claim it again.
+
+
+def store_response(key: str, client: str, endpoint: str, response, status_code):
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(_same_key(key, client, endpoint))
+        .values(response=response, status_code=status_code)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def release(key: str, client: str, endpoint: str):
+    """Drop a claim whose request failed, so a retry runs it again."""
+    db.session.rollback()
+    db.session.execute(
+        delete(IdempotencyKey)
+        .where(_same_key(key, client, endpoint), IdempotencyKey.status_code.is_(None))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def purge_expired_keys():
+    ttl = datetime.timedelta(seconds=current_app.config.get("IDEMPOTENCY_KEY_TTL"))
+    purged = IdempotencyKey.query.filter(
+        IdempotencyKey.created_date <= datetime.datetime.utcnow() - ttl
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return purged
+
+
+def idempotent(func):
+    """Replay the stored response when a request repeats its ``Idempotency-Key``.
+
+    Keys are scoped to the client (see :func:`client_id`) and endpoint. The
+    key is claimed before the request runs, so a concurrent retry gets a
+    ``409`` instead of running it a second time. Must be the outermost
+    decorator so it stores the marshalled response. Responses and aborts
+    with a status below 500 are stored; otherwise the claim is dropped.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return func(*args, **kwargs)
+
+        client = client_id()
+        endpoint = f"{request.method} {request.path}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        stored = reserve(key, client, endpoint, fingerprint)
+        if stored:
+            if stored.fingerprint != fingerprint:
+                abort(422, f"Sorry. That {HEADER} was used for a different request.")
+            if stored.status_code is None:
+                abort(409, f"Sorry. A request with that {HEADER} is still running.")
+            return stored.response, stored.status_code, {"Idempotent-Replayed": "true"}
+
+        try:
+            response = func(*args, **kwargs)
+        except HTTPException as error:
+            if error.code < 500:
+                body = getattr(error, "data", None) or {"message": error.description}
+                store_response(key, client, endpoint, body, error.code)
+            else:
+                release(key, client, endpoint)
+            raise
+        except BaseException:
+            release(key, client, endpoint)
+            raise
+        body, status_code = response[0], response[1]
+        if status_code < 500:
+            store_response(key, client, endpoint, body, status_code)
+        else:
+            release(key, client, endpoint)
+        return response
+
+    return wrapper
@@ -0,0 +1,229 @@
+import datetime
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from src import db
+from src.api.users.models import Job
+from src.metrics import metrics
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+registry = {}
+
+
+class JobDefinition:
+    def __init__(self, func, name: str, max_attempts: int, concurrency: int):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, run_at: datetime.datetime = None, **payload) -> Job:
+        return enqueue(self.name, payload, run_at=run_at)
+
+
+def job(name: str = None, max_attempts: int = 5, concurrency: int = None):
+    """Register a function as a background job.
+
+    The function is called with the job's JSON payload as keyword arguments.
+    At most ``concurrency`` jobs of this kind run at once across all workers
+    (checked when claiming, so workers claiming at the same instant can
+    overshoot it briefly); a failed job is retried with exponential backoff
+    until it has been attempted ``max_attempts`` times.
+    """
+
+    def decorator(func):
+        definition = JobDefinition(
+            func, name or func.__name__, max_attempts, concurrency
+        )
+        registry[definition.name] = definition
+        return definition
+
+    return decorator
+
+
+def enqueue(name: str, payload: dict = None, run_at: datetime.datetime = None) -> Job:
+    new_job = Job(
+        name=name,
+        payload=payload or {},
+        max_attempts=registry[name].max_attempts,
+        run_at=run_at or datetime.datetime.utcnow(),
+    )
+    db.session.add(new_job)
+    db.session.commit()
+    return new_job
+
+
+def claim_job(worker_id: str):
+    """Lock the next due job for ``worker_id`` and mark it running.
+
+    ``FOR UPDATE SKIP LOCKED`` lets any number of workers poll the table
+    without blocking on, or double-claiming, each other's rows. A running
+    job's worker refreshes ``locked_at`` every ``JOB_HEARTBEAT_INTERVAL``
+    seconds, so only jobs whose worker died mid-run go ``JOB_LOCK_TIMEOUT``
+    seconds without it and are picked up again.
+    """
+    now = datetime.datetime.utcnow()
+    stale = now - datetime.timedelta(seconds=current_app.config["JOB_LOCK_TIMEOUT"])
+    db.session.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.locked_at < stale)
+        .values(status=QUEUED, locked_by=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    running = dict(
+        db.session.execute(
+            select(Job.name, func.count())
+            .where(Job.status == RUNNING)
+            .group_by(Job.name)
+        ).all()
+    )
+    saturated = [
+        name
+        for name, definition in registry.items()
+        if definition.concurrency is not None
+        and running.get(name, 0) >= definition.concurrency
+    ]
+
+    claimed = db.session.execute(
+        select(Job)
+        .where(
+            Job.status == QUEUED,
+            Job.run_at <= now,
+            Job.name.in_(registry),
+            Job.name.not_in(saturated),
+        )
+        .order_by(Job.run_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar()
+    if claimed is None:
+        db.session.commit()
+        return None
+
+    claimed.status = RUNNING
+    claimed.attempts += 1
+    claimed.locked_at = now
+    claimed.locked_by = worker_id
+    db.session.commit()
+    return claimed
+
+
+def run_job(claimed: Job) -> bool:
+    """Run a claimed job and record the outcome; return whether it succeeded."""
+    definition = registry[claimed.name]
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat,
+        args=(
+            db.engine,
+            claimed.id,
+            claimed.locked_by,
+            current_app.config["JOB_HEARTBEAT_INTERVAL"],
+            stop_heartbeat,
+        ),
+        name=f"job-{claimed.id}-heartbeat",
+        daemon=True,
+    )
+    heartbeat.start()
+    started = time.perf_counter()
+    try:
+        definition(**claimed.payload)
+    except Exception:
+        db.session.rollback()
+        _record_failure(claimed, traceback.format_exc())
+        metrics.inc("jobs_failed_total", job=claimed.name)
+        return False
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+        metrics.observe("job_seconds", time.perf_counter() - started, job=claimed.name)
+
+    claimed.status = DONE
+    claimed.finished_date = datetime.datetime.utcnow()
+    claimed.last_error = None
+    db.session.commit()
+    metrics.inc("jobs_done_total", job=claimed.name)
+    return True
+
+
+def _heartbeat(engine, job_id: int, worker_id: str, interval: float, stop):
+    """Keep a running job's lease by refreshing ``locked_at`` until ``stop``."""
+    while not stop.wait(interval):
+        with engine.begin() as connection:
+            connection.execute(
+                update(Job)
+                .where(
+                    Job.id == job_id,
+                    Job.status == RUNNING,
+                    Job.locked_by == worker_id,
+                )
+                .values(locked_at=datetime.datetime.utcnow())
+            )
+
+
+def _record_failure(claimed: Job, error: str):
+    config = current_app.config
+    claimed.last_error = error
+    claimed.locked_by = None
+    if claimed.attempts >= claimed.max_attempts:
+        claimed.status = FAILED
+        claimed.finished_date = datetime.datetime.utcnow()
+    else:
+        # Exponential backoff with jitter so retries of a batch spread out.
+        delay = min(
+            config["JOB_BACKOFF_MAX"],
+            config["JOB_BACKOFF_BASE"] * 2 ** (claimed.attempts - 1),
+        )
+        claimed.status = QUEUED
+        claimed.run_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=delay * random.uniform(0.5, 1.0)
+        )
+    db.session.commit()
+
+
+def work(app, concurrency: int = 1, burst: bool = False, stop: threading.Event = None):
+    """Run jobs on ``concurrency`` threads until ``stop`` is set.
+
+    With ``burst``, each thread exits once no job is due. Returns the number
+    of jobs run.
+    """
+    stop = stop or threading.Event()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    processed = []
+
+    def loop(thread_id: int):
+        count = 0
+        with app.app_context():
+            while not stop.is_set():
+                claimed = claim_job(f"{worker}:{thread_id}")
+                if claimed is None:
+                    if burst:
+                        break
+                    stop.wait(app.config["JOB_POLL_INTERVAL"])
+                    continue
+                run_job(claimed)
+                count += 1
+            db.session.remove()
+        processed.append(count)
+
+    threads = [
+        threading.Thread(target=loop, args=(thread_id,), name=f"jobs-{thread_id}")
+        for thread_id in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(processed)
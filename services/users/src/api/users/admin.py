@@ -1,7 +1,18 @@
-from flask import current_app
+import datetime
+
+from flask import current_app, flash, session
+from flask_admin.actions import action
 from flask_admin.contrib.sqla import ModelView
+from sqlalchemy import func, or_, text, tuple_
+from sqlalchemy.exc import IntegrityError
+from wtforms.validators import ValidationError
+
+from src import bcrypt, db
+from src.api.users.crud import set_users_active
+from src.api.users.passwords import BREACHED_MESSAGE, breached_passwords
+from src.api.users.stats import add_counts
 
-from src import bcrypt
+CURSOR_SESSION_KEY = "users_admin_cursor"
 
 
 class UsersAdminView(ModelView):
@@ -24,9 +35,157 @@ class UsersAdminView(ModelView):
         "active",
         "created_date",
     )
-    column_default_sort = ("created_date", True)
+    column_default_sort = [("created_date", True), ("id", True)]
+
+    # Below this many rows (per Postgres statistics) the exact count is cheap.
+    approximate_count_threshold = 100000
+
+    def get_list(
+        self,
+        page,
+        sort_column,
+        sort_desc,
+        search,
+        filters,
+        execute=True,
+        page_size=None,
+    ):
+        """List users without an exact ``COUNT(*)`` or deep ``OFFSET`` scans.
+
+        Unfiltered lists report the planner's row estimate, and stepping to the
+        next page of the default ``created_date`` sort continues after the last
+        row of the previous page instead of skipping rows with ``OFFSET``.
+        """
+        joins, count_joins = {}, {}
+        query = self.get_query()
+        count_query = self.get_count_query()
+        narrowed = bool(search or (filters and self._filters))
+
+        if self._search_supported and search:
+            query, count_query, joins, count_joins = self._apply_search(
+                query, count_query, joins, count_joins, search
+            )
+        if filters and self._filters:
+            query, count_query, joins, count_joins = self._apply_filters(
+                query, count_query, joins, count_joins, filters
+            )
+
+        count = count_query.scalar() if narrowed else self.estimate_count(count_query)
+
+        page_size = self.page_size if page_size is None else page_size
+        list_key = repr((search, filters))
+        cursor = session.get(CURSOR_SESSION_KEY)
+        model = self.model
+
+        if (
+            sort_column is None
+            and page
+            and page_size
+            and cursor
+            and cursor["key"] == list_key
+            and cursor["page"] == page
+        ):
+            created_date = datetime.datetime.fromisoformat(cursor["created_date"])
+            query = (
+                query.filter(
+                    tuple_(model.created_date, model.id) < (created_date, cursor["id"])
+                )
+                .order_by(model.created_date.desc(), model.id.desc())
+                .limit(page_size)
+            )
+        else:
+            query, joins = self._apply_sorting(query, joins, sort_column, sort_desc)
+            query = self._apply_pagination(query, page, page_size)
+
+        if execute:
+            query = query.all()
+            if sort_column is None and page_size and len(query) == page_size:
+                session[CURSOR_SESSION_KEY] = {
+                    "key": list_key,
+                    "page": page + 1,
+                    "created_date": query[-1].created_date.isoformat(),
+                    "id": query[-1].id,
+                }
+
+        return count, query
+
+    def estimate_count(self, count_query):
+        if self.session.get_bind().dialect.name != "postgresql":
+            return count_query.scalar()
+
+        estimate = self.session.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+            {"table": self.model.__tablename__},
+        ).scalar()
+        if estimate is None or estimate < self.approximate_count_threshold:
+            return count_query.scalar()
+        return int(estimate)
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        """Match search terms as prefixes of ``lower(column)``.
+
+        Unlike the default ``ILIKE '%term%'``, a prefix match can use the
+        ``lower(...) varchar_pattern_ops`` indexes on ``users``.
+        """
+        for term in search.lower().split():
+            pattern = (
+                term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            )
+            clause = or_(
+                *(
+                    func.lower(field).like(pattern, escape="\\")
+                    for field, _ in self._search_fields
+                )
+            )
+            query = query.filter(clause)
+            count_query = count_query.filter(clause)
+
+        return query, count_query, joins, count_joins
+
+    @action("activate", "Activate", "Activate the selected users?")
+    def action_activate(self, ids):
+        count = self._set_active(ids, True)
+        flash(f"{count} users were activated.")
+
+    @action("deactivate", "Deactivate", "Deactivate the selected users?")
+    def action_deactivate(self, ids):
+        count = self._set_active(ids, False)
+        flash(f"{count} users were deactivated.")
+
+    def _set_active(self, ids, active: bool):
+        """Flip ``active`` for all selected users in one ``UPDATE``."""
+        try:
+            return set_users_active([int(id_) for id_ in ids], active)
+        except IntegrityError:
+            # An email was registered again after the users were selected.
+            db.session.rollback()
+            flash("Sorry. A selected email was just taken, please retry.", "error")
+            return 0
 
     def on_model_change(self, form, model, is_created):
+        if breached_passwords.is_breached(model.password):
+            raise ValidationError(BREACHED_MESSAGE)
         model.password = bcrypt.generate_password_hash(
             model.password, current_app.config.get("BCRYPT_LOG_ROUNDS")
         ).decode()
+        self._count(model, is_created)
+
+    def _count(self, model, is_created: bool):
+        """Move ``model`` between ``user_stats`` days and counts as its
+        ``created_date`` and ``active`` are set here, like ``crud.py`` does."""
+        if not is_created:
+            state = db.inspect(model).attrs
+            created, active = state.created_date.history, state.active.history
+            if not (created.has_changes() or active.has_changes()):
+                return
+            day = created.deleted[0] if created.deleted else model.created_date
+            was_active = active.deleted[0] if active.deleted else model.active
+            add_counts(day, signups=-1, **{_state(was_active): -1})
+
+        # Fills in the database's ``created_date`` of a new user.
+        self.session.flush()
+        add_counts(model.created_date, signups=1, **{_state(model.active): 1})
+
+
+def _state(active: bool) -> str:
+    return "active" if active else "inactive"
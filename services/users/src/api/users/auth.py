@@ -1,10 +1,23 @@
+import time
+
 import jwt
-from flask import request
+from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
+from sqlalchemy.exc import IntegrityError
 
 from src import bcrypt
-from src.api.users.crud import create_user, get_user_by_email, get_user_by_id
+from src.api.idempotency import idempotent
+from src.api.users.emails import email_filter
+from src.api.users.login_events import login_events
 from src.api.users.models import User
+from src.api.users.passwords import BREACHED_MESSAGE, breached_passwords
+
+from src.api.users.crud import (  # isort:skip
+    create_user,
+    get_user_by_email,
+    get_user_by_id,
+    get_users_by_ids,
+)
 
 auth_namespace = Namespace("auth")
 
@@ -36,27 +49,48 @@ tokens = auth_namespace.clone(
     "Access and refresh_tokens", refresh, {"access_token": fields.String(required=True)}
 )
 
+introspect = auth_namespace.model(
+    "Introspect", {"tokens": fields.List(fields.String, required=True)}
+)
+
+introspection = auth_namespace.model(
+    "Introspection",
+    {
+        "active": fields.Boolean(required=True),
+        "sub": fields.Integer,
+        "username": fields.String,
+        "exp": fields.Integer,
+        "iat": fields.Integer,
+    },
+)
+
 parser = auth_namespace.parser()
 parser.add_argument("Authorization", location="headers")
 
 
 class Register(Resource):
+    @idempotent
     @auth_namespace.marshal_with(user)
     @auth_namespace.expect(full_user, validate=True)
     @auth_namespace.response(201, "Success")
     @auth_namespace.response(400, "Sorry. That email already exists.")
+    @auth_namespace.response(400, BREACHED_MESSAGE)
     def post(self):
         post_data = request.get_json()
         username = post_data.get("username")
         email = post_data.get("email")
         password = post_data.get("password")
 
-        user = get_user_by_email(email)
+        if breached_passwords.is_breached(password):
+            auth_namespace.abort(400, BREACHED_MESSAGE)
 
-        if user:
+        if email_filter.exists(email, get_user_by_email):
             auth_namespace.abort(400, "Sorry. That email already exists.")
 
-        user = create_user(username, email, password)
+        try:
+            user = create_user(username, email, password)
+        except IntegrityError:
+            auth_namespace.abort(400, "Sorry. That email already exists.")
 
         return user, 201
 
@@ -77,6 +111,7 @@ class Login(Resource):
         if not user or not bcrypt.check_password_hash(user.password, password):
             auth_namespace.abort(404, "User does not exist")
 
+        login_events.record(user.id, "login")
         access_token = user.encode_token(user.id, "access")
         refresh_token = user.encode_token(user.id, "refresh")
         response_object = {"access_token": access_token, "refresh_token": refresh_token}
@@ -101,6 +136,7 @@ class Refresh(Resource):
             if not user:
                 auth_namespace.abort(401, "Invalid token")
 
+            login_events.record(user.id, "refresh")
             access_token = user.encode_token(user.id, "access")
             refresh_token = user.encode_token(user.id, "refresh")
 
@@ -139,7 +175,93 @@ class Status(Resource):
             auth_namespace.abort(403, "Token required")
 
 
+class Verify(Resource):
+    @auth_namespace.response(204, "Token is valid")
+    @auth_namespace.response(401, "Invalid token")
+    @auth_namespace.response(403, "Token required")
+    @auth_namespace.expect(parser)
+    def get(self):
+        """Check a bearer token from its signature alone, for nginx auth_request.
+
+        The user is not looked up, so a deactivated user's access token stays
+        valid until it expires.
+        """
+        auth_header = request.headers.get("Authorization") or ""
+        access_token = auth_header.partition(" ")[2]
+
+        if not access_token:
+            auth_namespace.abort(403, "Token required")
+
+        try:
+            payload = User.decode_token_payload(access_token)
+        except jwt.ExpiredSignatureError:
+            auth_namespace.abort(401, "Signature expired. Please log in again.")
+        except jwt.InvalidTokenError:
+            auth_namespace.abort(401, "Invalid token. Please log in again.")
+
+        # Never let a cache answer for the token after it expires.
+        max_age = max(
+            0,
+            min(
+                current_app.config.get("VERIFY_CACHE_SECONDS"),
+                int(payload["exp"] - time.time()),
+            ),
+        )
+        return (
+            "",
+            204,
+            {
+                "X-User-Id": str(payload["sub"]),
+                "Cache-Control": f"private, max-age={max_age}",
+                "X-Accel-Expires": str(max_age),
+            },
+        )
+
+
+class Introspect(Resource):
+    @auth_namespace.marshal_with(introspection, as_list=True, skip_none=True)
+    @auth_namespace.expect(introspect, validate=True)
+    @auth_namespace.response(200, "Success")
+    @auth_namespace.response(400, "Sorry. Too many tokens.")
+    def post(self):
+        """Introspect a batch of access tokens (RFC 7662) with one user query."""
+        tokens = request.get_json().get("tokens")
+        limit = current_app.config.get("INTROSPECT_MAX_TOKENS")
+
+        if len(tokens) > limit:
+            auth_namespace.abort(400, f"Sorry. At most {limit} tokens per request.")
+
+        payloads = []
+        for token in tokens:
+            try:
+                payloads.append(User.decode_token_payload(token))
+            except jwt.InvalidTokenError:
+                payloads.append(None)
+
+        user_ids = list({payload["sub"] for payload in payloads if payload})
+        users = {user.id: user for user in get_users_by_ids(user_ids) if user}
+
+        results = []
+        for payload in payloads:
+            user = users.get(payload["sub"]) if payload else None
+            if user is None:
+                results.append({"active": False})
+            else:
+                results.append(
+                    {
+                        "active": True,
+                        "sub": user.id,
+                        "username": user.username,
+                        "exp": payload["exp"],
+                        "iat": payload["iat"],
+                    }
+                )
+        return results, 200
+
+
 auth_namespace.add_resource(Register, "/register")
 auth_namespace.add_resource(Login, "/login")
 auth_namespace.add_resource(Refresh, "/refresh")
 auth_namespace.add_resource(Status, "/status")
+auth_namespace.add_resource(Verify, "/verify")
+auth_namespace.add_resource(Introspect, "/introspect")
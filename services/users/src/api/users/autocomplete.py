@@ -0,0 +1,176 @@
+import datetime
+import threading
+import time
+from bisect import bisect_left, insort
+
+from sqlalchemy import select
+
+from src import db, shards
+from src.api.users.models import User
+
+# Separates the lowercased term from the user id in an index key.
+SEPARATOR = "\x00"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class AutocompleteIndex:
+    """In-process prefix index over usernames and emails of active users.
+
+    Every user contributes two keys, ``"<username>\\0<id>"`` and
+    ``"<email>\\0<id>"`` (lowercased), kept in one sorted list, so a prefix
+    lookup is a ``bisect`` followed by a short scan. The index is loaded
+    with a streaming query when the worker warms up (or on first use),
+    updated in place by the crud helpers, and every
+    ``AUTOCOMPLETE_SYNC_INTERVAL`` seconds picks up users changed by other
+    workers through the ``updated_date`` index. One thread loads or syncs
+    at a time; the others keep using the index as it is. With sharding
+    enabled the users are read from every shard.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._keys = []
+        self._users = {}
+        self._watermark = None
+        self._synced_at = None
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("AUTOCOMPLETE_SYNC_INTERVAL", 30)
+        app.config.setdefault("AUTOCOMPLETE_SYNC_OVERLAP", 5)
+        app.config.setdefault("AUTOCOMPLETE_MAX_RESULTS", 10)
+        app.extensions["autocomplete"] = self
+        self.app = app
+
+    @property
+    def loaded(self) -> bool:
+        return self._synced_at is not None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def search(self, prefix: str, limit: int = None) -> list:
+        """Return up to ``limit`` active users whose username or email
+        starts with ``prefix``, as ``(id, username, email)`` tuples."""
+        self._refresh()
+        limit = min(
+            limit or self.app.config["AUTOCOMPLETE_MAX_RESULTS"],
+            self.app.config["AUTOCOMPLETE_MAX_RESULTS"],
+        )
+        prefix = prefix.lower()
+        found = {}
+        with self._lock:
+            keys = self._keys
+            for position in range(bisect_left(keys, prefix), len(keys)):
+                key = keys[position]
+                if not key.startswith(prefix) or len(found) >= limit:
+                    break
+                user_id = int(key.rsplit(SEPARATOR, 1)[1])
+                found.setdefault(user_id, self._users[user_id])
+        return [(user_id, *user) for user_id, user in found.items()]
+
+    def load(self):
+        query = select(User.id, User.username, User.email, User.updated_date).where(
+            User.active
+        )
+        watermark, rows = None, []
+        for engine in _engines():
+            with engine.connect() as connection:
+                result = connection.execution_options(
+                    stream_results=True, yield_per=10000
+                ).execute(query)
+                for user_id, username, email, updated_date in result:
+                    rows.append((user_id, username, email))
+                    watermark = max(filter(None, (watermark, updated_date)))
+        self.build(rows)
+        self._watermark = watermark
+
+    def build(self, rows):
+        """Replace the index with ``(id, username, email)`` rows."""
+        users, keys = {}, []
+        for user_id, username, email in rows:
+            users[user_id] = (username, email)
+            keys.extend(_keys_for(user_id, username, email))
+        keys.sort()
+        with self._lock:
+            self._users, self._keys = users, keys
+            self._synced_at = time.monotonic()
+
+    def sync(self):
+        """Apply users created, changed or deactivated since the last sync."""
+        # Rows can commit with a timestamp slightly older than the newest one
+        # seen, so look back a little; applying a row twice is harmless. New
+        # rows start with ``updated_date`` set, so it alone finds them too.
+        since = (self._watermark or EPOCH) - datetime.timedelta(
+            seconds=self.app.config["AUTOCOMPLETE_SYNC_OVERLAP"]
+        )
+        query = select(
+            User.id, User.username, User.email, User.active, User.updated_date
+        ).where(User.updated_date > since)
+        rows = []
+        for engine in _engines():
+            with engine.connect() as connection:
+                rows.extend(connection.execute(query))
+
+        with self._lock:
+            for user_id, username, email, active, updated_date in rows:
+                if active:
+                    self._put(user_id, username, email)
+                else:
+                    self._remove(user_id)
+                self._watermark = max(filter(None, (self._watermark, updated_date)))
+            self._synced_at = time.monotonic()
+
+    def add(self, user: User):
+        if self.loaded:
+            with self._lock:
+                self._put(user.id, user.username, user.email)
+
+    def remove(self, user_id: int):
+        if self.loaded:
+            with self._lock:
+                self._remove(user_id)
+
+    def _refresh(self):
+        if not self.loaded:
+            with self._refresh_lock:
+                if not self.loaded:
+                    self.load()
+        elif time.monotonic() - self._synced_at >= self.app.config[
+            "AUTOCOMPLETE_SYNC_INTERVAL"
+        ] and self._refresh_lock.acquire(blocking=False):
+            try:
+                self.sync()
+            finally:
+                self._refresh_lock.release()
+
+    def _put(self, user_id: int, username: str, email: str):
+        self._remove(user_id)
+        self._users[user_id] = (username, email)
+        for key in _keys_for(user_id, username, email):
+            insort(self._keys, key)
+
+    def _remove(self, user_id: int):
+        user = self._users.pop(user_id, None)
+        if user is None:
+            return
+        for key in _keys_for(user_id, *user):
+            position = bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                del self._keys[position]
+
+
+def _engines() -> list:
+    if shards.enabled:
+        return list(shards.engines().values())
+    return [db.get_engine()]
+
+
+def _keys_for(user_id: int, username: str, email: str) -> set:
+    return {f"{term.lower()}{SEPARATOR}{user_id}" for term in (username, email)}
+
+
+autocomplete = AutocompleteIndex()
@@ -1,34 +1,517 @@
-from src import db
-from src.api.users.models import User
+import datetime
+import heapq
+from collections import defaultdict
+from itertools import islice
 
+from flask import current_app
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import aliased, load_only, object_session
 
-def get_all_users():
-    return User.query.all()
+from src import db, replicas, shards
+from src.api.users.autocomplete import autocomplete
+from src.api.users.emails import email_filter
+from src.api.users.stats import COUNTS, add_counts, as_date
 
+from src.api.users.models import (  # isort:skip
+    User,
+    UserArchive,
+    UserDirectory,
+    UserEvent,
+    UserStats,
+)
 
-def get_user_by_id(user_id: int):
-    return User.query.filter_by(id=user_id).first()
+from sqlalchemy import (  # isort:skip
+    and_,
+    bindparam,
+    delete,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    text,
+    update,
+)
+
+ARCHIVED_COLUMNS = (
+    "id",
+    "username",
+    "email",
+    "password",
+    "active",
+    "created_date",
+    "updated_date",
+    "last_login_at",
+)
+
+# The hottest lookups are built once; SQLAlchemy then reuses their compiled
+# form on every call, and on Postgres they also run as prepared statements.
+HOT_LOOKUPS = {
+    "user_by_id": select(User).where(User.active, User.id == bindparam("value")),
+    "user_by_email": select(User).where(User.active, User.email == bindparam("value")),
+}
+
+
+def _read(query):
+    """Run ``query`` against a replica when one may serve it.
+
+    Falls back to the primary if the replica fails.
+    """
+    bind_key = replicas.read_bind()
+    if bind_key is None:
+        return query()
+
+    try:
+        with replicas.use(db.session, bind_key):
+            return query()
+    except OperationalError:
+        db.session.rollback()
+        replicas.mark_unhealthy(bind_key)
+        return query()
+
+
+def _shard_query(shard_id: str):
+    return shards.session.query(User).set_shard(shard_id).filter(User.active)
+
+
+def _directory_ids(emails) -> list:
+    """Look up the ids registered for ``emails`` in ``user_directory``."""
+    return (
+        db.session.execute(
+            select(UserDirectory.id).where(
+                UserDirectory.active, UserDirectory.email.in_(set(emails))
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+
+def _lookup(name: str, value):
+    """Return the first active user matching the hot lookup ``name``.
+
+    On Postgres, unless ``PREPARED_STATEMENTS`` is off, the lookup is
+    ``PREPARE``d once per pooled connection and then run with ``EXECUTE`` so
+    the server skips parsing and planning too.
+    """
+    connection = db.session.connection()
+    if not _prepares(connection):
+        return db.session.execute(HOT_LOOKUPS[name], {"value": value}).scalar()
+
+    _prepare(connection, name)
+    statement = select(User).from_statement(
+        text(f"EXECUTE {name}(:value)").columns(*User.__table__.columns)
+    )
+    return db.session.execute(statement, {"value": value}).scalar()
+
+
+def _prepares(connection) -> bool:
+    return (
+        connection.dialect.name == "postgresql"
+        and current_app.config["PREPARED_STATEMENTS"]
+    )
+
+
+def _prepare(connection, name: str):
+    # ``info`` lives as long as the DBAPI connection, like the prepared statement.
+    prepared = connection.connection.info.setdefault("prepared_statements", set())
+    if name not in prepared:
+        sql = str(HOT_LOOKUPS[name].compile(connection))
+        connection.exec_driver_sql(
+            f"PREPARE {name} AS {sql.replace('%(value)s', '$1')}"
+        )
+        prepared.add(name)
+
+
+def prepare_lookups(connection):
+    """Prepare every hot lookup on ``connection``, where ``_lookup`` would."""
+    if _prepares(connection):
+        for name in HOT_LOOKUPS:
+            _prepare(connection, name)
+
+
+def _only(query, columns):
+    """Load only ``columns`` (and the primary key) when given."""
+    if columns is None:
+        return query
+    return query.options(load_only(*(getattr(User, name) for name in columns)))
+
+
+def _shard_pages(shard_id: str, columns: list, after_id: int):
+    """Yield the active users of ``shard_id`` by id, one keyset page at a time."""
+    page_size = current_app.config["SHARD_PAGE_SIZE"]
+    while True:
+        query = _only(_shard_query(shard_id), columns)
+        if after_id is not None:
+            query = query.filter(User.id > after_id)
+        page = query.order_by(User.id).limit(page_size).all()
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1].id
+
+
+def get_all_users(columns: list = None, after_id: int = None, limit: int = None):
+    """Return active users by id, after ``after_id`` and up to ``limit``."""
+    if shards.enabled:
+        # Each shard is read a page at a time, so at most ``limit`` users plus
+        # one page per shard are loaded.
+        merged = heapq.merge(
+            *(
+                _shard_pages(shard_id, columns, after_id)
+                for shard_id in shards.shard_ids()
+            ),
+            key=lambda user: user.id,
+        )
+        return list(islice(merged, limit))
+
+    def query():
+        users = _only(User.query.filter(User.active), columns)
+        if after_id is not None:
+            users = users.filter(User.id > after_id)
+        if after_id is not None or limit is not None:
+            users = users.order_by(User.id)
+        return users.limit(limit).all()
+
+    return _read(query)
+
+
+def get_user_by_id(user_id: int, columns: list = None):
+    if shards.enabled:
+        return (
+            _only(_shard_query(shards.shard_for(user_id)), columns)
+            .filter(User.id == user_id)
+            .first()
+        )
+    if columns is not None:
+        return _read(
+            lambda: _only(
+                User.query.filter(User.active, User.id == user_id), columns
+            ).first()
+        )
+    return _read(lambda: _lookup("user_by_id", user_id))
 
 
 def get_user_by_email(email: str):
-    return User.query.filter_by(email=email).first()
+    if shards.enabled:
+        return get_users_by_emails([email])[0]
+    return _read(lambda: _lookup("user_by_email", email))
+
+
+def get_users_by_ids(user_ids: list, columns: list = None):
+    """Return the users for ``user_ids`` in order, with ``None`` for misses."""
+    if shards.enabled:
+        by_shard = defaultdict(set)
+        for user_id in user_ids:
+            by_shard[shards.shard_for(user_id)].add(user_id)
+        users = [
+            user
+            for shard_id, ids in by_shard.items()
+            for user in _only(_shard_query(shard_id), columns)
+            .filter(User.id.in_(ids))
+            .all()
+        ]
+    else:
+        users = _read(
+            lambda: _only(
+                User.query.filter(User.active, User.id.in_(set(user_ids))), columns
+            ).all()
+        )
+    by_id = {user.id: user for user in users}
+    return [by_id.get(user_id) for user_id in user_ids]
+
+
+def get_users_by_emails(emails: list, columns: list = None):
+    """Return the users for ``emails`` in order, with ``None`` for misses."""
+    if columns is not None and "email" not in columns:
+        # Needed to put the users back in order.
+        columns = [*columns, "email"]
+    if shards.enabled:
+        users = filter(None, get_users_by_ids(_directory_ids(emails), columns))
+    else:
+        users = _read(
+            lambda: _only(
+                User.query.filter(User.active, User.email.in_(set(emails))), columns
+            ).all()
+        )
+    by_email = {user.email: user for user in users}
+    return [by_email.get(email) for email in emails]
 
 
-def create_user(username: str, email: str, password: str):
-    user = User(username=username, email=email, password=password)
-    db.session.add(user)
+def get_user_stats(since: datetime.date, until: datetime.date):
+    """Return the ``UserStats`` days from ``since`` to ``until`` and the totals."""
+
+    def query():
+        days = (
+            UserStats.query.filter(UserStats.day.between(since, until))
+            .order_by(UserStats.day)
+            .all()
+        )
+        totals = db.session.execute(
+            select(
+                *(
+                    func.coalesce(func.sum(getattr(UserStats, name)), 0)
+                    for name in COUNTS
+                )
+            )
+        ).one()
+        return days, dict(zip(COUNTS, totals))
+
+    return _read(query)
+
+
+def create_user(
+    username: str, email: str, password: str = None, password_hash: str = None
+):
+    if shards.enabled:
+        return _create_sharded_user(username, email, password, password_hash)
+
+    user = User(username, email, password, password_hash)
+    try:
+        db.session.add(user)
+        db.session.flush()
+        _record("created", user.id, username=username, email=email)
+        add_counts(user.created_date, signups=1, active=1)
+        db.session.commit()
+    except IntegrityError:
+        # Another request registered the email first.
+        db.session.rollback()
+        raise
+    replicas.stick_to_primary()
+    autocomplete.add(user)
+    email_filter.add(email)
+    return user
+
+
+def _create_sharded_user(username: str, email: str, password: str, password_hash: str):
+    # The directory on the primary hands out the id, which picks the shard.
+    # ``ix_user_directory_email_active`` rejects an email taken on any shard.
+    entry = UserDirectory(email=email)
+    try:
+        db.session.add(entry)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise
+
+    user = User(username, email, password, password_hash)
+    user.id = entry.id
+    try:
+        shards.session.add(user)
+        shards.session.commit()
+    except Exception:
+        shards.session.rollback()
+        db.session.delete(entry)
+        db.session.commit()
+        raise
+    _record("created", user.id, username=username, email=email)
+    add_counts(user.created_date, signups=1, active=1)
     db.session.commit()
+    autocomplete.add(user)
     return user
 
 
 def update_user(user: User, username: str, email: str):
-    user.username = username
-    user.email = email
-    db.session.commit()
+    changes = {
+        name: value
+        for name, value in (("username", username), ("email", email))
+        if getattr(user, name) != value
+    }
+    try:
+        if shards.enabled and "email" in changes:
+            # Checked against the directory's unique index now, but only
+            # committed after the shard, so a failed shard write leaves the
+            # directory untouched.
+            db.session.execute(
+                update(UserDirectory)
+                .where(UserDirectory.id == user.id)
+                .values(email=email)
+            )
+        user.username = username
+        user.email = email
+        if changes:
+            _record("updated", user.id, **changes)
+        _commit(user)
+    except Exception:
+        object_session(user).rollback()
+        db.session.rollback()
+        raise
+    autocomplete.add(user)
+    email_filter.add(email)
     return user
 
 
-def delete_user(user: User):
-    db.session.delete(user)
-    db.session.commit()
+def deactivate_user(user: User):
+    user.active = False
+    if shards.enabled:
+        # Frees the email for a new signup.
+        db.session.execute(
+            update(UserDirectory)
+            .where(UserDirectory.id == user.id)
+            .values(active=False)
+        )
+    _record("deleted", user.id)
+    add_counts(user.created_date, active=-1, inactive=1)
+    _commit(user)
+    autocomplete.remove(user.id)
     return user
+
+
+def _commit(user: User):
+    # Sharded users belong to the sharded session rather than ``db.session``,
+    # which still holds the user's change events.
+    session = object_session(user)
+    session.commit()
+    if session is not db.session():
+        db.session.commit()
+    replicas.stick_to_primary()
+
+
+def _record(kind: str, user_id: int, **data):
+    """Add a change event to ``db.session``, to be committed with the change."""
+    db.session.add(UserEvent(user_id=user_id, kind=kind, data=data))
+
+
+def set_users_active(user_ids: list, active: bool) -> int:
+    """Activate or deactivate ``user_ids`` with one set-based ``UPDATE``.
+
+    Change events, stats and the in-process indexes follow in the same
+    transaction, as they do for :func:`deactivate_user`. Only the primary
+    ``users`` table is covered. Users whose email an active user already
+    holds, or an earlier id in ``user_ids`` takes back, stay inactive.
+    Returns the number of users changed.
+    """
+    query = select(User.id, User.username, User.email, User.created_date).where(
+        User.id.in_(user_ids), User.active != active
+    )
+    if active:
+        holder = aliased(User)
+        query = query.where(~exists().where(holder.active, holder.email == User.email))
+    changed = db.session.execute(query.order_by(User.id).with_for_update()).all()
+    if active:
+        # Of the selected users sharing an email, the lowest id gets it back.
+        taken, unique = set(), []
+        for row in changed:
+            if row.email not in taken:
+                taken.add(row.email)
+                unique.append(row)
+        changed = unique
+    if not changed:
+        db.session.rollback()
+        return 0
+
+    ids = [row.id for row in changed]
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(ids))
+        .values(active=active)
+        .execution_options(synchronize_session=False)
+    )
+    sign = 1 if active else -1
+    per_day = defaultdict(int)
+    for row in changed:
+        per_day[as_date(row.created_date)] += 1
+    for day in sorted(per_day):
+        add_counts(day, active=sign * per_day[day], inactive=-sign * per_day[day])
+    # A reactivated user reappears to event subscribers as if created.
+    db.session.execute(
+        insert(UserEvent),
+        [
+            {
+                "user_id": row.id,
+                "kind": "created" if active else "deleted",
+                "data": {"username": row.username, "email": row.email}
+                if active
+                else {},
+            }
+            for row in changed
+        ],
+    )
+    db.session.commit()
+    replicas.stick_to_primary()
+    for row in changed:
+        if active:
+            autocomplete.add(row)
+            email_filter.add(row.email)
+        else:
+            autocomplete.remove(row.id)
+    return len(changed)
+
+
+def delete_user(user: User):
+    # Users are soft-deleted; `archive_users` moves them out of the hot table.
+    return deactivate_user(user)
+
+
+def archive_users(
+    older_than: datetime.timedelta,
+    batch_size: int = 1000,
+    dormant_for: datetime.timedelta = None,
+):
+    """Move users deactivated more than ``older_than`` ago to ``users_archive``.
+
+    Only the primary ``users`` table is archived; sharded users stay put.
+
+    With ``dormant_for``, active users that have not logged in (or, if they
+    never did, signed up) for that long are archived too.
+
+    Each batch runs in its own short transaction so row locks on ``users`` are
+    held for one batch at a time, and rows locked by a concurrent request are
+    skipped and picked up by a later run.
+    """
+    now = datetime.datetime.utcnow()
+    archivable = and_(~User.active, User.updated_date < now - older_than)
+    if dormant_for is not None:
+        last_seen = func.coalesce(User.last_login_at, User.created_date)
+        archivable = or_(archivable, and_(User.active, last_seen < now - dormant_for))
+    columns = [getattr(User, name) for name in ARCHIVED_COLUMNS]
+    archived = 0
+
+    while True:
+        ids = (
+            db.session.execute(
+                select(User.id)
+                .where(archivable)
+                .order_by(User.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            .scalars()
+            .all()
+        )
+        if not ids:
+            break
+
+        day = func.date(User.created_date)
+        archived_counts = defaultdict(dict)
+        for created, active, users in db.session.execute(
+            select(day, User.active, func.count())
+            .where(User.id.in_(ids))
+            .group_by(day, User.active)
+        ):
+            archived_counts[as_date(created)][
+                "active" if active else "inactive"
+            ] = -users
+        for created in sorted(archived_counts):
+            add_counts(created, **archived_counts[created])
+
+        db.session.execute(
+            insert(UserArchive).from_select(
+                ARCHIVED_COLUMNS, select(*columns).where(User.id.in_(ids))
+            )
+        )
+        db.session.execute(
+            delete(User)
+            .where(User.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            insert(UserEvent),
+            [{"user_id": user_id, "kind": "deleted", "data": {}} for user_id in ids],
+        )
+        db.session.commit()
+        for user_id in ids:
+            autocomplete.remove(user_id)
+        archived += len(ids)
+
+    return archived
@@ -0,0 +1,206 @@
+import datetime
+import threading
+import time
+
+from sqlalchemy import func, select
+
+from src import db, shards
+from src.api.users.models import User
+from src.bloom import BloomFilter
+from src.metrics import metrics
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def normalize(email: str) -> str:
+    return email.strip().lower()
+
+
+class EmailFilter:
+    """In-process Bloom filter of the emails of active users.
+
+    Duplicate-email checks mostly miss, and a miss here is certain, so
+    :meth:`exists` only asks the database when the filter says the email
+    may be taken. The filter is loaded with a streaming query on first
+    use, updated in place by the crud helpers, and every
+    ``EMAIL_FILTER_SYNC_INTERVAL`` seconds one thread picks up users
+    created or changed by other workers through ``updated_date``.
+    Bloom filters cannot forget, so deactivated and renamed emails stay in
+    it until it is rebuilt every ``EMAIL_FILTER_REBUILD_INTERVAL`` seconds,
+    or sooner once it holds more emails than it was sized for.
+
+    The filter can lag other workers by one sync interval; the unique
+    ``ix_users_email_active`` index still rejects a duplicate that slips
+    through. With sharding enabled users are not in the primary ``users``
+    table, so the filter stays off.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._filter = None
+        self._capacity = 0
+        self._emails = 0
+        self._pending = None
+        self._watermark = None
+        self._synced_at = None
+        self._built_at = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EMAIL_FILTER_ENABLED", True)
+        app.config.setdefault("EMAIL_FILTER_ERROR_RATE", 0.01)
+        app.config.setdefault("EMAIL_FILTER_HEADROOM", 2.0)
+        app.config.setdefault("EMAIL_FILTER_MIN_CAPACITY", 10000)
+        app.config.setdefault("EMAIL_FILTER_SYNC_INTERVAL", 30)
+        app.config.setdefault("EMAIL_FILTER_SYNC_OVERLAP", 5)
+        app.config.setdefault("EMAIL_FILTER_REBUILD_INTERVAL", 3600)
+        app.extensions["email_filter"] = self
+        self.app = app
+
+    @property
+    def enabled(self) -> bool:
+        return self.app.config["EMAIL_FILTER_ENABLED"] and not shards.enabled
+
+    @property
+    def loaded(self) -> bool:
+        return self._filter is not None
+
+    def may_exist(self, email: str) -> bool:
+        """Return ``False`` only if no active user has ``email``."""
+        if not self.enabled:
+            return True
+        self._refresh()
+        present = BloomFilter.digest(normalize(email)) in self._filter
+        metrics.inc(
+            "email_filter_checks_total", result="maybe" if present else "absent"
+        )
+        return present
+
+    def exists(self, email: str, lookup) -> bool:
+        """Return whether ``lookup(email)`` finds a user, skipping the lookup
+        when the filter rules the email out."""
+        if not self.may_exist(email):
+            return False
+        if lookup(email):
+            return True
+        if self.enabled:
+            metrics.inc("email_filter_false_positives_total")
+        return False
+
+    def load(self):
+        """Rebuild the filter from the active users, sized for their count."""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        config = self.app.config
+        with db.get_engine().connect() as connection:
+            count = connection.execute(
+                select(func.count()).select_from(User).where(User.active)
+            ).scalar()
+            capacity = max(
+                int(count * config["EMAIL_FILTER_HEADROOM"]),
+                config["EMAIL_FILTER_MIN_CAPACITY"],
+            )
+            bloom = BloomFilter.create(capacity, config["EMAIL_FILTER_ERROR_RATE"])
+            with self._lock:
+                # Emails added while the new filter is filled are replayed.
+                self._pending = []
+
+            started = time.perf_counter()
+            emails, watermark = 0, None
+            try:
+                result = connection.execution_options(
+                    stream_results=True, yield_per=10000
+                ).execute(select(User.email, User.updated_date).where(User.active))
+                for email, updated_date in result:
+                    bloom.add(BloomFilter.digest(normalize(email)))
+                    emails += 1
+                    watermark = max(filter(None, (watermark, updated_date)))
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+
+        with self._lock:
+            for email in self._pending:
+                bloom.add(BloomFilter.digest(email))
+            emails += len(self._pending)
+            self._pending = None
+            self._filter, self._capacity, self._emails = bloom, capacity, emails
+            self._watermark = watermark or self._watermark
+            self._synced_at = self._built_at = time.monotonic()
+        metrics.observe("email_filter_build_seconds", time.perf_counter() - started)
+        self._update_gauges()
+
+    def sync(self):
+        """Add the emails of users created or changed since the last sync."""
+        # New rows start with ``updated_date`` set, so the indexed
+        # ``updated_date`` alone finds them too.
+        since = (self._watermark or EPOCH) - datetime.timedelta(
+            seconds=self.app.config["EMAIL_FILTER_SYNC_OVERLAP"]
+        )
+        query = select(User.email, User.updated_date).where(
+            User.active, User.updated_date > since
+        )
+        with db.get_engine().connect() as connection:
+            rows = connection.execute(query).all()
+
+        with self._lock:
+            for email, updated_date in rows:
+                self._add(normalize(email))
+                self._watermark = max(filter(None, (self._watermark, updated_date)))
+            self._synced_at = time.monotonic()
+        self._update_gauges()
+
+    def add(self, email: str):
+        with self._lock:
+            if self.loaded:
+                self._add(normalize(email))
+            elif self._pending is not None:
+                self._pending.append(normalize(email))
+
+    def _add(self, email: str):
+        self._filter.add(BloomFilter.digest(email))
+        self._emails += 1
+        if self._pending is not None:
+            self._pending.append(email)
+
+    def _refresh(self):
+        if not self.loaded:
+            with self._build_lock:
+                if not self.loaded:
+                    self._build()
+            return
+
+        config = self.app.config
+        now = time.monotonic()
+        if (
+            self._emails > self._capacity
+            or now - self._built_at >= config["EMAIL_FILTER_REBUILD_INTERVAL"]
+        ):
+            # Keep answering from the old filter while another thread rebuilds.
+            if self._build_lock.acquire(blocking=False):
+                try:
+                    self._build()
+                finally:
+                    self._build_lock.release()
+        elif now - self._synced_at >= config[
+            "EMAIL_FILTER_SYNC_INTERVAL"
+        ] and self._build_lock.acquire(blocking=False):
+            # One thread syncs; the others answer from the filter meanwhile.
+            try:
+                self.sync()
+            finally:
+                self._build_lock.release()
+
+    def _update_gauges(self):
+        metrics.set("email_filter_bytes", len(self._filter.bits))
+        metrics.set("email_filter_emails", self._emails)
+        metrics.set("email_filter_capacity", self._capacity)
+
+
+email_filter = EmailFilter()
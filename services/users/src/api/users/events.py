@@ -0,0 +1,280 @@
+import asyncio
+import datetime
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import delete, func, literal_column
+
+from src import db
+from src.api.users.models import UserEvent
+from src.metrics import metrics
+
+CHANNEL = "user_events"
+
+# Bounds of the snapshot a statement reads with, as integers.
+SNAPSHOT = (
+    literal_column("pg_snapshot_xmin(pg_current_snapshot())::text::bigint"),
+    literal_column("pg_snapshot_xmax(pg_current_snapshot())::text::bigint"),
+)
+
+
+def render(event_id: int, kind: str, user_id: int, data: dict) -> str:
+    """Format a change as a Server-Sent Events message."""
+    payload = json.dumps({"id": user_id, **data}, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+
+
+class UserEventStream:
+    """Fan user change events out to Server-Sent Events subscribers.
+
+    Each worker runs one listener thread. On Postgres it holds a single
+    ``LISTEN user_events`` connection and reads new ``user_events`` rows
+    when notified, or every ``USER_EVENTS_POLL_INTERVAL`` seconds if a
+    notification is missed; elsewhere it just polls. The last
+    ``USER_EVENTS_BUFFER`` events are kept rendered in memory, so any number
+    of subscribers are served without touching the database.
+
+    Ids are drawn when rows are inserted, not when they commit, so a
+    committed event can follow a gap left by a transaction still running.
+    Events after a gap are held back until every transaction that was
+    running when the gap was seen has ended (``pg_snapshot_xmin`` has moved
+    past the snapshot's ``xmax``); by then the missing ids are visible or
+    were rolled back.
+
+    Streams are served by the async app (``src/asgi.py``): each one is a
+    coroutine waiting on an :class:`asyncio.Event` that the listener thread
+    sets, so open streams cost no threads and are not capped.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._events = deque()
+        # Every event after ``_floor`` up to ``_last_id`` is in ``_events``.
+        self._floor = None
+        self._last_id = None
+        # ``(last_id, xmax)`` of the snapshot that first saw a gap after it.
+        self._gap = None
+        # ``(loop, asyncio.Event)`` of each open stream, set on new events.
+        self._waiters = set()
+        self._lock = threading.Lock()
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("USER_EVENTS_POLL_INTERVAL", 5)
+        app.config.setdefault("USER_EVENTS_BUFFER", 1000)
+        app.config.setdefault("USER_EVENTS_KEEPALIVE", 15)
+        app.config.setdefault("USER_EVENTS_STREAM_SECONDS", 300)
+        app.config.setdefault("USER_EVENTS_RETENTION", 86400)
+        app.extensions["user_events"] = self
+        self.app = app
+
+    async def subscribe(self, last_event_id: int = None):
+        """Yield messages for events after ``last_event_id``.
+
+        Without ``last_event_id`` the stream starts at the newest event. If
+        the events since ``last_event_id`` are no longer kept, the stream
+        starts with a ``reset`` event telling the client to reload.
+        """
+        config = self.app.config
+        loop = asyncio.get_running_loop()
+        position, backlog = await loop.run_in_executor(None, self._start, last_event_id)
+        wake = asyncio.Event()
+        waiter = (loop, wake)
+        with self._lock:
+            self._waiters.add(waiter)
+            subscribers = len(self._waiters)
+        metrics.set("user_event_subscribers", subscribers)
+        try:
+            yield f"retry: {config['USER_EVENTS_KEEPALIVE'] * 1000}\n\n"
+            if backlog:
+                yield "".join(backlog)
+
+            # Streams end after a while; ``EventSource`` reconnects on its
+            # own with ``Last-Event-ID``, possibly to another worker.
+            ends = time.monotonic() + config["USER_EVENTS_STREAM_SECONDS"]
+            while time.monotonic() < ends:
+                with self._lock:
+                    pending = self._last_id > position
+                    if not pending:
+                        wake.clear()
+                if not pending:
+                    try:
+                        await asyncio.wait_for(
+                            wake.wait(), config["USER_EVENTS_KEEPALIVE"]
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+
+                with self._lock:
+                    fresh = []
+                    for event_id, message in reversed(self._events):
+                        if event_id <= position:
+                            break
+                        fresh.append(message)
+                    behind = position < self._floor
+                    position = self._last_id
+
+                if behind:
+                    # This subscriber fell further behind than the buffer.
+                    yield _reset(position)
+                elif fresh:
+                    yield "".join(reversed(fresh))
+                else:
+                    yield ": keepalive\n\n"
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+                subscribers = len(self._waiters)
+            metrics.set("user_event_subscribers", subscribers)
+
+    def _start(self, last_event_id: int = None) -> tuple:
+        """Return the position a stream starts from and the messages it
+        must send first. Runs on a thread, as it may read the table."""
+        self._ensure_listener()
+        if self._last_id is None:
+            self._fetch()
+        with self._lock:
+            floor, latest = self._floor, self._last_id
+        if last_event_id is None:
+            return latest, []
+        if last_event_id >= floor:
+            return last_event_id, []
+
+        # Older than this worker's buffer: catch up from the table.
+        limit = self.app.config["USER_EVENTS_BUFFER"]
+        with self.app.app_context():
+            missed = (
+                db.session.execute(
+                    db.select(UserEvent)
+                    .where(UserEvent.id > last_event_id, UserEvent.id <= floor)
+                    .order_by(UserEvent.id)
+                    .limit(limit + 1)
+                )
+                .scalars()
+                .all()
+            )
+            oldest = db.session.execute(db.select(func.min(UserEvent.id))).scalar()
+        if len(missed) > limit or oldest is None or oldest > last_event_id + 1:
+            return latest, [_reset(latest)]
+        return floor, [
+            render(event.id, event.kind, event.user_id, event.data) for event in missed
+        ]
+
+    def _fetch(self):
+        """Append events committed since the last fetch and wake subscribers."""
+        engine = db.get_engine(self.app)
+        with engine.connect() as connection:
+            if self._last_id is None:
+                latest = connection.execute(db.select(func.max(UserEvent.id))).scalar()
+                with self._lock:
+                    if self._last_id is None:
+                        self._floor = self._last_id = latest or 0
+                return
+            query = (
+                db.select(
+                    UserEvent.id, UserEvent.kind, UserEvent.user_id, UserEvent.data
+                )
+                .where(UserEvent.id > self._last_id)
+                .order_by(UserEvent.id)
+            )
+            postgres = connection.dialect.name == "postgresql"
+            if postgres:
+                query = query.add_columns(*SNAPSHOT)
+            rows = connection.execute(query).all()
+        if not rows:
+            return
+        self._receive(
+            [tuple(row[:4]) for row in rows], tuple(rows[0][4:]) if postgres else None
+        )
+
+    def _receive(self, rows: list, snapshot: tuple = None):
+        """Append ``rows`` in id order, stopping at a gap ``snapshot`` (its
+        ``xmin``, ``xmax``) cannot rule out being filled later."""
+        received = 0
+        with self._lock:
+            for row in rows:
+                if row[0] <= self._last_id:
+                    continue
+                if snapshot and row[0] > self._last_id + 1:
+                    xmin, xmax = snapshot
+                    if self._gap is None or self._gap[0] != self._last_id:
+                        self._gap = (self._last_id, xmax)
+                    if xmin < self._gap[1]:
+                        break
+                self._events.append((row[0], render(*row)))
+                self._last_id = row[0]
+                received += 1
+            while len(self._events) > self.app.config["USER_EVENTS_BUFFER"]:
+                self._floor = self._events.popleft()[0]
+            for loop, wake in self._waiters:
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(wake.set)
+        if received:
+            metrics.inc("user_events_received_total", received)
+
+    def _ensure_listener(self):
+        # Threads do not survive gunicorn's fork, so each worker starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="user-events", daemon=True).start()
+
+    def _run(self):
+        interval = self.app.config["USER_EVENTS_POLL_INTERVAL"]
+        while True:
+            try:
+                self._listen(interval)
+            except Exception:
+                self.app.logger.exception("User event listener failed, restarting")
+                time.sleep(interval)
+
+    def _listen(self, interval: float):
+        engine = db.get_engine(self.app)
+        listener = None
+        if engine.dialect.name == "postgresql":
+            # A connection of its own, outside the pool, that never commits.
+            listener = engine.raw_connection()
+            listener.detach()
+            listener.connection.autocommit = True
+            listener.cursor().execute(f"LISTEN {CHANNEL}")
+
+        try:
+            while True:
+                self._fetch()
+                if listener is None:
+                    time.sleep(interval)
+                elif select.select([listener.connection], [], [], interval)[0]:
+                    listener.connection.poll()
+                    listener.connection.notifies.clear()
+        finally:
+            if listener is not None:
+                listener.close()
+
+
+def _reset(event_id: int) -> str:
+    return f"id: {event_id}\nevent: reset\ndata: {{}}\n\n"
+
+
+def purge_expired_events():
+    retention = datetime.timedelta(
+        seconds=user_events.app.config["USER_EVENTS_RETENTION"]
+    )
+    purged = db.session.execute(
+        delete(UserEvent).where(
+            UserEvent.created_date <= datetime.datetime.utcnow() - retention
+        )
+    ).rowcount
+    db.session.commit()
+    return purged
+
+
+user_events = UserEventStream()
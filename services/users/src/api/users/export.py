@@ -0,0 +1,149 @@
+import csv
+import datetime
+import gzip
+import io
+import time
+
+from sqlalchemy import func, select
+
+from src import db
+from src.api.users.models import User
+
+# Password hashes never leave the database.
+EXPORT_COLUMNS = (
+    "id",
+    "username",
+    "email",
+    "active",
+    "created_date",
+    "updated_date",
+    "last_login_at",
+)
+FORMATS = ("csv", "parquet")
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+
+def export_users(
+    path: str,
+    fmt: str = "csv",
+    compression: str = "gzip",
+    since=None,
+    chunk_size: int = 10000,
+    lag: int = 300,
+) -> dict:
+    """Write users created after ``since`` to ``path``.
+
+    The export covers ``since < created_date <= watermark``, where
+    ``watermark`` is the newest ``created_date`` at least ``lag`` seconds
+    older than the database clock. ``created_date`` is set when the
+    inserting transaction starts, so a newer row may still be uncommitted;
+    waiting ``lag`` seconds lets every such transaction finish before the
+    watermark passes it. Pass the returned watermark as ``since`` to the
+    next run to export only the users added in between.
+
+    CSV exports from Postgres are streamed by ``COPY ... TO STDOUT`` without
+    building rows in Python. Other databases, and Parquet files, are read
+    through a server-side cursor ``chunk_size`` rows at a time.
+    """
+    columns = [getattr(User, name) for name in EXPORT_COLUMNS]
+    settled = db.session.execute(select(func.now())).scalar()
+    window = [User.created_date <= settled - datetime.timedelta(seconds=lag)]
+    if since is not None:
+        window.append(User.created_date > since)
+    watermark = db.session.execute(
+        select(func.max(User.created_date)).where(*window)
+    ).scalar()
+    if watermark is None:
+        return {"rows": 0, "seconds": 0.0, "rows_per_second": 0.0, "watermark": since}
+    window.append(User.created_date <= watermark)
+    query = select(*columns).where(*window).order_by(User.id)
+
+    started = time.perf_counter()
+    engine = db.get_engine()
+    if fmt == "parquet":
+        rows = _write_parquet(engine, query, path, compression, chunk_size)
+    else:
+        with _open(path, compression) as out:
+            if engine.dialect.name == "postgresql":
+                rows = _copy_csv(engine, query, out)
+            else:
+                rows = _write_csv(engine, query, out, chunk_size)
+    seconds = time.perf_counter() - started
+
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "watermark": watermark,
+    }
+
+
+def _open(path: str, compression: str):
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=6)
+    if compression == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+    return open(path, "wb")
+
+
+def _copy_csv(engine, query, out) -> int:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        compiled = query.compile(engine)
+        sql = cursor.mogrify(str(compiled), compiled.params).decode()
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        rows = cursor.rowcount
+        connection.commit()
+        return rows
+    finally:
+        connection.close()
+
+
+def _write_csv(engine, query, out, chunk_size: int) -> int:
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = 0
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=chunk_size
+        ).execute(query)
+        for chunk in result.partitions():
+            writer.writerows(chunk)
+            rows += len(chunk)
+    text.flush()
+    text.detach()
+    return rows
+
+
+def _write_parquet(engine, query, path: str, compression: str, chunk_size: int):
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema(
+        [
+            ("id", pyarrow.int64()),
+            ("username", pyarrow.string()),
+            ("email", pyarrow.string()),
+            ("active", pyarrow.bool_()),
+            ("created_date", pyarrow.timestamp("us")),
+            ("updated_date", pyarrow.timestamp("us")),
+            ("last_login_at", pyarrow.timestamp("us")),
+        ]
+    )
+    rows = 0
+    with engine.connect() as connection, pyarrow.parquet.ParquetWriter(
+        path, schema, compression=None if compression == "none" else compression
+    ) as writer:
+        result = connection.execution_options(
+            stream_results=True, yield_per=chunk_size
+        ).execute(query)
+        for chunk in result.partitions():
+            writer.write_table(
+                pyarrow.Table.from_pylist([row._asdict() for row in chunk], schema)
+            )
+            rows += len(chunk)
+    return rows
@@ -0,0 +1,145 @@
+import atexit
+import datetime
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import bindparam, column, insert, update, values
+
+from src import db
+from src.api.users.models import LoginEvent, User
+from src.metrics import metrics
+
+
+class LoginEventBuffer:
+    """Write-behind buffer for login events and ``User.last_login_at``.
+
+    Logins only append to an in-process deque. A background thread flushes it
+    every ``LOGIN_EVENTS_FLUSH_INTERVAL`` ms, or as soon as
+    ``LOGIN_EVENTS_FLUSH_SIZE`` events are waiting, as one multi-row INSERT
+    and one set-based UPDATE. At most ``LOGIN_EVENTS_MAX_BUFFERED`` events are
+    kept; when the database falls behind the oldest ones are dropped and
+    counted.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("LOGIN_EVENTS_FLUSH_INTERVAL", 1000)
+        app.config.setdefault("LOGIN_EVENTS_FLUSH_SIZE", 500)
+        app.config.setdefault("LOGIN_EVENTS_MAX_BUFFERED", 10000)
+        app.extensions["login_events"] = self
+        self.app = app
+
+    def record(self, user_id: int, event: str):
+        config = self.app.config
+        with self._lock:
+            if len(self._events) >= config["LOGIN_EVENTS_MAX_BUFFERED"]:
+                self._events.popleft()
+                metrics.inc("login_events_dropped_total")
+            self._events.append((user_id, event, datetime.datetime.utcnow()))
+            buffered = len(self._events)
+        metrics.set("login_events_buffered", buffered)
+
+        self._ensure_flusher()
+        if buffered >= config["LOGIN_EVENTS_FLUSH_SIZE"]:
+            self._wake.set()
+
+    def flush(self):
+        with self._lock:
+            events, self._events = list(self._events), deque()
+        metrics.set("login_events_buffered", 0)
+        if not events:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            self._write(events)
+        except Exception:
+            self.app.logger.exception("Dropped %d login events", len(events))
+            metrics.inc("login_events_dropped_total", len(events))
+            return 0
+
+        metrics.observe("login_events_flush_seconds", time.perf_counter() - started)
+        metrics.inc("login_events_flushed_total", len(events))
+        return len(events)
+
+    def _write(self, events: list):
+        # ``updated_date`` tracks profile changes, not logins, so keep it as is.
+        last_logins = {}
+        for user_id, _, created_date in events:
+            last_logins[user_id] = max(
+                created_date, last_logins.get(user_id, created_date)
+            )
+
+        engine = db.get_engine(self.app)
+        with engine.begin() as connection:
+            connection.execute(
+                insert(LoginEvent).values(
+                    [
+                        {
+                            "user_id": user_id,
+                            "event": event,
+                            "created_date": created_date,
+                        }
+                        for user_id, event, created_date in events
+                    ]
+                )
+            )
+
+            if engine.dialect.name == "postgresql":
+                logins = values(
+                    column("id", db.Integer),
+                    column("last_login_at", db.DateTime),
+                    name="v",
+                ).data(list(last_logins.items()))
+                connection.execute(
+                    update(User)
+                    .where(User.id == logins.c.id)
+                    .values(
+                        last_login_at=logins.c.last_login_at,
+                        updated_date=User.updated_date,
+                    )
+                )
+            else:
+                connection.execute(
+                    update(User)
+                    .where(User.id == bindparam("user_id"))
+                    .values(
+                        last_login_at=bindparam("logged_in_at"),
+                        updated_date=User.updated_date,
+                    ),
+                    [
+                        {"user_id": user_id, "logged_in_at": last_login_at}
+                        for user_id, last_login_at in last_logins.items()
+                    ],
+                )
+
+    def _ensure_flusher(self):
+        # Threads do not survive gunicorn's fork, so each worker starts its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="login-events", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        interval = self.app.config["LOGIN_EVENTS_FLUSH_INTERVAL"] / 1000
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            self.flush()
+
+
+login_events = LoginEventBuffer()
@@ -3,6 +3,7 @@ import os
 
 import jwt
 from flask import current_app
+from sqlalchemy import DDL, event
 from sqlalchemy.sql import func
 
 from src import bcrypt, db
@@ -11,6 +12,27 @@ from src import bcrypt, db
 class User(db.Model):
 
     __tablename__ = "users"
+    __table_args__ = (
+        # Every read path filters on ``active``, so the indexes only cover the
+        # live rows and stay small as deactivated accounts pile up. The email
+        # one is also what keeps two active users from sharing an email.
+        db.Index(
+            "ix_users_email_active",
+            "email",
+            unique=True,
+            postgresql_where=db.text("active"),
+            sqlite_where=db.text("active"),
+        ),
+        db.Index(
+            "ix_users_created_date_active",
+            "created_date",
+            postgresql_where=db.text("active"),
+            sqlite_where=db.text("active"),
+        ),
+        # In-process indexes poll for rows changed since their last sync,
+        # deactivations included, so this one covers every row.
+        db.Index("ix_users_updated_date", "updated_date"),
+    )
 
     id: int = db.Column(db.Integer, primary_key=True, autoincrement=True)
     username: str = db.Column(db.String(128), nullable=False)
@@ -18,13 +40,22 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     active: bool = db.Column(db.Boolean(), default=True, nullable=False)
     created_date: datetime = db.Column(db.DateTime, default=func.now(), nullable=False)
+    updated_date: datetime = db.Column(
+        db.DateTime, default=func.now(), onupdate=func.now(), nullable=False
+    )
+    last_login_at: datetime = db.Column(db.DateTime, nullable=True)
 
-    def __init__(self, username: str, email: str, password: str):
+    def __init__(
+        self, username: str, email: str, password: str = None, password_hash: str = None
+    ):
         self.username = username
         self.email = email
-        self.password = bcrypt.generate_password_hash(
-            password, current_app.config.get("BCRYPT_LOG_ROUNDS")
-        ).decode()
+        self.password = (
+            password_hash
+            or bcrypt.generate_password_hash(
+                password, current_app.config.get("BCRYPT_LOG_ROUNDS")
+            ).decode()
+        )
 
     def encode_token(self, user_id: int, token_type: str):
         if token_type == "access":
@@ -45,10 +76,197 @@ class User(db.Model):
 
     @staticmethod
     def decode_token(token: str):
-        payload = jwt.decode(
+        return User.decode_token_payload(token)["sub"]
+
+    @staticmethod
+    def decode_token_payload(token: str):
+        return jwt.decode(
             token, current_app.config.get("SECRET_KEY"), algorithms="HS256"
         )
-        return payload["sub"]
+
+
+# Prefix search in the admin matches ``lower(column) LIKE 'term%'``, which the
+# ``varchar_pattern_ops`` operator class lets Postgres answer from a btree.
+for column in ("username", "email"):
+    event.listen(
+        User.__table__,
+        "after_create",
+        DDL(
+            f"CREATE INDEX ix_users_{column}_prefix "
+            f"ON users (lower({column}) varchar_pattern_ops)"
+        ).execute_if(dialect="postgresql"),
+    )
+
+
+class UserArchive(db.Model):
+
+    __tablename__ = "users_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (archived_date)"}
+
+    id: int = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    username: str = db.Column(db.String(128), nullable=False)
+    email: str = db.Column(db.String(128), nullable=False)
+    password = db.Column(db.String(255), nullable=False)
+    active: bool = db.Column(db.Boolean(), nullable=False)
+    created_date: datetime = db.Column(db.DateTime, nullable=False)
+    updated_date: datetime = db.Column(db.DateTime, nullable=False)
+    last_login_at: datetime = db.Column(db.DateTime, nullable=True)
+    archived_date: datetime = db.Column(
+        db.DateTime, primary_key=True, default=func.now(), nullable=False
+    )
+
+
+class UserDirectory(db.Model):
+    """Global user id allocator and email index when users are sharded."""
+
+    __tablename__ = "user_directory"
+    __table_args__ = (
+        # Shards cannot see each other's emails; this keeps them unique.
+        db.Index(
+            "ix_user_directory_email_active",
+            "email",
+            unique=True,
+            postgresql_where=db.text("active"),
+            sqlite_where=db.text("active"),
+        ),
+    )
+
+    id: int = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    email: str = db.Column(db.String(128), nullable=False)
+    active: bool = db.Column(db.Boolean, default=True, nullable=False)
+
+
+class ShardMap(db.Model):
+
+    __tablename__ = "shard_map"
+
+    bucket: int = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard: str = db.Column(db.String(64), nullable=False)
+
+
+class LoginEvent(db.Model):
+
+    __tablename__ = "login_events"
+
+    id: int = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True
+    )
+    user_id: int = db.Column(db.Integer, nullable=False, index=True)
+    event: str = db.Column(db.String(16), nullable=False)
+    created_date: datetime = db.Column(db.DateTime, nullable=False)
+
+
+class IdempotencyKey(db.Model):
+
+    __tablename__ = "idempotency_keys"
+
+    key: str = db.Column(db.String(255), primary_key=True)
+    # Hash of the caller's credentials or address; keys are per client.
+    client: str = db.Column(db.String(64), primary_key=True)
+    endpoint: str = db.Column(db.String(255), primary_key=True)
+    fingerprint: str = db.Column(db.String(64), nullable=False)
+    # Both stay ``None`` while the first request with the key is running.
+    status_code: int = db.Column(db.Integer, nullable=True)
+    response = db.Column(db.JSON, nullable=True)
+    created_date: datetime = db.Column(db.DateTime, default=func.now(), nullable=False)
+
+
+class Job(db.Model):
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers only ever look for queued jobs that are due.
+        db.Index(
+            "ix_jobs_queued_run_at",
+            "run_at",
+            postgresql_where=db.text("status = 'queued'"),
+            sqlite_where=db.text("status = 'queued'"),
+        ),
+    )
+
+    id: int = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True
+    )
+    name: str = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=False)
+    status: str = db.Column(db.String(16), default="queued", nullable=False)
+    attempts: int = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts: int = db.Column(db.Integer, nullable=False)
+    run_at: datetime = db.Column(db.DateTime, nullable=False)
+    locked_at: datetime = db.Column(db.DateTime, nullable=True)
+    locked_by: str = db.Column(db.String(128), nullable=True)
+    last_error: str = db.Column(db.Text, nullable=True)
+    created_date: datetime = db.Column(db.DateTime, default=func.now(), nullable=False)
+    finished_date: datetime = db.Column(db.DateTime, nullable=True)
+
+
+class UserEvent(db.Model):
+    """Change feed of users; the id doubles as the SSE event id."""
+
+    __tablename__ = "user_events"
+
+    id: int = db.Column(
+        db.BigInteger().with_variant(db.Integer, "sqlite"), primary_key=True
+    )
+    user_id: int = db.Column(db.Integer, nullable=False)
+    kind: str = db.Column(db.String(16), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    created_date: datetime = db.Column(db.DateTime, default=func.now(), nullable=False)
+
+
+class UserStats(db.Model):
+    """Per-day rollup of signups and of the ``active`` flag, by signup day.
+
+    ``signups`` counts archived users too; ``active`` and ``inactive`` only
+    count rows still in ``users``.
+    """
+
+    __tablename__ = "user_stats"
+
+    day: datetime.date = db.Column(db.Date, primary_key=True)
+    signups: int = db.Column(db.Integer, default=0, nullable=False)
+    active: int = db.Column(db.Integer, default=0, nullable=False)
+    inactive: int = db.Column(db.Integer, default=0, nullable=False)
+
+
+# A partitioned table cannot take rows until it has a partition. The default
+# partition catches everything; monthly partitions can be attached later and
+# old ones detached or dropped without touching the hot ``users`` table.
+event.listen(
+    UserArchive.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS users_archive_default "
+        "PARTITION OF users_archive DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
+
+# Readers hold events back behind a gap in ids until the transactions that
+# could fill it have ended (see ``UserEventStream``), which only works if an
+# inserting transaction has an xid before it draws an id: the statement
+# trigger assigns one. Listeners are woken once per inserting statement.
+event.listen(
+    UserEvent.__table__,
+    "after_create",
+    DDL(
+        """
+        CREATE OR REPLACE FUNCTION user_events_xact() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_current_xact_id();
+            RETURN NULL;
+        END $$;
+        CREATE TRIGGER user_events_xact BEFORE INSERT ON user_events
+            FOR EACH STATEMENT EXECUTE FUNCTION user_events_xact();
+        CREATE OR REPLACE FUNCTION user_events_notify() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_notify('user_events', '');
+            RETURN NULL;
+        END $$;
+        CREATE TRIGGER user_events_notify AFTER INSERT ON user_events
+            FOR EACH STATEMENT EXECUTE FUNCTION user_events_notify();
+        """
+    ).execute_if(dialect="postgresql"),
+)
 
 
 if os.getenv("FLASK_ENV") == "development":
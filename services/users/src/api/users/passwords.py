@@ -0,0 +1,80 @@
+import logging
+import os
+
+from flask import current_app
+
+from src.bloom import BloomFilter
+
+BREACHED_MESSAGE = "Sorry. That password has appeared in a data breach."
+
+# A child of the Flask app's ``src`` logger, usable outside an app context.
+logger = logging.getLogger(__name__)
+
+
+class BreachedPasswords:
+    """Check passwords against the filter built by ``build_breach_filter``.
+
+    The filter file named by ``BREACHED_PASSWORDS_FILTER`` is mapped
+    read-only on first use, so gunicorn workers share the kernel's page
+    cache instead of each loading a copy. ``build_breach_filter`` replaces
+    the file rather than rewriting it, so each check stats the path and
+    maps it again once its inode or mtime changes. A match may be a false
+    positive at the rate the filter was built with; a miss is certain.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._filter = None
+
+    def is_breached(self, password: str, path: str = None) -> bool:
+        # The async app has no Flask app context and passes ``path`` itself.
+        if path is None:
+            path = current_app.config.get("BREACHED_PASSWORDS_FILTER")
+        if not path:
+            return False
+
+        try:
+            stat = os.stat(path)
+            version = (path, stat.st_ino, stat.st_mtime_ns)
+        except OSError:
+            version = (path, None, None)
+
+        if version != self._version:
+            try:
+                self._filter = BloomFilter.open(path)
+            except (OSError, ValueError):
+                logger.exception("Breached password filter unavailable")
+                self._filter = None
+            self._version = version
+
+        return self._filter is not None and BloomFilter.digest(password) in self._filter
+
+
+def build_breach_filter(
+    corpus: str, output: str, error_rate: float = 1e-3, plaintext: bool = False
+) -> BloomFilter:
+    """Compile ``corpus`` into a filter file at ``output``.
+
+    Each corpus line is an uppercase or lowercase hex SHA-1 of a password,
+    optionally followed by ``:count`` as in the Pwned Passwords downloads,
+    or with ``plaintext`` the password itself. The corpus is streamed twice,
+    once to size the filter and once to fill it.
+    """
+    with open(corpus, encoding="utf-8", errors="replace") as lines:
+        capacity = sum(1 for line in lines if line.strip())
+
+    bloom = BloomFilter.create(capacity, error_rate)
+    with open(corpus, encoding="utf-8", errors="replace") as lines:
+        for line in lines:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if plaintext:
+                bloom.add(BloomFilter.digest(line))
+            else:
+                bloom.add(bytes.fromhex(line.split(":", 1)[0]))
+    bloom.save(output)
+    return bloom
+
+
+breached_passwords = BreachedPasswords()
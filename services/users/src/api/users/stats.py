@@ -0,0 +1,116 @@
+import datetime
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src import db
+from src.api.users.models import User, UserArchive, UserStats
+
+BUCKETS = ("day", "week", "month")
+COUNTS = ("signups", "active", "inactive")
+
+
+def as_date(value) -> datetime.date:
+    # SQLite returns ``date()`` as text and may hand back datetimes.
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def add_counts(day, **changes):
+    """Add ``changes`` to the counts of ``day`` within the current transaction.
+
+    One upsert per call, so a signup or deactivation costs a single row
+    write however many users there are.
+    """
+    dialect = db.session.connection().dialect.name
+    upsert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = upsert(UserStats).values(
+        day=as_date(day), **{name: changes.get(name, 0) for name in COUNTS}
+    )
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[UserStats.day],
+            set_={
+                name: getattr(UserStats, name) + statement.excluded[name]
+                for name in changes
+            },
+        )
+    )
+
+
+def rebuild_stats() -> int:
+    """Recount ``user_stats`` from ``users`` and ``users_archive``.
+
+    Fixes drift from writes that bypass ``crud.py``. Returns the number of
+    days counted.
+    """
+    if db.session.connection().dialect.name == "postgresql":
+        # Wait for transactions that already counted, hold off new ones.
+        db.session.execute(text("LOCK TABLE user_stats IN EXCLUSIVE MODE"))
+
+    counts = defaultdict(lambda: dict.fromkeys(COUNTS, 0))
+    day = func.date(User.created_date)
+    for created, active, users in db.session.execute(
+        select(day, User.active, func.count()).group_by(day, User.active)
+    ):
+        counts[as_date(created)]["signups"] += users
+        counts[as_date(created)]["active" if active else "inactive"] += users
+    day = func.date(UserArchive.created_date)
+    for created, users in db.session.execute(select(day, func.count()).group_by(day)):
+        counts[as_date(created)]["signups"] += users
+
+    db.session.execute(delete(UserStats))
+    if counts:
+        db.session.execute(
+            insert(UserStats),
+            [{"day": created, **counts[created]} for created in sorted(counts)],
+        )
+    db.session.commit()
+    return len(counts)
+
+
+def period_start(day: datetime.date, bucket: str) -> datetime.date:
+    if bucket == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def period_count(since: datetime.date, until: datetime.date, bucket: str) -> int:
+    """Return ``len(periods(since, until, bucket))`` without listing them."""
+    if since > until:
+        return 0
+    if bucket == "month":
+        return (until.year - since.year) * 12 + until.month - since.month + 1
+    days = (period_start(until, bucket) - period_start(since, bucket)).days
+    return days // (7 if bucket == "week" else 1) + 1
+
+
+def periods(since: datetime.date, until: datetime.date, bucket: str) -> list:
+    """Return the start of every ``bucket`` overlapping ``since``..``until``."""
+    starts = []
+    start = period_start(since, bucket)
+    while start <= until:
+        starts.append(start)
+        if bucket == "month":
+            start = (start + datetime.timedelta(days=31)).replace(day=1)
+        else:
+            start += datetime.timedelta(days=7 if bucket == "week" else 1)
+    return starts
+
+
+def bucket_stats(days: list, since, until, bucket: str) -> list:
+    """Sum daily ``UserStats`` rows into ``bucket`` periods, zero-filled."""
+    totals = {
+        start: dict.fromkeys(COUNTS, 0) for start in periods(since, until, bucket)
+    }
+    for row in days:
+        period = totals[period_start(row.day, bucket)]
+        for name in COUNTS:
+            period[name] += getattr(row, name)
+    return [{"start": start, **counts} for start, counts in totals.items()]
@@ -0,0 +1,67 @@
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from src import bcrypt
+from src.api.jobs import job
+from src.api.users.crud import archive_users as archive_inactive_users
+from src.api.users.crud import create_user, get_users_by_emails
+from src.api.users.passwords import breached_passwords
+
+
+@job(concurrency=1)
+def archive_users(older_than_days: int = 30, dormant_days: int = None):
+    archive_inactive_users(
+        datetime.timedelta(days=older_than_days),
+        dormant_for=datetime.timedelta(days=dormant_days) if dormant_days else None,
+    )
+
+
+def hash_passwords(users: list) -> list:
+    """Replace each user's ``password`` with its bcrypt ``password_hash``.
+
+    Imports are queued with hashes only, so no plaintext password is ever
+    written to ``jobs``, where finished rows stay. bcrypt releases the GIL,
+    so the hashing runs on a thread per CPU.
+    """
+    rounds = current_app.config.get("BCRYPT_LOG_ROUNDS")
+
+    def hashed(user: dict) -> dict:
+        user = dict(user)
+        password = user.pop("password")
+        user["password_hash"] = bcrypt.generate_password_hash(password, rounds).decode()
+        return user
+
+    with ThreadPoolExecutor(os.cpu_count()) as pool:
+        return list(pool.map(hashed, users))
+
+
+def queue_import(users: list, chunk_size: int = 500) -> tuple:
+    """Queue :func:`import_users` jobs for ``users`` in chunks.
+
+    Users whose password appears in a breach are left out. Returns the
+    number of users queued and the number left out.
+    """
+    allowed = [
+        user for user in users if not breached_passwords.is_breached(user["password"])
+    ]
+    for start in range(0, len(allowed), chunk_size):
+        chunk = allowed[start : start + chunk_size]  # noqa: E203
+        import_users.enqueue(users=hash_passwords(chunk))
+    return len(allowed), len(users) - len(allowed)
+
+
+@job(concurrency=2)
+def import_users(users: list):
+    """Create ``{"username", "email", "password_hash"}`` users, skipping taken
+    emails. See :func:`hash_passwords`."""
+    emails = [user["email"] for user in users]
+    taken = {found.email for found in get_users_by_emails(emails) if found}
+    for user in users:
+        if user["email"] not in taken:
+            create_user(
+                user["username"], user["email"], password_hash=user["password_hash"]
+            )
+            taken.add(user["email"])
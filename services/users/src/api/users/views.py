@@ -1,12 +1,24 @@
-from flask import request
-from flask_restx import Namespace, Resource, fields
+import datetime
+
+from flask import current_app, request
+from flask_restx import Namespace, Resource, fields, inputs, marshal
+from sqlalchemy.exc import IntegrityError
+
+from src.api.idempotency import idempotent
+from src.api.users.autocomplete import autocomplete
+from src.api.users.emails import email_filter
+from src.api.users.passwords import BREACHED_MESSAGE, breached_passwords
+from src.api.users.stats import BUCKETS, bucket_stats, period_count
 
 from src.api.users.crud import (  # isort:skip
     create_user,
     delete_user,
     get_all_users,
+    get_user_stats,
     get_user_by_email,
     get_user_by_id,
+    get_users_by_emails,
+    get_users_by_ids,
     update_user,
 )
 
@@ -26,15 +38,141 @@ user_post = users_namespace.inherit(
     "User post", user, {"password": fields.String(required=True)}
 )
 
+user_lookup = users_namespace.model(
+    "User lookup",
+    {
+        "ids": fields.List(fields.Integer),
+        "emails": fields.List(fields.String),
+    },
+)
+
+user_suggestion = users_namespace.model(
+    "User suggestion",
+    {
+        "id": fields.Integer,
+        "username": fields.String,
+        "email": fields.String,
+    },
+)
+
+user_counts = users_namespace.model(
+    "User counts",
+    {
+        "signups": fields.Integer,
+        "active": fields.Integer,
+        "inactive": fields.Integer,
+    },
+)
+
+user_stats_period = users_namespace.inherit(
+    "User stats period", user_counts, {"start": fields.Date}
+)
+
+user_stats = users_namespace.model(
+    "User stats",
+    {
+        "bucket": fields.String,
+        "periods": fields.List(fields.Nested(user_stats_period)),
+        "total": fields.Nested(user_counts),
+    },
+)
+
+FIELDS_HELP = f"Comma separated subset of {', '.join(user)}"
+FIELDS_MESSAGE = f"Sorry. Fields must be some of {', '.join(user)}."
+
+fields_parser = users_namespace.parser()
+fields_parser.add_argument("fields", location="args", help=FIELDS_HELP)
+
+parser = fields_parser.copy()
+parser.add_argument("ids", location="args", help="Comma separated user ids")
+parser.add_argument(
+    "after_id", type=int, location="args", help="Only users with a greater id"
+)
+parser.add_argument(
+    "limit", type=inputs.positive, location="args", help="At most this many users"
+)
+
+autocomplete_parser = users_namespace.parser()
+autocomplete_parser.add_argument(
+    "prefix", location="args", required=True, help="Start of a username or email"
+)
+autocomplete_parser.add_argument("limit", type=int, location="args")
+
+stats_parser = users_namespace.parser()
+stats_parser.add_argument(
+    "bucket", choices=BUCKETS, default="day", location="args", help="Period length"
+)
+stats_parser.add_argument(
+    "since", type=inputs.date, location="args", help="First day, 30 days ago by default"
+)
+stats_parser.add_argument(
+    "until", type=inputs.date, location="args", help="Last day, today by default"
+)
+
+
+def requested_fields(value: str):
+    """Validate a ``fields=`` list against the ``user`` model.
+
+    Returns ``None`` when all fields are wanted.
+    """
+    if value is None:
+        return None
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    if not names or any(name not in user for name in names):
+        users_namespace.abort(400, FIELDS_MESSAGE)
+    return names
+
+
+def user_fields(names: list = None):
+    """The ``user`` model, narrowed to ``names``."""
+    if names is None:
+        return user
+    return {name: user[name] for name in names}
+
+
+def lookup_users(ids: list = None, emails: list = None, fields: list = None):
+    keys = ids if ids is not None else emails
+    limit = current_app.config.get("USERS_LOOKUP_MAX")
+
+    if len(keys) > limit:
+        users_namespace.abort(400, f"Sorry. At most {limit} users can be looked up.")
+
+    if ids is not None:
+        users = get_users_by_ids(ids, columns=fields)
+    else:
+        users = get_users_by_emails(emails, columns=fields)
+    model = user_fields(fields)
+    return [marshal(found, model) if found else None for found in users]
+
 
 class UsersList(Resource):
-    @users_namespace.marshal_with(user, as_list=True)
+    @users_namespace.expect(parser)
+    @users_namespace.response(200, "Success", [user])
+    @users_namespace.response(400, "Sorry. Invalid user ids.")
+    @users_namespace.response(400, FIELDS_MESSAGE)
     def get(self):
-        return get_all_users(), 200
+        args = parser.parse_args()
+        ids = args.get("ids")
+        fields = requested_fields(args.get("fields"))
+
+        if ids is None:
+            users = get_all_users(
+                columns=fields, after_id=args.get("after_id"), limit=args.get("limit")
+            )
+            return marshal(users, user_fields(fields)), 200
+
+        try:
+            ids = [int(user_id) for user_id in ids.split(",") if user_id]
+        except ValueError:
+            users_namespace.abort(400, "Sorry. Invalid user ids.")
 
+        return lookup_users(ids=ids, fields=fields), 200
+
+    @idempotent
     @users_namespace.expect(user_post, validate=True)
     @users_namespace.response(201, "<user_email> was added")
     @users_namespace.response(400, "Sorry. That email already exists.")
+    @users_namespace.response(400, BREACHED_MESSAGE)
     def post(self):
         post_data = request.get_json()
         username = post_data.get("username")
@@ -42,29 +180,102 @@ class UsersList(Resource):
         password = post_data.get("password")
         response_object = {}
 
-        user = get_user_by_email(email)
+        if breached_passwords.is_breached(password):
+            response_object["message"] = BREACHED_MESSAGE
+            return response_object, 400
 
-        if user:
+        if email_filter.exists(email, get_user_by_email):
             response_object["message"] = "Sorry. That email already exists."
             return response_object, 400
 
-        create_user(username, email, password)
+        try:
+            create_user(username, email, password)
+        except IntegrityError:
+            response_object["message"] = "Sorry. That email already exists."
+            return response_object, 400
 
         response_object["message"] = f"{email} was added!"
         return response_object, 201
 
 
+class UsersLookup(Resource):
+    @users_namespace.expect(user_lookup, fields_parser, validate=True)
+    @users_namespace.response(200, "Success", [user])
+    @users_namespace.response(400, "Sorry. Provide either ids or emails.")
+    @users_namespace.response(400, FIELDS_MESSAGE)
+    def post(self):
+        post_data = request.get_json()
+        ids = post_data.get("ids")
+        emails = post_data.get("emails")
+        fields = requested_fields(fields_parser.parse_args().get("fields"))
+
+        if (ids is None) == (emails is None):
+            users_namespace.abort(400, "Sorry. Provide either ids or emails.")
+
+        return lookup_users(ids=ids, emails=emails, fields=fields), 200
+
+
+class UsersAutocomplete(Resource):
+    @users_namespace.expect(autocomplete_parser)
+    @users_namespace.response(200, "Success", [user_suggestion])
+    @users_namespace.response(400, "Sorry. A prefix is required.")
+    def get(self):
+        args = autocomplete_parser.parse_args()
+        prefix = (args.get("prefix") or "").strip()
+
+        if not prefix:
+            users_namespace.abort(400, "Sorry. A prefix is required.")
+
+        suggestions = [
+            {"id": user_id, "username": username, "email": email}
+            for user_id, username, email in autocomplete.search(
+                prefix, args.get("limit")
+            )
+        ]
+        return marshal(suggestions, user_suggestion), 200
+
+
+class UsersStats(Resource):
+    @users_namespace.expect(stats_parser)
+    @users_namespace.response(200, "Success", user_stats)
+    @users_namespace.response(400, "Sorry. Invalid date range.")
+    def get(self):
+        args = stats_parser.parse_args()
+        until = (args.get("until") or datetime.datetime.utcnow()).date()
+        since = args.get("since")
+        since = since.date() if since else until - datetime.timedelta(days=30)
+        bucket = args.get("bucket")
+        limit = current_app.config.get("USER_STATS_MAX_PERIODS")
+
+        if since > until:
+            users_namespace.abort(400, "Sorry. Invalid date range.")
+        if period_count(since, until, bucket) > limit:
+            users_namespace.abort(
+                400, f"Sorry. At most {limit} periods can be requested."
+            )
+
+        days, total = get_user_stats(since, until)
+        stats = {
+            "bucket": bucket,
+            "periods": bucket_stats(days, since, until, bucket),
+            "total": total,
+        }
+        return marshal(stats, user_stats), 200
+
+
 class Users(Resource):
-    @users_namespace.marshal_with(user)
-    @users_namespace.response(200, "Success")
+    @users_namespace.expect(fields_parser)
+    @users_namespace.response(200, "Success", user)
+    @users_namespace.response(400, FIELDS_MESSAGE)
     @users_namespace.response(404, "User <user_id> does not exist")
     def get(self, user_id: int):
-        user = get_user_by_id(user_id)
+        fields = requested_fields(fields_parser.parse_args().get("fields"))
+        found = get_user_by_id(user_id, columns=fields)
 
-        if not user:
+        if not found:
             users_namespace.abort(404, f"User {user_id} does not exist")
 
-        return user, 200
+        return marshal(found, user_fields(fields)), 200
 
     @users_namespace.expect(user, validate=True)
     @users_namespace.response(200, "<user_id> was updated!")
@@ -81,11 +292,15 @@ class Users(Resource):
         if not user:
             users_namespace.abort(404, f"User {user_id} does not exist")
 
-        if get_user_by_email(email):
+        if email_filter.exists(email, get_user_by_email):
             response_object["message"] = "Sorry. That email already exists."
             return response_object, 400
 
-        update_user(user, username, email)
+        try:
+            update_user(user, username, email)
+        except IntegrityError:
+            response_object["message"] = "Sorry. That email already exists."
+            return response_object, 400
 
         response_object["message"] = f"{user.id} was updated!"
         return response_object, 200
@@ -106,4 +321,7 @@ class Users(Resource):
 
 
 users_namespace.add_resource(UsersList, "")
+users_namespace.add_resource(UsersLookup, "/lookup")
+users_namespace.add_resource(UsersAutocomplete, "/autocomplete")
+users_namespace.add_resource(UsersStats, "/stats")
 users_namespace.add_resource(Users, "/<int:user_id>")
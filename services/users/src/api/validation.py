@@ -0,0 +1,42 @@
+from http import HTTPStatus
+
+import fastjsonschema
+from flask_restx import abort
+from jsonschema import Draft4Validator
+
+
+def compile_validators(api):
+    """Compile every model's JSON schema once instead of on each request.
+
+    flask-restx builds a fresh ``Draft4Validator`` for every ``expect(...,
+    validate=True)`` request. Here each model gets a validator generated by
+    fastjsonschema up front. Payloads it rejects are re-checked by a cached
+    ``Draft4Validator``, which has the final say and keeps the flask-restx
+    error format.
+    """
+    definitions = {name: model.__schema__ for name, model in api.models.items()}
+    for model in api.models.values():
+        model.validate = compiled_validator(model, definitions, api.format_checker)
+
+
+def compiled_validator(model, definitions: dict, format_checker=None):
+    schema = {**model.__schema__, "definitions": definitions}
+    fast_validate = fastjsonschema.compile(schema)
+    validator = Draft4Validator(schema, format_checker=format_checker)
+
+    def validate(data, resolver=None, format_checker=None):
+        try:
+            fast_validate(data)
+            return
+        except fastjsonschema.JsonSchemaException:
+            pass
+
+        errors = dict(model.format_error(e) for e in validator.iter_errors(data))
+        if errors:
+            abort(
+                HTTPStatus.BAD_REQUEST,
+                message="Input payload validation failed",
+                errors=errors,
+            )
+
+    return validate
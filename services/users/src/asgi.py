@@ -0,0 +1,313 @@
+"""Async variant of the users and auth APIs.
+
+Serves the same routes and payloads as the Flask app, but reads on an event
+loop with an asyncpg-backed async session, so a request waiting on Postgres
+does not hold a worker thread. bcrypt runs in the default executor to keep the
+loop responsive. Writes go through ``crud.py`` on a thread, inside the Flask
+app, so they record events, counts and index updates like the sync API.
+
+It also serves the ``/users/events`` stream, which the Flask app does not:
+each open stream is a coroutine rather than a thread. Run it with::
+
+    gunicorn -k uvicorn.workers.UvicornWorker "src.asgi:create_app()"
+"""
+import asyncio
+import datetime
+
+import bcrypt
+import jwt
+from flask import Flask
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from src.api.users import crud
+from src.api.users.models import User
+from src.api.users.passwords import BREACHED_MESSAGE, breached_passwords
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+users = User.__table__
+
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+class PayloadError(Exception):
+    def __init__(self, errors: dict):
+        self.errors = errors
+
+
+def serialize(row) -> dict:
+    return {
+        "id": row.id,
+        "username": row.username,
+        "email": row.email,
+        "created_date": row.created_date.isoformat(),
+    }
+
+
+async def validate(request: Request, *required: str) -> dict:
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = {}
+
+    errors = {
+        field: f"'{field}' is a required property"
+        for field in required
+        if not isinstance(data.get(field), str)
+    }
+    if errors:
+        raise PayloadError(errors)
+    return data
+
+
+async def check_password(hashed: str, password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(
+        None, bcrypt.checkpw, password.encode(), hashed.encode()
+    )
+
+
+def encode_token(config, user_id: int, token_type: str) -> str:
+    if token_type == "access":
+        seconds = config["ACCESS_TOKEN_EXPIRATION"]
+    else:
+        seconds = config["REFRESH_TOKEN_EXPIRATION"]
+
+    now = datetime.datetime.utcnow()
+    payload = {
+        "exp": now + datetime.timedelta(seconds=seconds),
+        "iat": now,
+        "sub": user_id,
+    }
+    return jwt.encode(payload, config["SECRET_KEY"], algorithm="HS256")
+
+
+def tokens(config, user_id: int) -> dict:
+    return {
+        "access_token": encode_token(config, user_id, "access"),
+        "refresh_token": encode_token(config, user_id, "refresh"),
+    }
+
+
+def user_from_token(config, token: str) -> int:
+    try:
+        return jwt.decode(token, config["SECRET_KEY"], algorithms="HS256")["sub"]
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(401, "Signature expired. Please log in again.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(401, "Invalid token. Please log in again.")
+
+
+def is_breached(config, password: str) -> bool:
+    return breached_passwords.is_breached(
+        password, path=config.get("BREACHED_PASSWORDS_FILTER") or ""
+    )
+
+
+async def get_user(session: AsyncSession, **criteria):
+    query = select(users).where(users.c.active)
+    for column, value in criteria.items():
+        query = query.where(users.c[column] == value)
+    return (await session.execute(query.limit(1))).first()
+
+
+async def write(request: Request, function, *args):
+    """Run the ``crud.py`` helper ``function`` on a thread inside the Flask
+    app. Returns ``False`` if it hit the unique email index."""
+    flask_app = request.app.state.flask_app
+
+    def call():
+        with flask_app.app_context():
+            return function(*args)
+
+    try:
+        return await run_in_threadpool(call)
+    except IntegrityError:
+        return False
+
+
+def _update_user(user_id: int, username: str, email: str):
+    user = crud.get_user_by_id(user_id)
+    return user and crud.update_user(user, username, email)
+
+
+def _delete_user(user_id: int):
+    user = crud.get_user_by_id(user_id)
+    return user and crud.delete_user(user)
+
+
+async def users_list(request: Request):
+    config = request.app.state.config
+    async with request.app.state.Session() as session:
+        if request.method == "GET":
+            result = await session.execute(select(users).where(users.c.active))
+            return JSONResponse([serialize(row) for row in result])
+
+        data = await validate(request, "username", "email", "password")
+        if is_breached(config, data["password"]):
+            return JSONResponse({"message": BREACHED_MESSAGE}, 400)
+        if await get_user(session, email=data["email"]):
+            return JSONResponse({"message": "Sorry. That email already exists."}, 400)
+    created = await write(
+        request, crud.create_user, data["username"], data["email"], data["password"]
+    )
+    if created is False:
+        return JSONResponse({"message": "Sorry. That email already exists."}, 400)
+    return JSONResponse({"message": f"{data['email']} was added!"}, 201)
+
+
+async def users_detail(request: Request):
+    user_id = request.path_params["user_id"]
+    async with request.app.state.Session() as session:
+        user = await get_user(session, id=user_id)
+        if not user:
+            raise HTTPException(404, f"User {user_id} does not exist")
+
+        if request.method == "GET":
+            return JSONResponse(serialize(user))
+
+        if request.method == "PUT":
+            data = await validate(request, "username", "email")
+            if await get_user(session, email=data["email"]):
+                return JSONResponse(
+                    {"message": "Sorry. That email already exists."}, 400
+                )
+
+    if request.method == "PUT":
+        updated = await write(
+            request, _update_user, user_id, data["username"], data["email"]
+        )
+        if updated is False:
+            return JSONResponse({"message": "Sorry. That email already exists."}, 400)
+        if not updated:
+            raise HTTPException(404, f"User {user_id} does not exist")
+        return JSONResponse({"message": f"{user_id} was updated!"})
+
+    if not await write(request, _delete_user, user_id):
+        raise HTTPException(404, f"User {user_id} does not exist")
+    return JSONResponse({"message": f"{user.email} was removed!"})
+
+
+async def register(request: Request):
+    data = await validate(request, "username", "email", "password")
+    if is_breached(request.app.state.config, data["password"]):
+        raise HTTPException(400, BREACHED_MESSAGE)
+    async with request.app.state.Session() as session:
+        if await get_user(session, email=data["email"]):
+            raise HTTPException(400, "Sorry. That email already exists.")
+    created = await write(
+        request, crud.create_user, data["username"], data["email"], data["password"]
+    )
+    if created is False:
+        raise HTTPException(400, "Sorry. That email already exists.")
+    return JSONResponse({"username": data["username"], "email": data["email"]}, 201)
+
+
+async def login(request: Request):
+    data = await validate(request, "email", "password")
+    async with request.app.state.Session() as session:
+        user = await get_user(session, email=data["email"])
+    if not user or not await check_password(user.password, data["password"]):
+        raise HTTPException(404, "User does not exist")
+    return JSONResponse(tokens(request.app.state.config, user.id))
+
+
+async def refresh(request: Request):
+    config = request.app.state.config
+    data = await validate(request, "refresh_token")
+    user_id = user_from_token(config, data["refresh_token"])
+    async with request.app.state.Session() as session:
+        user = await get_user(session, id=user_id)
+    if not user:
+        raise HTTPException(401, "Invalid token")
+    return JSONResponse(tokens(config, user.id))
+
+
+async def status(request: Request):
+    auth_header = request.headers.get("Authorization")
+    if not auth_header:
+        raise HTTPException(403, "Token required")
+
+    user_id = user_from_token(request.app.state.config, auth_header.split(" ")[-1])
+    async with request.app.state.Session() as session:
+        user = await get_user(session, id=user_id)
+    if not user:
+        raise HTTPException(401, "Invalid token")
+    return JSONResponse({"username": user.username, "email": user.email})
+
+
+async def events(request: Request):
+    last_event_id = request.headers.get(
+        "Last-Event-ID", request.query_params.get("last_event_id")
+    )
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            raise HTTPException(400, "Sorry. Invalid event id.")
+
+    return StreamingResponse(
+        request.app.state.user_events.subscribe(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def http_error(request: Request, exc: HTTPException):
+    return JSONResponse({"message": exc.detail}, exc.status_code)
+
+
+async def payload_error(request: Request, exc: PayloadError):
+    return JSONResponse(
+        {"errors": exc.errors, "message": "Input payload validation failed"}, 400
+    )
+
+
+def create_app(flask_app: Flask = None) -> Starlette:
+    """Build the async app on the config and database of ``flask_app``,
+    by default the one ``APP_SETTINGS`` selects."""
+    if flask_app is None:
+        from src import create_app as create_flask_app
+
+        flask_app = create_flask_app()
+
+    config = flask_app.config
+    engine = create_async_engine(async_url(config["SQLALCHEMY_DATABASE_URI"]))
+    app = Starlette(
+        routes=[
+            Route("/users", users_list, methods=["GET", "POST"]),
+            Route("/users/events", events, methods=["GET"]),
+            Route(
+                "/users/{user_id:int}", users_detail, methods=["GET", "PUT", "DELETE"]
+            ),
+            Route("/auth/register", register, methods=["POST"]),
+            Route("/auth/login", login, methods=["POST"]),
+            Route("/auth/refresh", refresh, methods=["POST"]),
+            Route("/auth/status", status, methods=["GET"]),
+        ],
+        exception_handlers={HTTPException: http_error, PayloadError: payload_error},
+        on_shutdown=[engine.dispose],
+    )
+    app.state.flask_app = flask_app
+    app.state.config = config
+    app.state.user_events = flask_app.extensions["user_events"]
+    app.state.Session = sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+    return app
@@ -0,0 +1,238 @@
+import glob
+import http.client
+import json
+import os
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples: list, elapsed: float, errors: int = 0) -> dict:
+    """Summarize latency samples (seconds) collected over ``elapsed`` seconds."""
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def time_per_call(func, iterations: int) -> float:
+    """Return the mean wall time of ``func()`` in microseconds."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def http_load(
+    url: str,
+    concurrency: int,
+    duration: float,
+    method: str = "GET",
+    body: str = None,
+    headers: dict = None,
+) -> dict:
+    """Hammer ``url`` from ``concurrency`` keep-alive connections.
+
+    Each connection sends its next request as soon as the previous response
+    arrives, so the result is the throughput the server sustains with that
+    many concurrent clients.
+    """
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    headers = {"Content-Type": "application/json", **(headers or {})}
+    samples, errors = [], []
+    deadline = time.perf_counter() + duration
+
+    def client():
+        local_samples, local_errors = [], 0
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    local_errors += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection(
+                    parts.hostname, parts.port or 80
+                )
+                continue
+            local_samples.append(time.perf_counter() - started)
+        connection.close()
+        samples.extend(local_samples)
+        errors.append(local_errors)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(samples, time.perf_counter() - started, sum(errors))
+
+
+def capture_files(paths: list) -> list:
+    """Expand each of ``paths`` to the file itself, if any, plus the
+    per-worker ``<path>.<pid>`` files and their rotations."""
+    files = []
+    for path in paths:
+        matches = sorted(glob.glob(f"{glob.escape(path)}.*"))
+        if os.path.isfile(path):
+            matches.insert(0, path)
+        files.extend(match for match in matches if match not in files)
+    return files
+
+
+def load_capture(paths: list) -> list:
+    """Read captured requests from ``paths`` (see :func:`capture_files`)."""
+    records = []
+    for path in capture_files(paths):
+        with open(path) as capture:
+            records.extend(json.loads(line) for line in capture if line.strip())
+    return sorted(records, key=lambda record: record["t"])
+
+
+def synthesize(shape, key: str = None, fills: dict = None, serial: int = 0):
+    """Build a value matching a captured ``shape``.
+
+    ``fills`` supplies real values by key (credentials, tokens); anything
+    else becomes filler of the captured length, with emails made unique by
+    ``serial`` so replayed registrations do not collide.
+    """
+    fills = fills or {}
+    if isinstance(shape, list):
+        return [synthesize(item, key, fills, serial) for item in shape]
+    if not isinstance(shape, dict):
+        return shape
+    if len(shape) == 1 and next(iter(shape)) in ("secret", "email", "str"):
+        kind, length = next(iter(shape.items()))
+        if key in fills:
+            return fills[key]
+        if kind == "email":
+            return f"replay-{serial}@example.com"
+        if isinstance(length, list):
+            return ["x" * item for item in length]
+        return "x" * length
+    return {name: synthesize(item, name, fills, serial) for name, item in shape.items()}
+
+
+def replay(
+    records: list,
+    base_url: str,
+    speed: float = 1.0,
+    max_inflight: int = 256,
+    credentials: tuple = None,
+) -> dict:
+    """Replay captured ``records`` against ``base_url``, open loop.
+
+    Each request is sent at its captured offset divided by ``speed``,
+    whether or not earlier ones have finished, and its latency is measured
+    from that scheduled time, so a server that falls behind shows it in the
+    distribution instead of slowing the load down. With ``credentials``
+    (email, password), logins use them and bearer tokens and refresh tokens
+    come from logging in once up front. Returns a summary per route.
+    """
+    parts = urlsplit(base_url)
+    local = threading.local()
+    fills = {}
+    if credentials:
+        email, password = credentials
+        tokens = _send_json(
+            parts,
+            local,
+            "POST",
+            "/auth/login",
+            {"email": email, "password": password},
+            {},
+        )[1]
+        fills = {"password": password, **tokens}
+
+    samples, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+
+    def send(serial: int, record: dict, due: float):
+        path = record["route"]
+        for name, value in (record.get("view_args") or {}).items():
+            path = re.sub(rf"<(?:[^:<>]+:)?{name}>", str(value), path)
+        query = synthesize(record.get("query") or {}, fills=fills, serial=serial)
+        if query:
+            path += "?" + urlencode(query)
+        body_fills = dict(fills)
+        if record["route"] == "/auth/login" and credentials:
+            body_fills["email"] = credentials[0]
+        body = record.get("body")
+        if body is not None:
+            body = synthesize(body, fills=body_fills, serial=serial)
+        headers = {}
+        if record.get("bearer"):
+            headers["Authorization"] = f"Bearer {fills.get('access_token', 'replay')}"
+
+        try:
+            status, _ = _send_json(parts, local, record["method"], path, body, headers)
+            failed = status >= 500
+        except (OSError, http.client.HTTPException):
+            local.connection = None
+            failed = True
+        latency = time.perf_counter() - due
+        with lock:
+            if failed:
+                errors[record["route"]] += 1
+            else:
+                samples[record["route"]].append(latency)
+
+    started = time.perf_counter()
+    first = records[0]["t"] if records else 0
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for serial, record in enumerate(records):
+            due = started + (record["t"] - first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, serial, record, due)
+    elapsed = time.perf_counter() - started
+
+    routes = sorted(set(samples) | set(errors))
+    return {
+        route: summarize(samples[route], elapsed, errors[route]) for route in routes
+    }
+
+
+def _send_json(parts, local, method: str, path: str, body, headers: dict):
+    connection = getattr(local, "connection", None)
+    if connection is None:
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        local.connection = connection
+    payload = None if body is None else json.dumps(body)
+    connection.request(
+        method,
+        path,
+        body=payload,
+        headers={"Content-Type": "application/json", **headers},
+    )
+    response = connection.getresponse()
+    data = response.read()
+    try:
+        return response.status, json.loads(data or b"null") or {}
+    except ValueError:
+        return response.status, {}
@@ -0,0 +1,84 @@
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+MAGIC = b"BLOOM001"
+HEADER = struct.Struct("<8sQI4x")
+
+
+class BloomFilter:
+    """Bloom filter over 20-byte SHA-1 digests, stored as a flat bit array.
+
+    Keys are already uniformly distributed digests, so the ``k`` bit
+    positions come from double hashing two 64-bit slices of the digest
+    rather than from ``k`` separate hash functions. On disk the file is a
+    small header followed by the bits, so :meth:`open` can ``mmap`` it
+    read-only and every process reading it shares one page-cache copy.
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, bits):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits
+
+    @staticmethod
+    def digest(value: str) -> bytes:
+        return hashlib.sha1(value.encode()).digest()
+
+    @staticmethod
+    def parameters(capacity: int, error_rate: float) -> tuple:
+        """Return the ``(num_bits, num_hashes)`` that hold ``capacity`` keys
+        with a false positive rate of ``error_rate``."""
+        capacity = max(1, capacity)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_bits = (num_bits + 7) // 8 * 8
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return num_bits, num_hashes
+
+    @classmethod
+    def create(cls, capacity: int, error_rate: float = 1e-3):
+        num_bits, num_hashes = cls.parameters(capacity, error_rate)
+        return cls(num_bits, num_hashes, bytearray(num_bits // 8))
+
+    @classmethod
+    def open(cls, path: str):
+        with open(path, "rb") as file:
+            bits = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, num_bits, num_hashes = HEADER.unpack_from(bits)
+        if magic != MAGIC or len(bits) != HEADER.size + num_bits // 8:
+            bits.close()
+            raise ValueError(f"{path} is not a Bloom filter file.")
+        offset = HEADER.size
+        return cls(num_bits, num_hashes, memoryview(bits)[offset:])
+
+    def save(self, path: str):
+        # Replace the file atomically; workers keep their mapping of the old one.
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(MAGIC, self.num_bits, self.num_hashes))
+            file.write(self.bits)
+        os.replace(temporary, path)
+
+    def add(self, digest: bytes):
+        bits, num_bits = self.bits, self.num_bits
+        position = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:16], "little") | 1
+        for _ in range(self.num_hashes):
+            bit = position % num_bits
+            bits[bit >> 3] |= 1 << (bit & 7)
+            position += step
+
+    def __contains__(self, digest: bytes) -> bool:
+        # Inlined rather than shared with ``add``: most lookups miss, and
+        # stop at the first clear bit.
+        bits, num_bits = self.bits, self.num_bits
+        position = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:16], "little") | 1
+        for _ in range(self.num_hashes):
+            bit = position % num_bits
+            if not bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+            position += step
+        return True
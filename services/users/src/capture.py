@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from flask import current_app, g, request
+
+# Keys whose values are never written, not even their shape beyond a length.
+SECRET_KEYS = {"password", "access_token", "refresh_token", "token", "tokens"}
+LITERAL = re.compile(r"[0-9,]*")
+# Query parameters taking field names, enum choices or dates: kept verbatim,
+# since a placeholder of the same length would fail validation on replay.
+LITERAL_QUERY = {"fields", "bucket", "since", "until"}
+
+
+def shape(value, key: str = None):
+    """Describe ``value`` without revealing it.
+
+    Numbers and id lists (``"1,2,3"``) are kept so a replay hits the same
+    code paths; other strings, and anything under a secret key, are reduced
+    to their kind and length.
+    """
+    if key in SECRET_KEYS:
+        if isinstance(value, list):
+            return {"secret": [len(str(item)) for item in value]}
+        return {"secret": len(str(value))}
+    if isinstance(value, dict):
+        return {name: shape(item, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [shape(item) for item in value]
+    if isinstance(value, str):
+        if LITERAL.fullmatch(value):
+            return value
+        return {"email" if "@" in value else "str": len(value)}
+    return value
+
+
+def shape_query(args: dict) -> dict:
+    """Like :func:`shape`, but keep the values of ``LITERAL_QUERY`` parameters."""
+    return {
+        name: value if name in LITERAL_QUERY else shape(value, name)
+        for name, value in args.items()
+    }
+
+
+class TrafficCapture:
+    """Opt-in sampling of requests to rotating JSON-lines files.
+
+    With ``CAPTURE_ENABLED``, a ``CAPTURE_SAMPLE_RATE`` fraction of requests
+    is written as the method, route template, view arguments, body and
+    query shapes (see :func:`shape` and :func:`shape_query`), whether a
+    bearer token was sent, status and duration. Rotating files are not safe
+    to share between processes, so each worker writes
+    ``<CAPTURE_PATH>.<pid>``, opened on its first capture.
+    ``manage.py replay`` plays the files back.
+    """
+
+    def __init__(self, app=None):
+        # A private logger, so captures never reach the application log.
+        self.logger = logging.Logger("src.capture", logging.INFO)
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CAPTURE_ENABLED", False)
+        app.config.setdefault("CAPTURE_SAMPLE_RATE", 0.01)
+        app.config.setdefault("CAPTURE_PATH", "captures/traffic.jsonl")
+        app.config.setdefault("CAPTURE_MAX_BYTES", 50 * 2**20)
+        app.config.setdefault("CAPTURE_BACKUP_COUNT", 5)
+        app.extensions["capture"] = self
+        if not app.config["CAPTURE_ENABLED"]:
+            return
+
+        os.makedirs(os.path.dirname(app.config["CAPTURE_PATH"]) or ".", exist_ok=True)
+        # ``manage.py`` creates more than one app; the last one reopens.
+        self._pid = None
+        app.before_request(self._start)
+        app.after_request(self._record)
+
+    def _start(self):
+        if random.random() < current_app.config["CAPTURE_SAMPLE_RATE"]:
+            g.capture_started = (time.time(), time.perf_counter())
+
+    def _record(self, response):
+        started = g.pop("capture_started", None)
+        if started is None or request.url_rule is None:
+            return response
+
+        body = request.get_json(silent=True) if request.is_json else None
+        record = {
+            "t": started[0],
+            "method": request.method,
+            "route": request.url_rule.rule,
+            "view_args": shape(request.view_args or {}),
+            "query": shape_query(request.args.to_dict()),
+            "body": shape(body) if body is not None else None,
+            "bearer": request.headers.get("Authorization", "").startswith("Bearer "),
+            "status": response.status_code,
+            "duration_ms": (time.perf_counter() - started[1]) * 1000,
+        }
+        self._open()
+        self.logger.info(json.dumps(record, separators=(",", ":")))
+        return response
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            config = current_app.config
+            handler = RotatingFileHandler(
+                f"{config['CAPTURE_PATH']}.{os.getpid()}",
+                maxBytes=config["CAPTURE_MAX_BYTES"],
+                backupCount=config["CAPTURE_BACKUP_COUNT"],
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            # Drop a writer inherited from the parent or an earlier app.
+            for previous in list(self.logger.handlers):
+                self.logger.removeHandler(previous)
+                previous.close()
+            self.logger.addHandler(handler)
+            self._pid = os.getpid()
+
+
+capture = TrafficCapture()
@@ -0,0 +1,131 @@
+import json
+import threading
+import time
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from src.metrics import metrics
+
+
+class ConcurrencyLimiter:
+    """WSGI middleware that sheds load instead of queueing it.
+
+    The worker admits at most ``limit`` requests at a time. The limit adapts
+    AIMD-style, and only while the worker is busy: when a route's recent
+    latency (an average over about ``CONCURRENCY_SHORT_WINDOW`` responses)
+    exceeds ``CONCURRENCY_LATENCY_TOLERANCE`` times its long-run latency
+    (about ``CONCURRENCY_LONG_WINDOW`` responses), the limit is cut by
+    ``CONCURRENCY_BACKOFF``; otherwise it grows by about one per round trip.
+    An idle worker leaves the limit alone, since its slow responses are not
+    caused by queueing.
+
+    Each route has a priority class (``CONCURRENCY_PRIORITIES``), and each
+    class may only use its share of the limit (``CONCURRENCY_SHARES``), so
+    cheap, critical routes keep being served after bulk and expensive routes
+    start getting ``503`` responses with ``Retry-After``.
+    """
+
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        config = app.config
+        config.setdefault("CONCURRENCY_INITIAL_LIMIT", 20)
+        config.setdefault("CONCURRENCY_MIN_LIMIT", 4)
+        config.setdefault("CONCURRENCY_MAX_LIMIT", 200)
+        config.setdefault("CONCURRENCY_LATENCY_TOLERANCE", 2.0)
+        config.setdefault("CONCURRENCY_BACKOFF", 0.9)
+        config.setdefault("CONCURRENCY_SHORT_WINDOW", 10)
+        config.setdefault("CONCURRENCY_LONG_WINDOW", 500)
+        config.setdefault("CONCURRENCY_RETRY_AFTER", 1)
+        config.setdefault("CONCURRENCY_PRIORITIES", {})
+        config.setdefault(
+            "CONCURRENCY_SHARES", {"critical": 1.0, "normal": 0.8, "sheddable": 0.5}
+        )
+        self.limit = float(config["CONCURRENCY_INITIAL_LIMIT"])
+        self._inflight = 0
+        self._latencies = {}
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        endpoint = self._endpoint(environ)
+        priority = self.priority_for(method, endpoint)
+
+        if not self._acquire(priority):
+            metrics.inc("requests_shed_total", priority=priority)
+            return self._reject(start_response)
+
+        started = time.perf_counter()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            self._release(endpoint, time.perf_counter() - started)
+
+    def priority_for(self, method: str, endpoint: str) -> str:
+        priorities = self.app.config["CONCURRENCY_PRIORITIES"]
+        return priorities.get(
+            f"{method} {endpoint}", priorities.get(endpoint, "normal")
+        )
+
+    def _endpoint(self, environ) -> str:
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except (HTTPException, RequestRedirect):
+            return "unmatched"
+        return endpoint
+
+    def _acquire(self, priority: str) -> bool:
+        share = self.app.config["CONCURRENCY_SHARES"].get(priority, 1.0)
+        with self._lock:
+            if self._inflight >= max(1.0, self.limit * share):
+                return False
+            self._inflight += 1
+            inflight = self._inflight
+        metrics.set("concurrency_inflight", inflight)
+        return True
+
+    def _release(self, endpoint, latency: float):
+        config = self.app.config
+        now = time.monotonic()
+        with self._lock:
+            busy = self._inflight >= self.limit / 2
+            self._inflight -= 1
+
+            short, long = self._latencies.get(endpoint, (latency, latency))
+            short += (latency - short) / config["CONCURRENCY_SHORT_WINDOW"]
+            long += (latency - long) / config["CONCURRENCY_LONG_WINDOW"]
+            self._latencies[endpoint] = (short, long)
+
+            if busy and short > long * config["CONCURRENCY_LATENCY_TOLERANCE"]:
+                # Back off at most once per round trip of the slow request.
+                if now - self._last_decrease >= latency:
+                    self.limit = max(
+                        config["CONCURRENCY_MIN_LIMIT"],
+                        self.limit * config["CONCURRENCY_BACKOFF"],
+                    )
+                    self._last_decrease = now
+            elif busy:
+                self.limit = min(
+                    config["CONCURRENCY_MAX_LIMIT"], self.limit + 1 / self.limit
+                )
+            limit, inflight = self.limit, self._inflight
+
+        metrics.set("concurrency_limit", limit)
+        metrics.set("concurrency_inflight", inflight)
+        metrics.observe("request_seconds", latency, endpoint=endpoint)
+
+    def _reject(self, start_response):
+        body = json.dumps(
+            {"message": "Sorry. The service is overloaded, please retry shortly."}
+        ).encode()
+        start_response(
+            "503 SERVICE UNAVAILABLE",
+            [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(body))),
+                ("Retry-After", str(self.app.config["CONCURRENCY_RETRY_AFTER"])),
+            ],
+        )
+        return [body]
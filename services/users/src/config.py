@@ -1,6 +1,15 @@
 import os
 
 
+def database_binds(prefix, urls):
+    """Map a comma separated list of database URLs to ``SQLALCHEMY_BINDS``."""
+    urls = [url.strip() for url in (urls or "").split(",") if url.strip()]
+    return {
+        f"{prefix}_{i}": url.replace("postgres://", "postgresql://", 1)
+        for i, url in enumerate(urls)
+    }
+
+
 class BaseConfig:
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -8,6 +17,92 @@ class BaseConfig:
     BCRYPT_LOG_ROUNDS = 13
     ACCESS_TOKEN_EXPIRATION = 900
     REFRESH_TOKEN_EXPIRATION = 2592000
+    SQLALCHEMY_BINDS = {
+        **database_binds("replica", os.environ.get("DATABASE_REPLICA_URLS")),
+        **database_binds("shard", os.environ.get("DATABASE_SHARD_URLS")),
+    }
+    # gunicorn's threads per worker; each may hold a pooled connection, and
+    # the overflow covers background threads (listeners, flushes, syncs).
+    WORKER_THREADS = int(os.environ.get("GUNICORN_THREADS", "32"))
+    SQLALCHEMY_ENGINE_OPTIONS = {"pool_size": WORKER_THREADS, "max_overflow": 8}
+    READ_YOUR_WRITES_SECONDS = 5
+    REPLICA_RETRY_INTERVAL = 30
+    USERS_LOOKUP_MAX = 100
+    IDEMPOTENCY_KEY_TTL = 86400
+    IDEMPOTENCY_PENDING_TIMEOUT = 60
+    LOGIN_EVENTS_FLUSH_INTERVAL = 1000
+    LOGIN_EVENTS_FLUSH_SIZE = 500
+    LOGIN_EVENTS_MAX_BUFFERED = 10000
+    VALIDATION_MODE = "compiled"
+    INTROSPECT_MAX_TOKENS = 100
+    VERIFY_CACHE_SECONDS = 30
+    BREACHED_PASSWORDS_FILTER = os.environ.get("BREACHED_PASSWORDS_FILTER")
+    CAPTURE_ENABLED = os.environ.get("CAPTURE_ENABLED", "off") == "on"
+    CAPTURE_SAMPLE_RATE = float(os.environ.get("CAPTURE_SAMPLE_RATE", "0.01"))
+    CAPTURE_PATH = os.environ.get("CAPTURE_PATH", "captures/traffic.jsonl")
+    CAPTURE_MAX_BYTES = 50 * 2**20
+    CAPTURE_BACKUP_COUNT = 5
+    JOB_POLL_INTERVAL = 1
+    # Running jobs refresh their lease this often; a lease untouched for
+    # JOB_LOCK_TIMEOUT seconds means the worker died.
+    JOB_HEARTBEAT_INTERVAL = 60
+    JOB_LOCK_TIMEOUT = 600
+    JOB_BACKOFF_BASE = 5
+    JOB_BACKOFF_MAX = 600
+    SHARD_BUCKETS = 1024
+    SHARD_MAP_TTL = 30
+    SHARD_PAGE_SIZE = 1000
+    # PREPARE'd statements do not survive PgBouncer transaction pooling.
+    PREPARED_STATEMENTS = os.environ.get("PREPARED_STATEMENTS", "on") != "off"
+    CONCURRENCY_INITIAL_LIMIT = 20
+    CONCURRENCY_MIN_LIMIT = 4
+    CONCURRENCY_MAX_LIMIT = 200
+    CONCURRENCY_LATENCY_TOLERANCE = 2.0
+    CONCURRENCY_BACKOFF = 0.9
+    # Responses averaged into a route's recent and long-run latency.
+    CONCURRENCY_SHORT_WINDOW = 10
+    CONCURRENCY_LONG_WINDOW = 500
+    CONCURRENCY_RETRY_AFTER = 1
+    # Keyed by "METHOD endpoint" or endpoint; anything else is "normal".
+    CONCURRENCY_PRIORITIES = {
+        "auth_status": "critical",
+        "auth_verify": "critical",
+        "GET users_users": "critical",
+        "metrics_endpoint": "critical",
+        "ready_endpoint": "critical",
+        "auth_register": "sheddable",
+        "POST users_users_list": "sheddable",
+        "users_users_lookup": "sheddable",
+        "auth_introspect": "sheddable",
+    }
+    DEADLINE_DEFAULT_MS = 10000
+    DEADLINE_HEADER = "X-Request-Deadline"
+    # Milliseconds, keyed like CONCURRENCY_PRIORITIES.
+    DEADLINES = {
+        "auth_status": 2000,
+        "auth_verify": 1000,
+        "GET users_users": 2000,
+        "GET users_users_list": 30000,
+        "users_users_autocomplete": 1000,
+        "users_users_lookup": 5000,
+    }
+    AUTOCOMPLETE_SYNC_INTERVAL = 30
+    AUTOCOMPLETE_SYNC_OVERLAP = 5
+    AUTOCOMPLETE_MAX_RESULTS = 10
+    USER_EVENTS_POLL_INTERVAL = 5
+    USER_EVENTS_BUFFER = 1000
+    USER_EVENTS_KEEPALIVE = 15
+    USER_EVENTS_STREAM_SECONDS = 300
+    USER_EVENTS_RETENTION = 86400
+    USER_STATS_MAX_PERIODS = 1000
+    EMAIL_FILTER_ENABLED = True
+    EMAIL_FILTER_ERROR_RATE = 0.01
+    EMAIL_FILTER_HEADROOM = 2.0
+    EMAIL_FILTER_MIN_CAPACITY = 10000
+    EMAIL_FILTER_SYNC_INTERVAL = 30
+    EMAIL_FILTER_SYNC_OVERLAP = 5
+    EMAIL_FILTER_REBUILD_INTERVAL = 3600
+    CONCURRENCY_SHARES = {"critical": 1.0, "normal": 0.8, "sheddable": 0.5}
 
 
 class DevelopmentConfig(BaseConfig):
@@ -18,9 +113,15 @@ class DevelopmentConfig(BaseConfig):
 class TestingConfig(BaseConfig):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_TEST_URL")
+    SQLALCHEMY_BINDS = {}
+    # SQLite's pools take no size.
+    SQLALCHEMY_ENGINE_OPTIONS = {}
     BCRYPT_LOG_ROUNDS = 4
     ACCESS_TOKEN_EXPIRATION = 3
     REFRESH_TOKEN_EXPIRATION = 3
+    LOGIN_EVENTS_FLUSH_INTERVAL = 60000
+    USER_EVENTS_POLL_INTERVAL = 60
+    EMAIL_FILTER_ENABLED = False
 
 
 class ProductionConfig(BaseConfig):
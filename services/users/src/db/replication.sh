@@ -0,0 +1,4 @@
+#!/bin/sh
+
+# allow streaming replicas on the compose network to connect
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
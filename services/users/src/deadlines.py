@@ -0,0 +1,99 @@
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from werkzeug.exceptions import GatewayTimeout
+
+from src.metrics import metrics
+
+# SQLSTATE of a statement cancelled by ``statement_timeout``.
+QUERY_CANCELED = "57014"
+
+
+class DeadlineExceeded(GatewayTimeout):
+    description = "Sorry. The request took too long."
+
+
+class Deadlines:
+    """Give every request a time budget and have Postgres enforce it.
+
+    The budget comes from ``DEADLINES`` (milliseconds, keyed by
+    ``"METHOD endpoint"`` or endpoint) or ``DEADLINE_DEFAULT_MS``, and a
+    caller such as nginx may shorten it, never extend it, with the
+    ``DEADLINE_HEADER`` header. Each transaction a request begins runs
+    ``SET LOCAL statement_timeout`` with the time left, so the server
+    cancels work nobody is waiting for, and the request ends with ``504``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("DEADLINE_DEFAULT_MS", 10000)
+        app.config.setdefault("DEADLINE_HEADER", "X-Request-Deadline")
+        app.config.setdefault("DEADLINES", {})
+        app.extensions["deadlines"] = self
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        if not event.contains(Session, "after_begin", _apply_timeout):
+            event.listen(Session, "after_begin", _apply_timeout)
+            event.listen(Engine, "handle_error", _translate_cancel)
+
+    def budget_for(self, method: str, endpoint: str) -> int:
+        config = current_app.config
+        deadlines = config["DEADLINES"]
+        return deadlines.get(
+            f"{method} {endpoint}",
+            deadlines.get(endpoint, config["DEADLINE_DEFAULT_MS"]),
+        )
+
+    def _start(self):
+        budget = self.budget_for(request.method, request.endpoint or "unmatched")
+        try:
+            budget = min(
+                budget, int(request.headers[current_app.config["DEADLINE_HEADER"]])
+            )
+        except (KeyError, ValueError):
+            pass
+        g.deadline = time.monotonic() + budget / 1000
+
+    def _finish(self, exc):
+        g.pop("deadline", None)
+
+
+def remaining():
+    """Return the seconds left in this request's budget, ``None`` outside one."""
+    if not has_request_context() or "deadline" not in g:
+        return None
+    return g.deadline - time.monotonic()
+
+
+def _exceeded() -> DeadlineExceeded:
+    metrics.inc("deadline_exceeded_total", endpoint=request.endpoint or "unmatched")
+    return DeadlineExceeded()
+
+
+def _apply_timeout(session, transaction, connection):
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise _exceeded()
+    if connection.dialect.name == "postgresql":
+        # ``SET LOCAL`` ends with the transaction, before the connection
+        # goes back to the pool.
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}"
+        )
+
+
+def _translate_cancel(context):
+    pgcode = getattr(context.original_exception, "pgcode", None)
+    if pgcode == QUERY_CANCELED and remaining() is not None:
+        raise _exceeded()
+
+
+deadlines = Deadlines()
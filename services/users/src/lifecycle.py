@@ -0,0 +1,110 @@
+import threading
+import time
+
+from flask import jsonify
+from flask_restx import marshal
+
+from src import db
+from src.metrics import metrics
+
+
+class Lifecycle:
+    """Readiness, warm-up and drain for a worker.
+
+    ``GET /ready`` only answers ``200`` once :meth:`warm_up` has opened the
+    pooled connections of every engine, prepared the hot lookups on each of
+    them (on Postgres), run the hot lookups once to compile them, loaded the
+    in-process indexes and built the Swagger spec. gunicorn warms each
+    worker before it accepts requests; elsewhere the first readiness check
+    does it. :meth:`drain` makes the check fail again so load balancers stop
+    sending traffic before the worker stops.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.ready = False
+        self.draining = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions["lifecycle"] = self
+        self.app = app
+
+    def status(self):
+        if not self.ready and not self.draining:
+            try:
+                self.warm_up()
+            except Exception:
+                self.app.logger.exception("Warm-up failed")
+        if self.ready and not self.draining:
+            return jsonify(status="ready"), 200
+        return jsonify(status="draining" if self.draining else "starting"), 503
+
+    def warm_up(self):
+        with self._lock:
+            if self.ready:
+                return
+            started = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    self._open_connections()
+                    self._run_hot_paths()
+                finally:
+                    db.session.remove()
+            self.ready = True
+        metrics.observe("warm_up_seconds", time.perf_counter() - started)
+
+    def drain(self):
+        """Fail readiness from now on; requests are still served."""
+        self.draining = True
+
+    def shutdown(self):
+        """Flush buffered writes before the process exits."""
+        from src.api.users.login_events import login_events
+        from src.capture import capture
+
+        with self.app.app_context():
+            login_events.flush()
+        for handler in capture.logger.handlers:
+            handler.flush()
+
+    def _open_connections(self):
+        from src.api.users import crud
+
+        binds = [None, *(self.app.config.get("SQLALCHEMY_BINDS") or {})]
+        for bind in binds:
+            engine = db.get_engine(self.app, bind=bind)
+            # ``SingletonThreadPool.size`` is an int, and one connection per thread.
+            size = getattr(engine.pool, "size", None)
+            connections = [
+                engine.connect() for _ in range(size() if callable(size) else 1)
+            ]
+            for connection in connections:
+                connection.exec_driver_sql("SELECT 1")
+                crud.prepare_lookups(connection)
+                connection.close()
+
+    def _run_hot_paths(self):
+        from src.api import api
+        from src.api.users import crud
+        from src.api.users.autocomplete import autocomplete
+        from src.api.users.emails import email_filter
+        from src.api.users.passwords import breached_passwords
+        from src.api.users.views import user
+
+        crud.get_user_by_id(0)
+        crud.get_user_by_email("")
+        crud.get_users_by_ids([0])
+        if not autocomplete.loaded:
+            autocomplete.load()
+        if email_filter.enabled and not email_filter.loaded:
+            email_filter.load()
+        breached_passwords.is_breached("")
+        marshal({}, user)
+        with self.app.test_request_context():
+            api.__schema__
+
+
+lifecycle = Lifecycle()
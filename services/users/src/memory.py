@@ -0,0 +1,123 @@
+import os
+import signal
+import sys
+import sysconfig
+import time
+import tracemalloc
+from collections import defaultdict
+
+from src.metrics import metrics
+
+STDLIB = sysconfig.get_paths()["stdlib"]
+MiB = 2**20
+
+
+def usage() -> dict:
+    """Return this process's resident (RSS) and unique (USS) memory in bytes.
+
+    USS, the private pages only this worker holds, is what recycling a
+    worker gives back; RSS also counts pages shared with the master and the
+    other workers.
+    """
+    fields = {}
+    try:
+        with open("/proc/self/smaps_rollup") as smaps:
+            for line in smaps:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+
+        # Not Linux: only the peak RSS is available.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss *= 1 if sys.platform == "darwin" else 1024
+        return {"rss": rss, "uss": None}
+
+    return {
+        "rss": fields.get("Rss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def update_gauges() -> dict:
+    worker = str(os.getpid())
+    current = usage()
+    metrics.set("process_resident_memory_bytes", current["rss"], worker=worker)
+    if current["uss"] is not None:
+        metrics.set("process_unique_memory_bytes", current["uss"], worker=worker)
+    return current
+
+
+def module_for(filename: str) -> str:
+    """Group an allocation site into a dotted package, two levels deep."""
+    path = filename.replace(os.sep, "/")
+    if "/site-packages/" in path:
+        parts = path.rsplit("/site-packages/", 1)[1].split("/")
+    elif "/src/" in path:
+        parts = ["src", *path.rsplit("/src/", 1)[1].split("/")]
+    elif filename.startswith(STDLIB):
+        return "stdlib"
+    else:
+        return "<other>"
+
+    parts[-1] = parts[-1].rsplit(".", 1)[0]
+    return ".".join(parts[:-1][:2] or parts)
+
+
+class MemoryProfiler:
+    """Diff ``tracemalloc`` snapshots grouped by package.
+
+    The first :meth:`report` starts tracing and records a baseline; each
+    later one lists the packages whose allocations grew the most since the
+    previous report, e.g. ``sqlalchemy.orm`` for the identity map or
+    ``flask_restx`` for marshalling.
+    """
+
+    def __init__(self, frames: int = 1):
+        self.frames = frames
+        self._previous = None
+
+    def report(self, limit: int = 25) -> str:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        previous, self._previous = self._previous, snapshot
+        current = usage()
+        header = (
+            f"memory report pid={os.getpid()} rss={current['rss'] / MiB:.1f}MiB"
+            + (f" uss={current['uss'] / MiB:.1f}MiB" if current["uss"] else "")
+        )
+        if previous is None:
+            return f"{header}\ntracemalloc baseline taken; send the signal again to diff.\n"
+
+        grown, total = defaultdict(int), defaultdict(int)
+        for stat in snapshot.compare_to(previous, "filename"):
+            module = module_for(stat.traceback[0].filename)
+            grown[module] += stat.size_diff
+            total[module] += stat.size
+
+        lines = [header, f"{'growth':>12}{'total':>12}  module"]
+        for module in sorted(grown, key=grown.get, reverse=True)[:limit]:
+            lines.append(
+                f"{grown[module] / MiB:>+11.2f}M{total[module] / MiB:>11.2f}M  {module}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+profiler = MemoryProfiler()
+
+
+def install_signal_handler(signum: int = signal.SIGUSR2):
+    """Print a :class:`MemoryProfiler` report to stderr on ``signum``."""
+
+    def handler(signum, frame):
+        started = time.perf_counter()
+        report = profiler.report()
+        sys.stderr.write(report)
+        sys.stderr.write(f"(report took {time.perf_counter() - started:.2f}s)\n")
+        sys.stderr.flush()
+
+    signal.signal(signum, handler)
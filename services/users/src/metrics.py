@@ -0,0 +1,53 @@
+import threading
+from collections import defaultdict
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """Minimal per-process metrics registry rendered in Prometheus text format.
+
+    Each gunicorn worker keeps its own values; the scraper is expected to sum
+    them across workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[name, _label_key(labels)] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[name, _label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a sample as ``<name>_count`` and ``<name>_sum`` counters."""
+        with self._lock:
+            self._counters[f"{name}_count", _label_key(labels)] += 1
+            self._counters[f"{name}_sum", _label_key(labels)] += value
+
+    def value(self, name: str, **labels) -> float:
+        key = (name, _label_key(labels))
+        with self._lock:
+            return self._gauges.get(key, self._counters.get(key, 0.0))
+
+    def render(self) -> str:
+        with self._lock:
+            samples = sorted({**self._counters, **self._gauges}.items())
+
+        lines = []
+        for (name, labels), value in samples:
+            if labels:
+                rendered = ",".join(f'{key}="{val}"' for key, val in labels)
+                name = f"{name}{{{rendered}}}"
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
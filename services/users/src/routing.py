@@ -0,0 +1,96 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, has_request_context, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy, get_state
+from sqlalchemy import orm
+
+REPLICA_BIND_PREFIX = "replica"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends reads to the replica named in ``info["replica"]``.
+
+    Flushes always go to the primary, so a session can read from a replica
+    and still write normally.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        bind_key = self.info.get("replica")
+        if bind_key is not None and not self._flushing:
+            return get_state(self.app).db.get_engine(self.app, bind=bind_key)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+class ReplicaRouter:
+    """Pick a healthy replica for reads made while serving safe requests.
+
+    Replicas are the ``SQLALCHEMY_BINDS`` entries whose key starts with
+    ``replica``. Clients that just wrote are pinned to the primary for
+    ``READ_YOUR_WRITES_SECONDS`` through the signed session cookie, and a
+    replica that fails a query is skipped for ``REPLICA_RETRY_INTERVAL``
+    seconds.
+    """
+
+    def __init__(self, app=None):
+        self._counter = itertools.count()
+        self._down_until = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("READ_YOUR_WRITES_SECONDS", 5)
+        app.config.setdefault("REPLICA_RETRY_INTERVAL", 30)
+        app.extensions["replicas"] = self
+
+    def replica_binds(self):
+        binds = current_app.config.get("SQLALCHEMY_BINDS") or {}
+        return sorted(key for key in binds if key.startswith(REPLICA_BIND_PREFIX))
+
+    def read_bind(self):
+        """Return the replica bind to read from, or ``None`` for the primary."""
+        if not has_request_context() or request.method not in SAFE_METHODS:
+            return None
+        if session.get("read_primary_until", 0) > time.time():
+            return None
+
+        now = time.monotonic()
+        healthy = [
+            key for key in self.replica_binds() if self._down_until.get(key, 0) <= now
+        ]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def mark_unhealthy(self, bind_key: str):
+        current_app.logger.warning("Replica %s failed, reading from primary", bind_key)
+        with self._lock:
+            self._down_until[bind_key] = (
+                time.monotonic() + current_app.config["REPLICA_RETRY_INTERVAL"]
+            )
+
+    def stick_to_primary(self):
+        """Route this client's reads to the primary for a short while."""
+        if not has_request_context():
+            return
+        session["read_primary_until"] = (
+            time.time() + current_app.config["READ_YOUR_WRITES_SECONDS"]
+        )
+
+    @contextmanager
+    def use(self, db_session, bind_key: str):
+        previous = db_session.info.get("replica")
+        db_session.info["replica"] = bind_key
+        try:
+            yield
+        finally:
+            db_session.info["replica"] = previous
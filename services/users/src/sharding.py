@@ -0,0 +1,188 @@
+import datetime
+import time
+
+from flask import current_app, g
+from sqlalchemy import and_, delete, insert, select
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+
+SHARD_BIND_PREFIX = "shard"
+
+
+class ShardRouter:
+    """Route user rows to shards by ``id % SHARD_BUCKETS``.
+
+    Shards are the ``SQLALCHEMY_BINDS`` entries whose key starts with
+    ``shard``. Each bucket lives on one shard: by default bucket ``b`` lives on
+    shard ``b % number_of_shards``, and rows in the ``shard_map`` table on the
+    primary override that, which is how ``manage.py reshard`` moves buckets.
+    The primary also keeps the ``user_directory`` table, which hands out
+    globally unique user ids and maps emails to them.
+
+    With no shard binds configured, ``enabled`` is false and all user data
+    stays in the primary database.
+    """
+
+    def __init__(self, db, app=None):
+        self.db = db
+        self._shard_map = {}
+        self._shard_map_loaded = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SHARD_BUCKETS", 1024)
+        app.config.setdefault("SHARD_MAP_TTL", 30)
+        app.config.setdefault("SHARD_PAGE_SIZE", 1000)
+        app.extensions["shards"] = self
+        app.teardown_appcontext(self._remove_session)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shard_ids())
+
+    def shard_ids(self) -> list:
+        binds = current_app.config.get("SQLALCHEMY_BINDS") or {}
+        return sorted(key for key in binds if key.startswith(SHARD_BIND_PREFIX))
+
+    def engines(self) -> dict:
+        return {
+            shard_id: self.db.get_engine(bind=shard_id) for shard_id in self.shard_ids()
+        }
+
+    def bucket_for(self, user_id: int) -> int:
+        return user_id % current_app.config["SHARD_BUCKETS"]
+
+    def default_shard_for_bucket(self, bucket: int) -> str:
+        shard_ids = self.shard_ids()
+        return shard_ids[bucket % len(shard_ids)]
+
+    def shard_for(self, user_id: int) -> str:
+        return self.shard_for_bucket(self.bucket_for(user_id))
+
+    def shard_for_bucket(self, bucket: int) -> str:
+        return self.shard_map().get(bucket) or self.default_shard_for_bucket(bucket)
+
+    def shard_map(self) -> dict:
+        """Return the bucket overrides, reloaded every ``SHARD_MAP_TTL`` seconds."""
+        from src.api.users.models import ShardMap
+
+        age = time.monotonic() - self._shard_map_loaded
+        if age > current_app.config["SHARD_MAP_TTL"]:
+            with self.db.get_engine().connect() as connection:
+                rows = connection.execute(select(ShardMap.bucket, ShardMap.shard))
+                self._shard_map = dict(rows.all())
+            self._shard_map_loaded = time.monotonic()
+        return self._shard_map
+
+    def invalidate(self):
+        self._shard_map_loaded = 0
+
+    @property
+    def session(self) -> ShardedSession:
+        if "shard_session" not in g:
+            g.shard_session = ShardedSession(
+                shards=self.engines(),
+                shard_chooser=self._choose_shard,
+                id_chooser=self._choose_ids,
+                execute_chooser=self._choose_for_query,
+            )
+        return g.shard_session
+
+    def create_all(self):
+        from src.api.users.models import User
+
+        for engine in self.engines().values():
+            User.__table__.create(engine, checkfirst=True)
+
+    def drop_all(self):
+        from src.api.users.models import User
+
+        for engine in self.engines().values():
+            User.__table__.drop(engine, checkfirst=True)
+
+    def move_bucket(self, bucket: int, target: str, wait: float = None) -> int:
+        """Move every user in ``bucket`` to the ``target`` shard.
+
+        Rows are copied while the source keeps serving, then ``shard_map`` is
+        flipped. After waiting ``SHARD_MAP_TTL`` seconds, so that every worker
+        routes the bucket to ``target``, rows written to the source in the
+        meantime are copied again and the source rows are deleted.
+        """
+        from src.api.users.models import ShardMap, User
+
+        self.invalidate()
+        source = self.shard_for_bucket(bucket)
+        if source == target:
+            return 0
+
+        table = User.__table__
+        engines = self.engines()
+        in_bucket = table.c.id % current_app.config["SHARD_BUCKETS"] == bucket
+        started = datetime.datetime.utcnow()
+        moved = self._copy_rows(engines[source], engines[target], in_bucket)
+
+        with self.db.get_engine().begin() as connection:
+            connection.execute(delete(ShardMap).where(ShardMap.bucket == bucket))
+            connection.execute(insert(ShardMap).values(bucket=bucket, shard=target))
+        self.invalidate()
+        time.sleep(current_app.config["SHARD_MAP_TTL"] if wait is None else wait)
+
+        self._copy_rows(
+            engines[source],
+            engines[target],
+            and_(in_bucket, table.c.updated_date >= started),
+            newer_only=True,
+        )
+        with engines[source].begin() as connection:
+            connection.execute(delete(table).where(in_bucket))
+        return moved
+
+    def _copy_rows(self, source, target, where, newer_only=False) -> int:
+        from src.api.users.models import User
+
+        table = User.__table__
+        with source.connect() as connection:
+            rows = connection.execute(select(table).where(where)).mappings().all()
+        if not rows:
+            return 0
+
+        rows = [dict(row) for row in rows]
+        with target.begin() as connection:
+            if newer_only:
+                # Keep rows already updated on the target since the flip.
+                current = dict(
+                    connection.execute(
+                        select(table.c.id, table.c.updated_date).where(
+                            table.c.id.in_([row["id"] for row in rows])
+                        )
+                    ).all()
+                )
+                rows = [
+                    row
+                    for row in rows
+                    if row["id"] not in current
+                    or current[row["id"]] <= row["updated_date"]
+                ]
+                if not rows:
+                    return 0
+            connection.execute(
+                delete(table).where(table.c.id.in_([row["id"] for row in rows]))
+            )
+            connection.execute(insert(table), rows)
+        return len(rows)
+
+    def _choose_shard(self, mapper, instance, clause=None):
+        # New users get their id from ``user_directory`` before being added.
+        return self.shard_for(instance.id)
+
+    def _choose_ids(self, query, ident):
+        return [self.shard_for(ident[0])]
+
+    def _choose_for_query(self, orm_context):
+        # Queries without ``set_shard`` are scatter-gathered over every shard.
+        return self.shard_ids()
+
+    def _remove_session(self, exception=None):
+        shard_session = g.pop("shard_session", None)
+        if shard_session is not None:
+            shard_session.close()
@@ -1,6 +1,12 @@
+import datetime
 import os
 
+import pytest
+from sqlalchemy.exc import IntegrityError
+
 from src import create_app, db
+from src.api.users.admin import CURSOR_SESSION_KEY
+from src.api.users.models import User, UserEvent, UserStats
 
 
 def test_admin_view_dev():
@@ -21,6 +27,134 @@ def test_admin_view_dev():
     assert os.getenv("FLASK_ENV") == "development"
 
 
+@pytest.fixture(scope="function")
+def admin_client():
+    os.environ["FLASK_ENV"] = "development"
+    app = create_app()
+    app.config.from_object("src.config.TestingConfig")
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        for i in range(25):
+            user = User(f"user{i:02}", f"user{i:02}@flask.com", "password")
+            user.created_date = datetime.datetime(2022, 1, 1, minute=i)
+            db.session.add(user)
+        db.session.commit()
+        yield app.test_client()
+
+
+def test_admin_view_search_by_prefix(admin_client):
+    response = admin_client.get("/admin/user/?search=USER1")
+    body = response.data.decode()
+
+    assert response.status_code == 200
+    assert "user10@flask.com" in body
+    assert "user19@flask.com" in body
+    assert "user20@flask.com" not in body
+    assert "user01@flask.com" not in body
+
+
+def test_admin_view_next_page_continues_after_cursor(admin_client):
+    first_page = admin_client.get("/admin/user/").data.decode()
+    with admin_client.session_transaction() as session:
+        assert session[CURSOR_SESSION_KEY]["page"] == 1
+        assert session[CURSOR_SESSION_KEY]["id"] == 6
+
+    second_page = admin_client.get("/admin/user/?page=1").data.decode()
+
+    shown = [
+        f"user{i:02}@flask.com"
+        for i in range(25)
+        if f"user{i:02}@flask.com" in first_page + second_page
+    ]
+    assert len(shown) == 25
+    assert all(
+        not (
+            f"user{i:02}@flask.com" in first_page
+            and f"user{i:02}@flask.com" in second_page
+        )
+        for i in range(25)
+    )
+
+
+def test_admin_view_bulk_deactivate(admin_client):
+    ids = [user.id for user in User.query.limit(3)]
+    response = admin_client.post(
+        "/admin/user/action/",
+        data={"action": "deactivate", "rowid": [str(user_id) for user_id in ids]},
+        follow_redirects=True,
+    )
+
+    assert response.status_code == 200
+    assert "3 users were deactivated." in response.data.decode()
+    assert User.query.filter(User.active.is_(False)).count() == 3
+    assert sorted((event.user_id, event.kind) for event in UserEvent.query.all()) == [
+        (user_id, "deleted") for user_id in sorted(ids)
+    ]
+    stats = db.session.get(UserStats, datetime.date(2022, 1, 1))
+    assert (stats.active, stats.inactive) == (-3, 3)
+
+
+def test_admin_view_bulk_activate(admin_client):
+    ids = [user.id for user in User.query.limit(2)]
+    for action in ("deactivate", "activate", "activate"):
+        response = admin_client.post(
+            "/admin/user/action/",
+            data={"action": action, "rowid": [str(user_id) for user_id in ids]},
+            follow_redirects=True,
+        )
+
+    assert "0 users were activated." in response.data.decode()
+    assert User.query.filter(User.active.is_(False)).count() == 0
+    assert [event.kind for event in UserEvent.query.order_by(UserEvent.id)] == [
+        "deleted",
+        "deleted",
+        "created",
+        "created",
+    ]
+    stats = db.session.get(UserStats, datetime.date(2022, 1, 1))
+    assert (stats.active, stats.inactive) == (0, 0)
+
+
+def test_admin_view_bulk_activate_skips_taken_email(admin_client):
+    first, second = User.query.order_by(User.id).limit(2)
+    admin_client.post(
+        "/admin/user/action/",
+        data={"action": "deactivate", "rowid": [str(first.id), str(second.id)]},
+    )
+    # The first email was registered again while the user was inactive.
+    db.session.add(User("again", first.email, "password"))
+    db.session.commit()
+
+    response = admin_client.post(
+        "/admin/user/action/",
+        data={"action": "activate", "rowid": [str(first.id), str(second.id)]},
+        follow_redirects=True,
+    )
+
+    assert response.status_code == 200
+    assert "1 users were activated." in response.data.decode()
+    assert not db.session.get(User, first.id).active
+    assert db.session.get(User, second.id).active
+
+
+def test_admin_view_bulk_activate_race(admin_client, monkeypatch):
+    def taken(user_ids, active):
+        raise IntegrityError("UPDATE users", {}, Exception("ix_users_email_active"))
+
+    monkeypatch.setattr("src.api.users.admin.set_users_active", taken)
+    response = admin_client.post(
+        "/admin/user/action/",
+        data={"action": "activate", "rowid": ["1"]},
+        follow_redirects=True,
+    )
+
+    assert response.status_code == 200
+    assert "A selected email was just taken" in response.data.decode()
+
+
 def test_admin_view_prod():
     os.environ["FLASK_ENV"] = "production"
     assert os.getenv("FLASK_ENV") == "production"
@@ -37,3 +171,38 @@ def test_admin_view_prod():
         assert response.status_code == 404
 
     assert os.getenv("FLASK_ENV") == "production"
+
+
+def test_admin_view_create_and_edit_keep_counts(admin_client):
+    response = admin_client.post(
+        "/admin/user/new/",
+        data={
+            "username": "created",
+            "email": "created@flask.com",
+            "password": "a long admin passphrase",
+            "active": "y",
+            "created_date": "2022-01-02 10:00:00",
+        },
+    )
+    assert response.status_code == 302
+    user = User.query.filter_by(email="created@flask.com").one()
+
+    stats = db.session.get(UserStats, datetime.date(2022, 1, 2))
+    assert (stats.signups, stats.active, stats.inactive) == (1, 1, 0)
+
+    response = admin_client.post(
+        f"/admin/user/edit/?id={user.id}",
+        data={
+            "username": "created",
+            "email": "created@flask.com",
+            "password": "a long admin passphrase",
+            "created_date": "2022-01-03 10:00:00",
+        },
+    )
+    assert response.status_code == 302
+    db.session.expire_all()
+
+    stats = db.session.get(UserStats, datetime.date(2022, 1, 2))
+    assert (stats.signups, stats.active, stats.inactive) == (0, 0, 0)
+    stats = db.session.get(UserStats, datetime.date(2022, 1, 3))
+    assert (stats.signups, stats.active, stats.inactive) == (1, 0, 1)
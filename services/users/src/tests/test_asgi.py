@@ -0,0 +1,93 @@
+import pytest
+from starlette.testclient import TestClient
+
+from src.api.users.models import User, UserEvent, UserStats
+from src.asgi import create_app
+
+
+@pytest.fixture(scope="module")
+def async_client(test_app, test_database):
+    with TestClient(create_app(test_app)) as client:
+        yield client
+
+
+def test_register_login_status(test_app, test_database, async_client):
+    test_database.session.query(User).delete()
+    test_database.session.commit()
+
+    response = async_client.post(
+        "/auth/register",
+        json={"username": "async", "email": "async@flask.com", "password": "test"},
+    )
+    assert response.status_code == 201
+    assert response.json() == {"username": "async", "email": "async@flask.com"}
+
+    response = async_client.post(
+        "/auth/login", json={"email": "async@flask.com", "password": "test"}
+    )
+    assert response.status_code == 200
+    access_token = response.json()["access_token"]
+
+    response = async_client.get(
+        "/auth/status", headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == 200
+    assert response.json()["username"] == "async"
+
+
+def test_register_duplicate_email(test_app, test_database, async_client):
+    payload = {"username": "async", "email": "dupe@flask.com", "password": "test"}
+    assert async_client.post("/auth/register", json=payload).status_code == 201
+
+    response = async_client.post("/auth/register", json=payload)
+    assert response.status_code == 400
+    assert "Sorry. That email already exists." in response.json()["message"]
+
+
+def test_invalid_payload(test_app, test_database, async_client):
+    response = async_client.post("/users", json={"email": "me@flask.com"})
+    data = response.json()
+
+    assert response.status_code == 400
+    assert "Input payload validation failed" in data["message"]
+    assert "username" in data["errors"]
+
+
+def test_users_crud(test_app, test_database, async_client, create_user):
+    user = create_user("async-user", "async-user@flask.com", "test")
+
+    response = async_client.get(f"/users/{user.id}")
+    assert response.status_code == 200
+    assert response.json()["email"] == "async-user@flask.com"
+
+    response = async_client.put(
+        f"/users/{user.id}", json={"username": "renamed", "email": "new@flask.com"}
+    )
+    assert response.status_code == 200
+
+    response = async_client.delete(f"/users/{user.id}")
+    assert response.status_code == 200
+    assert async_client.get(f"/users/{user.id}").status_code == 404
+    assert all(row["id"] != user.id for row in async_client.get("/users").json())
+
+
+def test_writes_go_through_crud(test_app, test_database, async_client):
+    test_database.session.query(UserEvent).delete()
+    test_database.session.query(UserStats).delete()
+    test_database.session.commit()
+
+    response = async_client.post(
+        "/users",
+        json={"username": "tracked", "email": "tracked@flask.com", "password": "test"},
+    )
+    assert response.status_code == 201
+    user = User.query.filter_by(email="tracked@flask.com").one()
+    async_client.put(
+        f"/users/{user.id}", json={"username": "tracked", "email": "moved@flask.com"}
+    )
+    async_client.delete(f"/users/{user.id}")
+
+    events = UserEvent.query.filter_by(user_id=user.id).order_by(UserEvent.id)
+    assert [event.kind for event in events] == ["created", "updated", "deleted"]
+    [stats] = UserStats.query.all()
+    assert (stats.signups, stats.active, stats.inactive) == (1, 0, 1)
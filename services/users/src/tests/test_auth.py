@@ -3,7 +3,9 @@ import json
 import pytest
 from flask import Flask, current_app
 
-from src.api.users.models import User
+from src.api.users.login_events import login_events
+from src.api.users.models import LoginEvent, User
+from src.metrics import metrics
 
 
 def test_passwords_are_random(test_app, test_database, create_user):
@@ -13,13 +15,13 @@ def test_passwords_are_random(test_app, test_database, create_user):
 
 
 def test_encode_token(test_app, test_database, create_user):
-    user = create_user("justatest", "test@test.com", "test")
+    user = create_user("justatest", "encode@test.com", "test")
     token = user.encode_token(user.id, "access")
     assert isinstance(token, str)
 
 
 def test_decode_token(test_app, test_database, create_user):
-    user = create_user("justatest", "test@test.com", "test")
+    user = create_user("justatest", "decode@test.com", "test")
     token = user.encode_token(user.id, "access")
     assert isinstance(token, str)
     assert User.decode_token(token) == user.id
@@ -48,12 +50,12 @@ def test_user_registration(test_app: Flask, test_database):
 
 
 def test_user_registration_duplicate_email(test_app: Flask, test_database, create_user):
-    create_user("test", "test@test.com", "test")
+    create_user("test", "duplicate@test.com", "test")
     client = test_app.test_client()
     response = client.post(
         "/auth/register",
         data=json.dumps(
-            {"username": "jpinto", "email": "test@test.com", "password": "test"}
+            {"username": "jpinto", "email": "duplicate@test.com", "password": "test"}
         ),
         content_type="application/json",
     )
@@ -218,3 +220,109 @@ def test_invalid_status(test_app: Flask, test_database):
     assert resp.status_code == 401
     assert resp.content_type == "application/json"
     assert "Invalid token. Please log in again." in data["message"]
+
+
+def test_login_records_last_login(test_app: Flask, test_database, create_user):
+    login_events.flush()
+    current_app.config["REFRESH_TOKEN_EXPIRATION"] = 3
+    user = create_user("test7", "test7@test.com", "test")
+    client = test_app.test_client()
+    login_response = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "test7@test.com", "password": "test"}),
+        content_type="application/json",
+    )
+    refresh_token = json.loads(login_response.data.decode())["refresh_token"]
+    client.post(
+        "/auth/refresh",
+        data=json.dumps({"refresh_token": refresh_token}),
+        content_type="application/json",
+    )
+
+    assert test_database.session.get(User, user.id).last_login_at is None
+    assert login_events.flush() == 2
+
+    test_database.session.expire_all()
+    assert test_database.session.get(User, user.id).last_login_at is not None
+    events = LoginEvent.query.filter_by(user_id=user.id).order_by(LoginEvent.id)
+    assert [event.event for event in events] == ["login", "refresh"]
+
+    response = client.get("/metrics")
+    assert "login_events_flushed_total" in response.data.decode()
+
+
+def test_login_events_buffer_is_bounded(test_app: Flask, test_database):
+    login_events.flush()
+    current_app.config["LOGIN_EVENTS_MAX_BUFFERED"] = 2
+    dropped = metrics.value("login_events_dropped_total")
+
+    for user_id in range(3):
+        login_events.record(user_id, "login")
+
+    current_app.config["LOGIN_EVENTS_MAX_BUFFERED"] = 10000
+    assert metrics.value("login_events_dropped_total") == dropped + 1
+    assert login_events.flush() == 2
+
+
+def test_introspect_tokens(test_app: Flask, test_database, create_user):
+    current_app.config["ACCESS_TOKEN_EXPIRATION"] = 3
+    active = create_user("test8", "test8@test.com", "test")
+    removed = create_user("test9", "test9@test.com", "test")
+    active_token = active.encode_token(active.id, "access")
+    removed_token = removed.encode_token(removed.id, "access")
+    removed.active = False
+    test_database.session.commit()
+
+    client = test_app.test_client()
+    response = client.post(
+        "/auth/introspect",
+        data=json.dumps({"tokens": [active_token, "invalid", removed_token]}),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data[0]["active"]
+    assert data[0]["sub"] == active.id
+    assert data[0]["username"] == "test8"
+    assert data[0]["exp"] > data[0]["iat"]
+    assert data[1:] == [{"active": False}, {"active": False}]
+
+
+def test_introspect_too_many_tokens(test_app: Flask, test_database):
+    client = test_app.test_client()
+    response = client.post(
+        "/auth/introspect",
+        data=json.dumps({"tokens": ["token"] * 101}),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 400
+    assert "Sorry. At most 100 tokens per request." in data["message"]
+
+
+def test_verify_token(test_app: Flask, test_database, create_user):
+    current_app.config["ACCESS_TOKEN_EXPIRATION"] = 3
+    user = create_user("test10", "test10@test.com", "test")
+    token = user.encode_token(user.id, "access")
+
+    client = test_app.test_client()
+    response = client.get("/auth/verify", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 204
+    assert response.headers["X-User-Id"] == str(user.id)
+    assert 0 <= int(response.headers["X-Accel-Expires"]) <= 3
+    assert response.data == b""
+
+
+@pytest.mark.parametrize(
+    "headers, status_code",
+    [({}, 403), ({"Authorization": "Bearer invalid"}, 401)],
+)
+def test_verify_invalid_token(test_app: Flask, test_database, headers, status_code):
+    client = test_app.test_client()
+    response = client.get("/auth/verify", headers=headers)
+
+    assert response.status_code == status_code
+    assert "X-User-Id" not in response.headers
@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+from flask import Flask
+
+from src.api.users.autocomplete import AutocompleteIndex, autocomplete
+
+
+def test_autocomplete(test_app: Flask, test_database, create_user):
+    create_user("autocomplete", "complete-me@flask.com", "mypassword123")
+    create_user("autopilot", "pilot@flask.com", "mypassword123")
+    autocomplete.load()
+
+    client = test_app.test_client()
+    response = client.get("/users/autocomplete?prefix=AutO")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert [user["username"] for user in data] == ["autocomplete", "autopilot"]
+
+    response = client.get("/users/autocomplete?prefix=complete-")
+    data = json.loads(response.data.decode())
+    assert [user["email"] for user in data] == ["complete-me@flask.com"]
+
+
+def test_autocomplete_limit(test_app: Flask, test_database, create_user):
+    create_user("limited-1", "limited-1@flask.com", "mypassword123")
+    create_user("limited-2", "limited-2@flask.com", "mypassword123")
+    autocomplete.load()
+
+    client = test_app.test_client()
+    response = client.get("/users/autocomplete?prefix=limited&limit=1")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert len(data) == 1
+
+
+def test_autocomplete_requires_prefix(test_app: Flask, test_database):
+    client = test_app.test_client()
+    response = client.get("/users/autocomplete?prefix=")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 400
+    assert "Sorry. A prefix is required." in data["message"]
+
+
+def test_autocomplete_follows_crud(test_app: Flask, test_database):
+    autocomplete.load()
+    client = test_app.test_client()
+    client.post(
+        "/users",
+        data=json.dumps(
+            {
+                "username": "typeahead",
+                "email": "typeahead@flask.com",
+                "password": "mypassword123",
+            }
+        ),
+        content_type="application/json",
+    )
+    [(user_id, username, _)] = autocomplete.search("typeahead")
+    assert username == "typeahead"
+
+    client.delete(f"/users/{user_id}")
+    assert autocomplete.search("typeahead") == []
+
+
+def test_autocomplete_sync(test_app: Flask, test_database, create_user):
+    index = AutocompleteIndex(test_app)
+    index.load()
+    user = create_user("synced", "synced@flask.com", "mypassword123")
+
+    index.sync()
+    assert [found[1] for found in index.search("synced")] == ["synced"]
+
+    user.active = False
+    test_database.session.commit()
+    index.sync()
+    assert index.search("synced") == []
+
+
+def test_autocomplete_loads_once(test_app: Flask, test_database, monkeypatch):
+    index = AutocompleteIndex(test_app)
+    load, loads = index.load, []
+
+    def slow_load():
+        loads.append(threading.get_ident())
+        time.sleep(0.05)
+        load()
+
+    def search():
+        with test_app.app_context():
+            index.search("a")
+
+    monkeypatch.setattr(index, "load", slow_load)
+    threads = [threading.Thread(target=search) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
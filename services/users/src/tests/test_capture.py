@@ -0,0 +1,91 @@
+import json
+import os
+
+from flask import Flask, request
+
+from src.benchmarks import load_capture, synthesize
+from src.capture import TrafficCapture, shape, shape_query
+
+
+def test_shape_hides_secrets():
+    body = {
+        "email": "someone@flask.com",
+        "password": "hunter22",
+        "ids": "1,2,3",
+        "username": "someone",
+        "tokens": ["abc", "defg"],
+    }
+
+    assert shape(body) == {
+        "email": {"email": 17},
+        "password": {"secret": 8},
+        "ids": "1,2,3",
+        "username": {"str": 7},
+        "tokens": {"secret": [3, 4]},
+    }
+
+
+def test_shape_query_keeps_enumerable_values():
+    args = {"fields": "id,email", "bucket": "week", "prefix": "some", "ids": "1,2"}
+
+    assert shape_query(args) == {
+        "fields": "id,email",
+        "bucket": "week",
+        "prefix": {"str": 4},
+        "ids": "1,2",
+    }
+
+
+def test_synthesize_from_shape():
+    captured = shape({"email": "someone@flask.com", "password": "hunter22"})
+
+    assert synthesize(captured, fills={"password": "real"}, serial=3) == {
+        "email": "replay-3@example.com",
+        "password": "real",
+    }
+
+
+def test_capture_writes_sampled_requests(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        CAPTURE_ENABLED=True,
+        CAPTURE_SAMPLE_RATE=1.0,
+        CAPTURE_PATH=str(tmp_path / "traffic.jsonl"),
+    )
+
+    @app.route("/users/<int:user_id>", methods=["PUT"])
+    def put_user(user_id):
+        return {"id": user_id, "email": request.get_json()["email"]}
+
+    TrafficCapture(app)
+    app.test_client().put(
+        "/users/7",
+        data=json.dumps({"email": "private@flask.com", "password": "secret123"}),
+        content_type="application/json",
+        headers={"Authorization": "Bearer sometoken"},
+    )
+
+    written = tmp_path / f"traffic.jsonl.{os.getpid()}"
+    [record] = load_capture([str(tmp_path / "traffic.jsonl")])
+    assert record["method"] == "PUT"
+    assert record["route"] == "/users/<int:user_id>"
+    assert record["view_args"] == {"user_id": 7}
+    assert record["body"] == {"email": {"email": 17}, "password": {"secret": 9}}
+    assert record["bearer"]
+    assert record["status"] == 200
+    assert "private" not in written.read_text()
+    assert "sometoken" not in written.read_text()
+
+
+def test_load_capture_reads_every_worker(tmp_path):
+    for name, started in [
+        ("traffic.jsonl.101", 3),
+        ("traffic.jsonl.101.1", 1),
+        ("traffic.jsonl.202", 2),
+        ("other.jsonl.303", 4),
+    ]:
+        (tmp_path / name).write_text(json.dumps({"t": started}) + "\n")
+
+    records = load_capture([str(tmp_path / "traffic.jsonl")])
+
+    assert [record["t"] for record in records] == [1, 2, 3]
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+from src.concurrency import ConcurrencyLimiter
+
+
+def _ok(environ, start_response):
+    start_response("200 OK", [("Content-Type", "application/json")])
+    return [b"{}"]
+
+
+@pytest.fixture(scope="function")
+def limiter(test_app: Flask):
+    limiter = ConcurrencyLimiter(_ok, test_app)
+    limiter.limit = 10
+    return limiter
+
+
+def _call(limiter, path: str, method: str = "GET"):
+    captured = {}
+
+    def start_response(status, headers):
+        captured["status"] = status
+        captured["headers"] = dict(headers)
+
+    environ = EnvironBuilder(path=path, method=method).get_environ()
+    body = b"".join(limiter(environ, start_response))
+    return captured["status"], captured["headers"], body
+
+
+def test_limiter_admits_requests_under_limit(limiter):
+    status, _, _ = _call(limiter, "/auth/register", "POST")
+
+    assert status == "200 OK"
+    assert limiter._inflight == 0
+
+
+def test_limiter_sheds_low_priority_first(limiter):
+    limiter._inflight = 6
+
+    status, headers, body = _call(limiter, "/auth/register", "POST")
+    assert status.startswith("503")
+    assert headers["Retry-After"] == "1"
+    assert "overloaded" in json.loads(body.decode())["message"]
+
+    status, _, _ = _call(limiter, "/auth/status")
+    assert status == "200 OK"
+
+    limiter._inflight = 11
+    status, _, _ = _call(limiter, "/auth/status")
+    assert status.startswith("503")
+
+
+def test_limiter_priorities(limiter):
+    assert limiter.priority_for("GET", "users_users") == "critical"
+    assert limiter.priority_for("PUT", "users_users") == "normal"
+    assert limiter.priority_for("POST", "users_users_list") == "sheddable"
+    assert limiter.priority_for("GET", "unmatched") == "normal"
+
+
+def test_limiter_backs_off_when_busy_and_slow(limiter):
+    limiter._latencies["auth_status"] = (0.01, 0.01)
+    limiter._inflight = 8
+
+    limiter._release("auth_status", 0.5)
+
+    assert limiter.limit == 9
+
+
+def test_limiter_ignores_slow_responses_when_idle(limiter):
+    limiter._latencies["auth_status"] = (0.01, 0.01)
+
+    for _ in range(20):
+        limiter._inflight = 1
+        limiter._release("auth_status", 0.5)
+
+    assert limiter.limit == 10
+
+
+def test_limiter_smooths_latency_jitter(limiter):
+    limiter._latencies["auth_status"] = (0.01, 0.01)
+
+    for latency in [0.03, 0.01, 0.01, 0.03, 0.01]:
+        limiter._inflight = 8
+        limiter._release("auth_status", latency)
+
+    assert limiter.limit > 10
+
+
+def test_limiter_grows_when_busy_and_fast(limiter):
+    limiter._latencies["auth_status"] = (0.01, 0.01)
+    limiter._inflight = 8
+
+    limiter._release("auth_status", 0.01)
+
+    assert limiter.limit == pytest.approx(10.1)
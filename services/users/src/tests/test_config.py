@@ -11,6 +11,9 @@ def test_development_config(test_app: Flask):
     assert test_app.config["BCRYPT_LOG_ROUNDS"] == 4
     assert test_app.config["ACCESS_TOKEN_EXPIRATION"] == 900
     assert test_app.config["REFRESH_TOKEN_EXPIRATION"] == 2592000
+    assert test_app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_size"] == int(
+        os.environ.get("GUNICORN_THREADS", "32")
+    )
 
 
 def test_testing_config(test_app: Flask):
@@ -0,0 +1,70 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import g
+
+from src.metrics import metrics
+
+from src.deadlines import (  # isort:skip
+    DeadlineExceeded,
+    _translate_cancel,
+    deadlines,
+    remaining,
+)
+
+
+def test_budget_for_route(test_app):
+    test_app.config["DEADLINES"] = {"GET users_users": 2000, "users_users_lookup": 5000}
+    test_app.config["DEADLINE_DEFAULT_MS"] = 10000
+
+    assert deadlines.budget_for("GET", "users_users") == 2000
+    assert deadlines.budget_for("PUT", "users_users") == 10000
+    assert deadlines.budget_for("POST", "users_users_lookup") == 5000
+
+
+def test_header_can_only_shorten_budget(test_app):
+    test_app.config["DEADLINES"] = {"GET users_users": 2000}
+    with test_app.test_request_context(
+        "/users/1", headers={"X-Request-Deadline": "500"}
+    ):
+        deadlines._start()
+        assert 0.4 < remaining() <= 0.5
+    with test_app.test_request_context(
+        "/users/1", headers={"X-Request-Deadline": "60000"}
+    ):
+        deadlines._start()
+        assert 1.9 < remaining() <= 2.0
+
+
+def test_remaining_outside_request(test_app):
+    assert remaining() is None
+
+
+def test_spent_budget_returns_504(test_app, test_database):
+    client = test_app.test_client()
+    before = metrics.value("deadline_exceeded_total", endpoint="users_users_list")
+    resp = client.get("/users", headers={"X-Request-Deadline": "0"})
+    data = json.loads(resp.data.decode())
+
+    assert resp.status_code == 504
+    assert data["message"] == "Sorry. The request took too long."
+    assert (
+        metrics.value("deadline_exceeded_total", endpoint="users_users_list")
+        == before + 1
+    )
+
+    # The next request starts with a fresh budget.
+    assert client.get("/users").status_code == 200
+
+
+def test_cancelled_statement_becomes_deadline_exceeded(test_app):
+    context = SimpleNamespace(original_exception=SimpleNamespace(pgcode="57014"))
+    with test_app.test_request_context("/users"):
+        g.deadline = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            _translate_cancel(context)
+
+    # Outside a request the database error is left alone.
+    _translate_cancel(context)
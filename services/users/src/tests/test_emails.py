@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy.exc import IntegrityError
+
+from src.api.users import crud
+from src.api.users.emails import EmailFilter, email_filter
+from src.metrics import metrics
+
+
+@pytest.fixture
+def enabled_filter(test_app: Flask, test_database):
+    test_app.config["EMAIL_FILTER_ENABLED"] = True
+    email_filter.load()
+    yield email_filter
+    test_app.config["EMAIL_FILTER_ENABLED"] = False
+
+
+def test_email_filter_skips_lookup_on_miss(enabled_filter, create_user):
+    create_user("filtered", "Filtered@flask.com", "mypassword123")
+    enabled_filter.load()
+    lookups = []
+
+    def lookup(email):
+        lookups.append(email)
+        return None
+
+    assert not enabled_filter.exists("nobody@flask.com", lookup)
+    assert lookups == []
+    assert enabled_filter.may_exist(" filtered@FLASK.com ")
+
+
+def test_email_filter_counts_false_positives(enabled_filter, create_user):
+    create_user("falsepositive", "falsepositive@flask.com", "mypassword123")
+    enabled_filter.load()
+    before = metrics.value("email_filter_false_positives_total")
+
+    assert not enabled_filter.exists("falsepositive@flask.com", lambda email: None)
+    assert metrics.value("email_filter_false_positives_total") == before + 1
+    assert metrics.value("email_filter_bytes") > 0
+
+
+def test_email_filter_follows_crud(test_app: Flask, enabled_filter):
+    crud.create_user("followed", "followed@flask.com", "mypassword123")
+    assert enabled_filter.may_exist("followed@flask.com")
+
+    client = test_app.test_client()
+    response = client.post(
+        "/users",
+        data=json.dumps(
+            {
+                "username": "followed",
+                "email": "followed@flask.com",
+                "password": "mypassword123",
+            }
+        ),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+    assert "Sorry. That email already exists." in response.get_json()["message"]
+
+
+def test_email_filter_sync(test_app: Flask, enabled_filter, create_user):
+    # Created behind the filter's back, as by another worker.
+    create_user("synced", "synced-email@flask.com", "mypassword123")
+    assert not enabled_filter.may_exist("synced-email@flask.com")
+
+    enabled_filter.sync()
+
+    assert enabled_filter.may_exist("synced-email@flask.com")
+
+
+def test_email_filter_syncs_once(test_app: Flask, test_database, monkeypatch):
+    test_app.config["EMAIL_FILTER_ENABLED"] = True
+    emails = EmailFilter(test_app)
+    emails.load()
+    emails._synced_at -= test_app.config["EMAIL_FILTER_SYNC_INTERVAL"]
+    sync, syncs = emails.sync, []
+
+    def slow_sync():
+        syncs.append(threading.get_ident())
+        time.sleep(0.05)
+        sync()
+
+    def check():
+        with test_app.app_context():
+            emails.may_exist("nobody@flask.com")
+
+    monkeypatch.setattr(emails, "sync", slow_sync)
+    threads = [threading.Thread(target=check) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    test_app.config["EMAIL_FILTER_ENABLED"] = False
+
+    assert len(syncs) == 1
+
+
+def test_duplicate_email_rejected_by_index(test_app: Flask, test_database):
+    crud.create_user("unique", "unique@flask.com", "mypassword123")
+
+    with pytest.raises(IntegrityError):
+        crud.create_user("unique2", "unique@flask.com", "mypassword123")
+
+    # Only active users hold on to their email.
+    crud.deactivate_user(crud.create_user("reused", "reused@flask.com", "password"))
+    assert crud.create_user("reused", "reused@flask.com", "password").active
+
+
+def test_register_duplicate_email_race(
+    test_app: Flask, test_database, monkeypatch: pytest.MonkeyPatch
+):
+    crud.create_user("racer", "racer@flask.com", "mypassword123")
+    # The check ran before the other request committed.
+    monkeypatch.setattr(email_filter, "exists", lambda email, lookup: False)
+
+    client = test_app.test_client()
+    response = client.post(
+        "/auth/register",
+        data=json.dumps(
+            {"username": "racer2", "email": "racer@flask.com", "password": "test"}
+        ),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+    assert "Sorry. That email already exists." in response.get_json()["message"]
@@ -0,0 +1,76 @@
+import csv
+import datetime
+import gzip
+
+from src import db
+from src.api.users.export import export_users
+from src.api.users.models import User
+
+
+def _read_export(path) -> list:
+    with gzip.open(path, "rt", newline="") as export:
+        return list(csv.DictReader(export))
+
+
+def test_export_users(test_app, test_database, create_user, tmp_path):
+    db.session.query(User).delete()
+    first = create_user("first", "first-export@flask.com", "mypassword123")
+    first.created_date = datetime.datetime(2022, 1, 1)
+    second = create_user("second", "second-export@flask.com", "mypassword123")
+    second.created_date = datetime.datetime(2022, 1, 2)
+    db.session.commit()
+
+    result = export_users(str(tmp_path / "users.csv.gz"), chunk_size=1)
+    rows = _read_export(tmp_path / "users.csv.gz")
+
+    assert result["rows"] == 2
+    assert result["watermark"] == datetime.datetime(2022, 1, 2)
+    assert [row["email"] for row in rows] == [
+        "first-export@flask.com",
+        "second-export@flask.com",
+    ]
+    assert "password" not in rows[0]
+
+
+def test_export_users_since_watermark(test_app, test_database, create_user, tmp_path):
+    db.session.query(User).delete()
+    old = create_user("old", "old-export@flask.com", "mypassword123")
+    old.created_date = datetime.datetime(2022, 1, 1)
+    db.session.commit()
+    watermark = export_users(str(tmp_path / "full.csv.gz"))["watermark"]
+
+    new = create_user("new", "new-export@flask.com", "mypassword123")
+    new.created_date = datetime.datetime(2022, 2, 1)
+    db.session.commit()
+
+    result = export_users(str(tmp_path / "delta.csv.gz"), since=watermark)
+    rows = _read_export(tmp_path / "delta.csv.gz")
+
+    assert result["rows"] == 1
+    assert [row["email"] for row in rows] == ["new-export@flask.com"]
+    assert (
+        export_users(str(tmp_path / "empty.csv.gz"), since=result["watermark"])["rows"]
+        == 0
+    )
+
+
+def test_export_users_waits_for_recent_users(
+    test_app, test_database, create_user, tmp_path
+):
+    db.session.query(User).delete()
+    old = create_user("settled", "settled-export@flask.com", "mypassword123")
+    old.created_date = datetime.datetime(2022, 1, 1)
+    db.session.commit()
+    # Created just now: its transaction may not have been the last to commit.
+    create_user("recent", "recent-export@flask.com", "mypassword123")
+
+    first = export_users(str(tmp_path / "first.csv.gz"))
+    assert [row["email"] for row in _read_export(tmp_path / "first.csv.gz")] == [
+        "settled-export@flask.com"
+    ]
+    assert first["watermark"] == datetime.datetime(2022, 1, 1)
+
+    export_users(str(tmp_path / "next.csv.gz"), since=first["watermark"], lag=0)
+    assert [row["email"] for row in _read_export(tmp_path / "next.csv.gz")] == [
+        "recent-export@flask.com"
+    ]
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.pool import QueuePool
+
+from src import db
+from src.api.users import crud
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def postgres(monkeypatch: pytest.MonkeyPatch):
+    """Make ``_lookup`` see a Postgres connection backed by ``connect()``."""
+    prepared, executed = [], []
+    current = {}
+
+    def connect(connection):
+        current["connection"] = SimpleNamespace(
+            dialect=postgresql.dialect(),
+            connection=connection.connection,
+            exec_driver_sql=prepared.append,
+        )
+
+    def execute(statement, params):
+        executed.append(str(statement))
+        return SimpleNamespace(scalar=lambda: None)
+
+    monkeypatch.setattr(db.session, "connection", lambda: current["connection"])
+    monkeypatch.setattr(db.session, "execute", execute)
+    return SimpleNamespace(connect=connect, prepared=prepared, executed=executed)
+
+
+def test_lookup_without_prepared_statements(test_app: Flask, engine, postgres):
+    test_app.config["PREPARED_STATEMENTS"] = False
+    try:
+        with engine.connect() as connection:
+            postgres.connect(connection)
+            crud.get_user_by_email("nobody@flask.com")
+
+            assert postgres.prepared == []
+            assert "EXECUTE" not in postgres.executed[0]
+            assert "prepared_statements" not in connection.connection.info
+    finally:
+        test_app.config["PREPARED_STATEMENTS"] = True
+
+
+def test_lookup_prepares_once_per_connection(test_app: Flask, engine, postgres):
+    with engine.connect() as connection:
+        postgres.connect(connection)
+        crud.get_user_by_id(1)
+        crud.get_user_by_id(2)
+        crud.get_user_by_email("nobody@flask.com")
+
+        assert connection.connection.info["prepared_statements"] == {
+            "user_by_id",
+            "user_by_email",
+        }
+    assert [sql.split(" AS ")[0] for sql in postgres.prepared] == [
+        "PREPARE user_by_id",
+        "PREPARE user_by_email",
+    ]
+    assert postgres.executed == [
+        "EXECUTE user_by_id(:value)",
+        "EXECUTE user_by_id(:value)",
+        "EXECUTE user_by_email(:value)",
+    ]
+    assert "$1" in postgres.prepared[0] and "%(value)s" not in postgres.prepared[0]
+
+    # Checked out again, the pooled connection still has its statements.
+    with engine.connect() as connection:
+        postgres.connect(connection)
+        crud.get_user_by_id(3)
+    assert len(postgres.prepared) == 2
+
+
+def test_lookup_prepares_again_after_reconnect(test_app: Flask, engine, postgres):
+    with engine.connect() as connection:
+        postgres.connect(connection)
+        crud.get_user_by_id(1)
+        # The server connection is lost, and its prepared statements with it.
+        connection.invalidate()
+
+    with engine.connect() as connection:
+        postgres.connect(connection)
+        crud.get_user_by_id(1)
+
+        assert connection.connection.info["prepared_statements"] == {"user_by_id"}
+    assert [sql.split(" AS ")[0] for sql in postgres.prepared] == [
+        "PREPARE user_by_id",
+        "PREPARE user_by_id",
+    ]
+
+
+def test_prepare_lookups_on_connection(test_app: Flask, engine, postgres):
+    with engine.connect() as connection:
+        postgres.connect(connection)
+        crud.prepare_lookups(db.session.connection())
+        crud.prepare_lookups(db.session.connection())
+
+        assert connection.connection.info["prepared_statements"] == set(
+            crud.HOT_LOOKUPS
+        )
+    assert len(postgres.prepared) == len(crud.HOT_LOOKUPS)
+    assert postgres.executed == []
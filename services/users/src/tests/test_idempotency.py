@@ -0,0 +1,120 @@
+import hashlib
+import json
+
+from flask import Flask
+
+from src.api.idempotency import client_id, reserve
+from src.api.users.models import IdempotencyKey, User
+
+
+def _fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload).encode()).hexdigest()
+
+
+def _register(client, payload: dict, key: str = None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post(
+        "/auth/register",
+        data=json.dumps(payload),
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+def test_retry_replays_stored_response(test_app: Flask, test_database):
+    client = test_app.test_client()
+    payload = {"username": "retry", "email": "retry@flask.com", "password": "test"}
+
+    first = _register(client, payload, key="register-1")
+    second = _register(client, payload, key="register-1")
+
+    assert first.status_code == 201
+    assert second.status_code == 201
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert json.loads(second.data.decode()) == json.loads(first.data.decode())
+    assert User.query.filter_by(email="retry@flask.com").count() == 1
+
+
+def test_retry_without_key_is_rejected(test_app: Flask, test_database):
+    client = test_app.test_client()
+    payload = {"username": "nokey", "email": "nokey@flask.com", "password": "test"}
+
+    assert _register(client, payload).status_code == 201
+    response = _register(client, payload)
+
+    assert response.status_code == 400
+    assert "Sorry. That email already exists." in response.json["message"]
+
+
+def test_key_reused_for_different_request(test_app: Flask, test_database):
+    client = test_app.test_client()
+    payload = {"username": "reuse", "email": "reuse@flask.com", "password": "test"}
+
+    assert _register(client, payload, key="register-2").status_code == 201
+    payload["email"] = "other@flask.com"
+    response = _register(client, payload, key="register-2")
+
+    assert response.status_code == 422
+    assert "different request" in response.json["message"]
+
+
+def test_expired_key_is_not_replayed(test_app: Flask, test_database):
+    client = test_app.test_client()
+    test_app.config["IDEMPOTENCY_KEY_TTL"] = -1
+    payload = {"username": "expired", "email": "expired@flask.com", "password": "x"}
+
+    assert _register(client, payload, key="register-3").status_code == 201
+    response = _register(client, payload, key="register-3")
+    test_app.config["IDEMPOTENCY_KEY_TTL"] = 86400
+
+    assert response.status_code == 400
+    assert IdempotencyKey.query.filter_by(key="register-3").count() == 1
+
+
+def test_key_in_progress_is_not_run_again(test_app: Flask, test_database):
+    client = test_app.test_client()
+    payload = {"username": "pending", "email": "pending@flask.com", "password": "x"}
+    with test_app.test_request_context(environ_base={"REMOTE_ADDR": "127.0.0.1"}):
+        caller = client_id()
+    # The first request claimed the key and is still running.
+    assert (
+        reserve("register-4", caller, "POST /auth/register", _fingerprint(payload))
+        is None
+    )
+    response = _register(client, payload, key="register-4")
+
+    assert response.status_code == 409
+    assert User.query.filter_by(email="pending@flask.com").count() == 0
+
+
+def test_abandoned_key_is_taken_over(test_app: Flask, test_database):
+    client = test_app.test_client()
+    payload = {"username": "abandon", "email": "abandon@flask.com", "password": "x"}
+    with test_app.test_request_context(environ_base={"REMOTE_ADDR": "127.0.0.1"}):
+        caller = client_id()
+    reserve("register-5", caller, "POST /auth/register", _fingerprint(payload))
+    test_app.config["IDEMPOTENCY_PENDING_TIMEOUT"] = -1
+    response = _register(client, payload, key="register-5")
+    test_app.config["IDEMPOTENCY_PENDING_TIMEOUT"] = 60
+
+    assert response.status_code == 201
+    assert IdempotencyKey.query.filter_by(key="register-5").one().status_code == 201
+
+
+def test_keys_are_scoped_per_client(test_app: Flask, test_database):
+    client = test_app.test_client()
+    first = {"username": "scoped", "email": "scoped@flask.com", "password": "x"}
+    second = {"username": "scoped2", "email": "scoped2@flask.com", "password": "x"}
+
+    assert _register(client, first, key="shared").status_code == 201
+    response = client.post(
+        "/auth/register",
+        data=json.dumps(second),
+        content_type="application/json",
+        headers={"Idempotency-Key": "shared"},
+        environ_base={"REMOTE_ADDR": "10.0.0.2"},
+    )
+
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    assert User.query.filter_by(email="scoped2@flask.com").count() == 1
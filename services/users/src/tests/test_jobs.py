@@ -0,0 +1,150 @@
+import datetime
+import json
+import time
+
+import pytest
+from flask import Flask
+
+from src import bcrypt
+from src.api import jobs
+from src.api.users import tasks
+from src.api.users.models import Job, User
+
+calls = []
+
+
+@jobs.job(name="test_record", concurrency=1)
+def record(value):
+    calls.append(value)
+
+
+@jobs.job(name="test_fail", max_attempts=2)
+def fail():
+    raise RuntimeError("boom")
+
+
+@jobs.job(name="test_slow")
+def slow(seconds):
+    time.sleep(seconds)
+
+
+@pytest.fixture(scope="function")
+def job_queue(test_app: Flask, test_database):
+    test_database.session.query(Job).delete()
+    test_database.session.commit()
+    calls.clear()
+    yield jobs
+
+
+def test_worker_runs_queued_jobs(test_app: Flask, job_queue):
+    record.enqueue(value=1)
+    record.enqueue(value=2)
+
+    assert job_queue.work(test_app, burst=True) == 2
+    assert calls == [1, 2]
+    assert {job.status for job in Job.query.all()} == {jobs.DONE}
+
+
+def test_jobs_wait_until_due(test_app: Flask, job_queue):
+    later = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    record.enqueue(run_at=later, value=1)
+
+    assert job_queue.claim_job("test") is None
+
+
+def test_failed_jobs_are_retried_with_backoff(test_app: Flask, job_queue):
+    fail.enqueue()
+
+    claimed = job_queue.claim_job("test")
+    assert not job_queue.run_job(claimed)
+    assert claimed.status == jobs.QUEUED
+    assert claimed.attempts == 1
+    assert claimed.run_at > datetime.datetime.utcnow()
+    assert "RuntimeError: boom" in claimed.last_error
+
+    claimed.run_at = datetime.datetime.utcnow()
+    claimed = job_queue.claim_job("test")
+    assert not job_queue.run_job(claimed)
+    assert claimed.status == jobs.FAILED
+
+
+def test_job_concurrency_limit(test_app: Flask, job_queue):
+    record.enqueue(value=1)
+    record.enqueue(value=2)
+
+    assert job_queue.claim_job("test") is not None
+    assert job_queue.claim_job("test") is None
+
+
+def test_stale_jobs_are_reclaimed(test_app: Flask, test_database, job_queue):
+    record.enqueue(value=1)
+    claimed = job_queue.claim_job("crashed")
+    claimed.locked_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    test_database.session.commit()
+
+    reclaimed = job_queue.claim_job("test")
+
+    assert reclaimed.id == claimed.id
+    assert reclaimed.locked_by == "test"
+    assert reclaimed.attempts == 2
+
+
+def test_running_jobs_keep_their_lease(
+    test_app: Flask, test_database, job_queue, monkeypatch
+):
+    monkeypatch.setitem(test_app.config, "JOB_HEARTBEAT_INTERVAL", 0.05)
+    slow.enqueue(seconds=0.3)
+    claimed = job_queue.claim_job("test")
+    claimed.locked_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    test_database.session.commit()
+
+    assert job_queue.run_job(claimed)
+    assert claimed.locked_at > datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=1
+    )
+
+
+def test_import_users_job(test_app: Flask, job_queue, create_user):
+    create_user("taken", "taken-import@flask.com", "mypassword123")
+    tasks.import_users.enqueue(
+        users=tasks.hash_passwords(
+            [
+                {
+                    "username": "imported",
+                    "email": "imported@flask.com",
+                    "password": "mypassword123",
+                },
+                {
+                    "username": "duplicate",
+                    "email": "taken-import@flask.com",
+                    "password": "mypassword123",
+                },
+            ]
+        )
+    )
+
+    job_queue.work(test_app, burst=True)
+
+    assert User.query.filter_by(email="imported@flask.com").count() == 1
+    assert User.query.filter_by(email="taken-import@flask.com").count() == 1
+
+
+def test_import_users_keeps_no_plaintext(test_app: Flask, job_queue):
+    tasks.import_users.enqueue(
+        users=tasks.hash_passwords(
+            [
+                {
+                    "username": "secret",
+                    "email": "secret-import@flask.com",
+                    "password": "plaintext-secret",
+                }
+            ]
+        )
+    )
+    job_queue.work(test_app, burst=True)
+
+    user = User.query.filter_by(email="secret-import@flask.com").one()
+    assert bcrypt.check_password_hash(user.password, "plaintext-secret")
+    [finished] = Job.query.all()
+    assert finished.status == jobs.DONE
+    assert "plaintext-secret" not in json.dumps(finished.payload)
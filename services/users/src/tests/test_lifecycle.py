@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool, SingletonThreadPool
+
+from src import db
+from src.api.users import crud
+from src.api.users.login_events import login_events
+from src.api.users.models import LoginEvent
+from src.lifecycle import lifecycle
+
+
+@pytest.fixture(scope="function")
+def fresh_lifecycle():
+    lifecycle.ready = lifecycle.draining = False
+    yield lifecycle
+    lifecycle.ready = lifecycle.draining = False
+
+
+def test_ready_after_warm_up(test_app: Flask, test_database, fresh_lifecycle):
+    client = test_app.test_client()
+    resp = client.get("/ready")
+    data = json.loads(resp.data.decode())
+
+    assert resp.status_code == 200
+    assert data == {"status": "ready"}
+    assert fresh_lifecycle.ready
+
+
+def test_not_ready_when_warm_up_fails(
+    test_app: Flask, test_database, fresh_lifecycle, monkeypatch
+):
+    def unreachable():
+        raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+    monkeypatch.setattr(fresh_lifecycle, "_open_connections", unreachable)
+    client = test_app.test_client()
+    resp = client.get("/ready")
+
+    assert resp.status_code == 503
+    assert json.loads(resp.data.decode()) == {"status": "starting"}
+
+    monkeypatch.undo()
+    assert client.get("/ready").status_code == 200
+
+
+@pytest.mark.parametrize(
+    "poolclass, options, opened",
+    [
+        (QueuePool, {"pool_size": 3}, 3),
+        # Its ``size`` is an int, not a method.
+        (SingletonThreadPool, {"pool_size": 5}, 1),
+    ],
+)
+def test_warm_up_prepares_every_connection(
+    test_app: Flask, fresh_lifecycle, monkeypatch, tmp_path, poolclass, options, opened
+):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'warm.db'}", poolclass=poolclass, **options
+    )
+    prepared = []
+    monkeypatch.setattr(db, "get_engine", lambda app, bind=None: engine)
+    monkeypatch.setattr(
+        crud,
+        "prepare_lookups",
+        lambda connection: prepared.append(connection.connection.dbapi_connection),
+    )
+
+    with test_app.app_context():
+        fresh_lifecycle._open_connections()
+    engine.dispose()
+
+    assert len(set(map(id, prepared))) == opened
+
+
+def test_draining_fails_readiness(test_app: Flask, test_database, fresh_lifecycle):
+    fresh_lifecycle.warm_up()
+    fresh_lifecycle.drain()
+    client = test_app.test_client()
+    resp = client.get("/ready")
+
+    assert resp.status_code == 503
+    assert json.loads(resp.data.decode()) == {"status": "draining"}
+    # Other requests are still served while draining.
+    assert client.get("/users").status_code == 200
+
+
+def test_shutdown_flushes_login_events(test_app: Flask, test_database):
+    before = LoginEvent.query.count()
+    login_events.record(1, "login")
+
+    lifecycle.shutdown()
+
+    assert LoginEvent.query.count() == before + 1
@@ -0,0 +1,49 @@
+import os
+import tracemalloc
+
+from src import memory
+from src.memory import MemoryProfiler, module_for
+
+
+def test_usage_reports_rss():
+    current = memory.usage()
+
+    assert current["rss"] > 0
+    if current["uss"] is not None:
+        assert 0 < current["uss"] <= current["rss"]
+
+
+def test_module_for_groups_by_package():
+    site = "/usr/lib/python3.10/site-packages"
+
+    assert module_for(f"{site}/sqlalchemy/orm/identity.py") == "sqlalchemy.orm"
+    assert module_for(f"{site}/flask_restx/marshalling.py") == "flask_restx"
+    assert module_for(f"{site}/six.py") == "six"
+    assert module_for("/usr/src/app/src/api/users/crud.py") == "src.api"
+    assert module_for(os.__file__) == "stdlib"
+
+
+def test_profiler_diffs_against_previous_report():
+    profiler = MemoryProfiler()
+    try:
+        assert "baseline" in profiler.report()
+        retained = [bytearray(1024) for _ in range(2048)]
+        report = profiler.report()
+    finally:
+        tracemalloc.stop()
+
+    header, columns, top = report.splitlines()[:3]
+    assert f"pid={os.getpid()}" in header
+    assert top.endswith("src.tests")
+    assert float(top.split("M")[0]) >= 2
+    del retained
+
+
+def test_metrics_include_memory_gauges(test_app):
+    client = test_app.test_client()
+    resp = client.get("/metrics")
+
+    assert resp.status_code == 200
+    assert f'process_resident_memory_bytes{{worker="{os.getpid()}"}}' in (
+        resp.data.decode()
+    )
@@ -0,0 +1,140 @@
+import hashlib
+import json
+
+import pytest
+from flask import Flask
+from starlette.testclient import TestClient
+
+from src import asgi
+from src.api.users import tasks
+from src.api.users.models import Job
+from src.bloom import BloomFilter
+
+from src.api.users.passwords import (  # isort:skip
+    BREACHED_MESSAGE,
+    BreachedPasswords,
+    build_breach_filter,
+)
+
+
+@pytest.fixture(scope="function")
+def breach_filter(test_app: Flask, tmp_path):
+    corpus = tmp_path / "corpus.txt"
+    corpus.write_text(
+        "".join(
+            f"{hashlib.sha1(password.encode()).hexdigest().upper()}:42\n"
+            for password in ("password123", "letmein", "qwerty")
+        )
+    )
+    path = str(tmp_path / "breached.bloom")
+    build_breach_filter(str(corpus), path)
+    test_app.config["BREACHED_PASSWORDS_FILTER"] = path
+    yield path
+    test_app.config["BREACHED_PASSWORDS_FILTER"] = None
+
+
+def test_bloom_filter(tmp_path):
+    bloom = BloomFilter.create(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(BloomFilter.digest(f"added-{i}"))
+    bloom.save(str(tmp_path / "test.bloom"))
+
+    mapped = BloomFilter.open(str(tmp_path / "test.bloom"))
+    false_positives = sum(
+        BloomFilter.digest(f"missing-{i}") in mapped for i in range(10000)
+    )
+
+    assert all(BloomFilter.digest(f"added-{i}") in mapped for i in range(1000))
+    assert false_positives < 300
+
+
+def test_bloom_filter_rejects_other_files(tmp_path):
+    (tmp_path / "other").write_bytes(b"not a bloom filter at all")
+
+    with pytest.raises(ValueError):
+        BloomFilter.open(str(tmp_path / "other"))
+
+
+def test_rebuilt_filter_is_reopened(breach_filter, tmp_path):
+    breached = BreachedPasswords()
+    assert breached.is_breached("letmein", path=breach_filter)
+    assert not breached.is_breached("hunter2", path=breach_filter)
+
+    corpus = tmp_path / "rebuilt.txt"
+    corpus.write_text("hunter2\n")
+    build_breach_filter(str(corpus), breach_filter, plaintext=True)
+
+    assert breached.is_breached("hunter2", path=breach_filter)
+    assert not breached.is_breached("letmein", path=breach_filter)
+
+
+@pytest.mark.parametrize("url", ["/auth/register", "/users"])
+def test_breached_password_is_rejected(
+    test_app: Flask, test_database, breach_filter, url
+):
+    client = test_app.test_client()
+    response = client.post(
+        url,
+        data=json.dumps(
+            {
+                "username": "breached",
+                "email": "breached@flask.com",
+                "password": "qwerty",
+            }
+        ),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 400
+    assert "Sorry. That password has appeared in a data breach." in data["message"]
+
+
+def test_unbreached_password_is_accepted(test_app: Flask, test_database, breach_filter):
+    client = test_app.test_client()
+    response = client.post(
+        "/auth/register",
+        data=json.dumps(
+            {
+                "username": "unbreached",
+                "email": "unbreached@flask.com",
+                "password": "a much longer passphrase",
+            }
+        ),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 201
+
+
+@pytest.mark.parametrize("url", ["/auth/register", "/users"])
+def test_breached_password_is_rejected_async(
+    test_app: Flask, test_database, breach_filter, monkeypatch, url
+):
+    monkeypatch.setitem(test_app.config, "BREACHED_PASSWORDS_FILTER", breach_filter)
+    with TestClient(asgi.create_app(test_app)) as client:
+        response = client.post(
+            url,
+            json={
+                "username": "breached",
+                "email": "breached-async@flask.com",
+                "password": "letmein",
+            },
+        )
+
+    assert response.status_code == 400
+    assert BREACHED_MESSAGE in response.json()["message"]
+
+
+def test_import_skips_breached_passwords(test_app: Flask, test_database, breach_filter):
+    Job.query.delete()
+    queued, breached = tasks.queue_import(
+        [
+            {"username": "a", "email": "a@flask.com", "password": "password123"},
+            {"username": "b", "email": "b@flask.com", "password": "a passphrase"},
+        ]
+    )
+
+    assert (queued, breached) == (1, 1)
+    [queued_job] = Job.query.all()
+    assert [user["email"] for user in queued_job.payload["users"]] == ["b@flask.com"]
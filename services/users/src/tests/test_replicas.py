@@ -0,0 +1,79 @@
+import json
+
+import pytest
+from flask import Flask
+
+from src import db, replicas
+from src.api.users.models import User
+
+
+@pytest.fixture(scope="function")
+def replica(test_app: Flask, test_database, tmp_path):
+    test_app.config["SQLALCHEMY_BINDS"] = {
+        "replica_0": f"sqlite:///{tmp_path / 'replica.db'}"
+    }
+    engine = db.get_engine(bind="replica_0")
+    User.__table__.create(engine)
+    yield engine
+    test_app.config["SQLALCHEMY_BINDS"] = {}
+    replicas._down_until.clear()
+
+
+def _copy_to_replica(engine, user: User, **changes):
+    row = {c.name: getattr(user, c.name) for c in User.__table__.columns}
+    row.update(changes)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), row)
+    db.session.expire_all()
+
+
+def test_get_reads_from_replica(test_app: Flask, replica, create_user):
+    user = create_user("primary", "replica-read@flask.com", "mypassword123")
+    user_id = user.id
+    _copy_to_replica(replica, user, username="from-replica")
+
+    client = test_app.test_client()
+    response = client.get(f"/users/{user_id}")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data["username"] == "from-replica"
+
+
+def test_reads_stick_to_primary_after_write(test_app: Flask, replica):
+    client = test_app.test_client()
+    response = client.post(
+        "/users",
+        data=json.dumps(
+            {
+                "username": "writer",
+                "email": "read-your-writes@flask.com",
+                "password": "mypassword123",
+            }
+        ),
+        content_type="application/json",
+    )
+    assert response.status_code == 201
+
+    user = User.query.filter_by(email="read-your-writes@flask.com").first()
+    response = client.get(f"/users/{user.id}")
+
+    assert response.status_code == 200
+    assert test_app.test_client().get(f"/users/{user.id}").status_code == 404
+
+
+def test_unhealthy_replica_falls_back_to_primary(
+    test_app: Flask, test_database, create_user, tmp_path
+):
+    test_app.config["SQLALCHEMY_BINDS"] = {
+        "replica_0": f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"
+    }
+    user = create_user("primary", "replica-down@flask.com", "mypassword123")
+
+    client = test_app.test_client()
+    response = client.get(f"/users/{user.id}")
+
+    assert response.status_code == 200
+    assert "replica_0" in replicas._down_until
+    test_app.config["SQLALCHEMY_BINDS"] = {}
+    replicas._down_until.clear()
@@ -0,0 +1,158 @@
+import json
+
+import pytest
+from flask import Flask
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from src import db, shards
+from src.api.users import crud
+from src.api.users.autocomplete import AutocompleteIndex
+from src.api.users.models import ShardMap, User, UserDirectory
+
+
+@pytest.fixture(scope="function")
+def sharded(test_app: Flask, test_database, tmp_path):
+    test_app.config["SQLALCHEMY_BINDS"] = {
+        "shard_0": f"sqlite:///{tmp_path / 'shard_0.db'}",
+        "shard_1": f"sqlite:///{tmp_path / 'shard_1.db'}",
+    }
+    test_app.config["SHARD_MAP_TTL"] = 0
+    shards.create_all()
+    yield shards
+    shards._remove_session()
+    test_app.config["SQLALCHEMY_BINDS"] = {}
+    db.session.execute(delete(ShardMap))
+    db.session.execute(delete(UserDirectory))
+    db.session.commit()
+
+
+def _add_user(client, username: str, email: str):
+    response = client.post(
+        "/users",
+        data=json.dumps(
+            {"username": username, "email": email, "password": "mypassword123"}
+        ),
+        content_type="application/json",
+    )
+    assert response.status_code == 201
+    return db.session.execute(
+        select(UserDirectory.id).where(UserDirectory.email == email)
+    ).scalar_one()
+
+
+def _shard_ids(shard_id: str) -> list:
+    with db.get_engine(bind=shard_id).connect() as connection:
+        return connection.execute(select(User.id)).scalars().all()
+
+
+def test_users_are_routed_to_shards(test_app: Flask, sharded):
+    client = test_app.test_client()
+    first = _add_user(client, "first", "first-shard@flask.com")
+    second = _add_user(client, "second", "second-shard@flask.com")
+
+    assert sharded.shard_for(first) != sharded.shard_for(second)
+    assert first in _shard_ids(sharded.shard_for(first))
+    assert second in _shard_ids(sharded.shard_for(second))
+    assert User.query.filter(User.id.in_([first, second])).count() == 0
+
+    response = client.get(f"/users/{second}")
+    assert response.status_code == 200
+    assert json.loads(response.data.decode())["email"] == "second-shard@flask.com"
+
+    response = client.get("/users")
+    data = json.loads(response.data.decode())
+    assert [user["id"] for user in data] == [first, second]
+
+
+def test_sharded_duplicate_email(test_app: Flask, sharded):
+    client = test_app.test_client()
+    _add_user(client, "first", "taken-shard@flask.com")
+
+    response = client.post(
+        "/users",
+        data=json.dumps(
+            {
+                "username": "second",
+                "email": "taken-shard@flask.com",
+                "password": "mypassword123",
+            }
+        ),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+    assert "Sorry. That email already exists." in response.data.decode()
+
+
+def test_move_bucket(test_app: Flask, sharded):
+    client = test_app.test_client()
+    user_id = _add_user(client, "mover", "mover-shard@flask.com")
+    source = sharded.shard_for(user_id)
+    target = next(shard for shard in sharded.shard_ids() if shard != source)
+
+    moved = sharded.move_bucket(sharded.bucket_for(user_id), target, wait=0)
+
+    assert moved == 1
+    assert sharded.shard_for(user_id) == target
+    assert user_id in _shard_ids(target)
+    assert user_id not in _shard_ids(source)
+    assert client.get(f"/users/{user_id}").status_code == 200
+
+
+def test_sharded_duplicate_email_race(test_app: Flask, sharded):
+    # The request-time duplicate check is skipped, as when two requests race.
+    crud.create_user("first", "race-shard@flask.com", "mypassword123")
+
+    with pytest.raises(IntegrityError):
+        crud.create_user("second", "race-shard@flask.com", "mypassword123")
+
+    # A deactivated user gives the email back.
+    crud.deactivate_user(crud.get_users_by_emails(["race-shard@flask.com"])[0])
+    assert crud.create_user("third", "race-shard@flask.com", "mypassword123")
+
+
+def test_sharded_update_keeps_directory_on_shard_failure(
+    test_app: Flask, sharded, monkeypatch
+):
+    client = test_app.test_client()
+    user_id = _add_user(client, "keeper", "keeper-shard@flask.com")
+    user = crud.get_user_by_id(user_id)
+
+    def fail(user):
+        raise OperationalError("COMMIT", {}, Exception("shard is down"))
+
+    monkeypatch.setattr(crud, "_commit", fail)
+    with pytest.raises(OperationalError):
+        crud.update_user(user, "keeper", "moved-shard@flask.com")
+
+    entry = db.session.get(UserDirectory, user_id)
+    db.session.refresh(entry)
+    assert entry.email == "keeper-shard@flask.com"
+
+
+def test_sharded_users_are_paged_and_merged(test_app: Flask, sharded):
+    client = test_app.test_client()
+    test_app.config["SHARD_PAGE_SIZE"] = 1
+    ids = [
+        _add_user(client, f"paged{i}", f"paged{i}-shard@flask.com") for i in range(5)
+    ]
+
+    assert [user.id for user in crud.get_all_users()] == ids
+    page = crud.get_all_users(after_id=ids[1], limit=2)
+    assert [user.id for user in page] == ids[2:4]
+    response = client.get(f"/users?after_id={ids[0]}&limit=3")
+    assert [user["id"] for user in json.loads(response.data.decode())] == ids[1:4]
+    test_app.config["SHARD_PAGE_SIZE"] = 1000
+
+
+def test_autocomplete_loads_from_shards(test_app: Flask, sharded):
+    client = test_app.test_client()
+    user_id = _add_user(client, "completed", "completed-shard@flask.com")
+
+    index = AutocompleteIndex(test_app)
+    index.load()
+
+    assert index.search("completed") == [
+        (user_id, "completed", "completed-shard@flask.com")
+    ]
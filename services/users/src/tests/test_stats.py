@@ -0,0 +1,128 @@
+import datetime
+import json
+
+from flask import Flask
+
+from src.api.users import crud
+from src.api.users.models import User, UserArchive, UserStats
+
+from src.api.users.stats import (  # isort:skip
+    bucket_stats,
+    period_count,
+    periods,
+    rebuild_stats,
+)
+
+
+def _counts(test_database, day: datetime.date) -> tuple:
+    row = test_database.session.get(UserStats, day)
+    test_database.session.expire_all()
+    return (row.signups, row.active, row.inactive) if row else (0, 0, 0)
+
+
+def _reset(test_database):
+    test_database.session.query(User).delete()
+    test_database.session.query(UserArchive).delete()
+    test_database.session.commit()
+    rebuild_stats()
+
+
+def test_crud_keeps_counts(test_app: Flask, test_database):
+    _reset(test_database)
+    today = datetime.datetime.utcnow().date()
+
+    crud.create_user("counted", "counted@flask.com", "mypassword123")
+    leaving = crud.create_user("leaving", "leaving@flask.com", "mypassword123")
+    assert _counts(test_database, today) == (2, 2, 0)
+
+    crud.deactivate_user(leaving)
+    assert _counts(test_database, today) == (2, 1, 1)
+
+    assert crud.archive_users(datetime.timedelta(seconds=-60)) == 1
+    assert _counts(test_database, today) == (2, 1, 0)
+
+
+def test_rebuild_stats(test_app: Flask, test_database):
+    _reset(test_database)
+    old = crud.create_user("old", "old@flask.com", "mypassword123")
+    crud.create_user("new", "new@flask.com", "mypassword123")
+    # Written behind the rollup's back.
+    old.created_date = datetime.datetime(2021, 3, 4, 12)
+    old.active = False
+    test_database.session.commit()
+
+    assert rebuild_stats() == 2
+    assert _counts(test_database, datetime.date(2021, 3, 4)) == (1, 0, 1)
+    assert _counts(test_database, datetime.datetime.utcnow().date()) == (1, 1, 0)
+
+
+def test_periods():
+    assert periods(datetime.date(2024, 1, 30), datetime.date(2024, 3, 1), "month") == [
+        datetime.date(2024, 1, 1),
+        datetime.date(2024, 2, 1),
+        datetime.date(2024, 3, 1),
+    ]
+    assert periods(datetime.date(2024, 1, 3), datetime.date(2024, 1, 8), "week") == [
+        datetime.date(2024, 1, 1),
+        datetime.date(2024, 1, 8),
+    ]
+
+
+def test_period_count():
+    since = datetime.date(2023, 12, 30)
+    for until in (since, datetime.date(2024, 1, 8), datetime.date(2025, 3, 1)):
+        for bucket in ("day", "week", "month"):
+            assert period_count(since, until, bucket) == len(
+                periods(since, until, bucket)
+            )
+    assert period_count(since, datetime.date(2023, 12, 1), "day") == 0
+
+
+def test_bucket_stats():
+    days = [
+        UserStats(day=datetime.date(2024, 1, 2), signups=2, active=1, inactive=1),
+        UserStats(day=datetime.date(2024, 1, 5), signups=1, active=1, inactive=0),
+    ]
+
+    assert bucket_stats(
+        days, datetime.date(2024, 1, 1), datetime.date(2024, 1, 8), "week"
+    ) == [
+        {"start": datetime.date(2024, 1, 1), "signups": 3, "active": 2, "inactive": 1},
+        {"start": datetime.date(2024, 1, 8), "signups": 0, "active": 0, "inactive": 0},
+    ]
+
+
+def test_stats_endpoint(test_app: Flask, test_database):
+    _reset(test_database)
+    crud.create_user("stats", "stats@flask.com", "mypassword123")
+    today = datetime.datetime.utcnow().date()
+
+    client = test_app.test_client()
+    response = client.get(f"/users/stats?since={today}&until={today}")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data == {
+        "bucket": "day",
+        "periods": [
+            {"start": today.isoformat(), "signups": 1, "active": 1, "inactive": 0}
+        ],
+        "total": {"signups": 1, "active": 1, "inactive": 0},
+    }
+
+    response = client.get("/users/stats?bucket=month")
+    data = json.loads(response.data.decode())
+    assert response.status_code == 200
+    assert len(data["periods"]) in (2, 3)
+
+
+def test_stats_invalid_range(test_app: Flask, test_database):
+    client = test_app.test_client()
+
+    response = client.get("/users/stats?since=2024-02-01&until=2024-01-01")
+    assert response.status_code == 400
+    assert "Sorry. Invalid date range." in response.get_json()["message"]
+
+    response = client.get("/users/stats?since=2000-01-01&until=2024-01-01")
+    assert response.status_code == 400
+    assert "At most 1000 periods" in response.get_json()["message"]
@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+import os
+
+import pytest
+from flask import Flask
+from starlette.testclient import TestClient
+
+from src.api.users import crud
+from src.api.users.models import UserEvent
+from src.asgi import create_app
+
+from src.api.users.events import (  # isort:skip
+    UserEventStream,
+    purge_expired_events,
+    user_events,
+)
+
+
+@pytest.fixture(scope="function")
+def stream(test_app: Flask, test_database):
+    stream = UserEventStream()
+    stream.app = test_app
+    # Drive ``_fetch`` by hand instead of from a listener thread.
+    stream._pid = os.getpid()
+    return stream
+
+
+@pytest.fixture(scope="function")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+def _next(loop, messages):
+    return loop.run_until_complete(messages.__anext__())
+
+
+def _events(test_database):
+    return test_database.session.query(UserEvent).order_by(UserEvent.id).all()
+
+
+def test_crud_records_events(test_app: Flask, test_database):
+    test_database.session.query(UserEvent).delete()
+    user = crud.create_user("evented", "evented@flask.com", "mypassword123")
+    crud.update_user(user, "evented", "renamed@flask.com")
+    crud.delete_user(user)
+
+    assert [
+        (event.kind, event.user_id, event.data) for event in _events(test_database)
+    ] == [
+        ("created", user.id, {"username": "evented", "email": "evented@flask.com"}),
+        ("updated", user.id, {"email": "renamed@flask.com"}),
+        ("deleted", user.id, {}),
+    ]
+
+
+def test_subscriber_receives_new_events(stream, test_database, loop):
+    messages = stream.subscribe()
+    assert _next(loop, messages).startswith("retry: ")
+
+    user = crud.create_user("streamed", "streamed@flask.com", "mypassword123")
+    stream._fetch()
+    event_id = _events(test_database)[-1].id
+
+    assert _next(loop, messages) == (
+        f"id: {event_id}\nevent: created\n"
+        f'data: {{"id":{user.id},"username":"streamed","email":"streamed@flask.com"}}\n\n'
+    )
+
+
+def test_events_fan_out_to_every_subscriber(stream, test_database, loop):
+    streams = [stream.subscribe() for _ in range(3)]
+    for messages in streams:
+        _next(loop, messages)
+    assert len(stream._waiters) == 3
+
+    crud.create_user("fanned", "fanned@flask.com", "mypassword123")
+    stream._fetch()
+
+    for messages in streams:
+        assert "event: created\n" in _next(loop, messages)
+        loop.run_until_complete(messages.aclose())
+    assert not stream._waiters
+
+
+def test_subscriber_gets_keepalive(stream, test_app: Flask, loop):
+    test_app.config["USER_EVENTS_KEEPALIVE"] = 0.01
+    messages = stream.subscribe()
+    _next(loop, messages)
+
+    assert _next(loop, messages) == ": keepalive\n\n"
+    test_app.config["USER_EVENTS_KEEPALIVE"] = 15
+
+
+def test_resume_from_table(stream, test_database, loop):
+    user = crud.create_user("resumed", "resumed@flask.com", "mypassword123")
+    crud.delete_user(user)
+    created, deleted = _events(test_database)[-2:]
+    stream._fetch()
+
+    messages = stream.subscribe(created.id - 1)
+    _next(loop, messages)
+
+    backlog = _next(loop, messages)
+    assert backlog.startswith(f"id: {created.id}\nevent: created\n")
+    assert f"id: {deleted.id}\nevent: deleted\n" in backlog
+
+
+def test_resume_after_purge_resets(stream, test_app: Flask, test_database, loop):
+    crud.create_user("purged", "purged@flask.com", "mypassword123")
+    stream._fetch()
+    test_database.session.query(UserEvent).update(
+        {"created_date": datetime.datetime(2000, 1, 1)}
+    )
+    test_database.session.commit()
+    assert purge_expired_events() > 0
+
+    messages = stream.subscribe(0)
+    _next(loop, messages)
+
+    assert f"id: {stream._last_id}\nevent: reset\n" in _next(loop, messages)
+
+
+def test_slow_subscriber_resets(stream, test_app: Flask, test_database, loop):
+    test_app.config["USER_EVENTS_BUFFER"] = 1
+    messages = stream.subscribe()
+    _next(loop, messages)
+
+    crud.create_user("first", "first@flask.com", "mypassword123")
+    crud.create_user("second", "second@flask.com", "mypassword123")
+    stream._fetch()
+    test_app.config["USER_EVENTS_BUFFER"] = 1000
+
+    assert "event: reset\n" in _next(loop, messages)
+
+
+def test_gap_holds_later_events(stream):
+    stream._floor = stream._last_id = 10
+
+    def row(event_id):
+        return (event_id, "deleted", event_id, {})
+
+    # 11 is not committed yet; 12 waits for the transactions running now.
+    stream._receive([row(12)], snapshot=(100, 105))
+    assert stream._last_id == 10
+    stream._receive([row(12)], snapshot=(104, 108))
+    assert stream._last_id == 10
+    stream._receive([row(11), row(12)], snapshot=(104, 108))
+    assert [event_id for event_id, _ in stream._events] == [11, 12]
+
+    # 13 was rolled back: once its transaction is over, 14 goes through.
+    stream._receive([row(14)], snapshot=(106, 110))
+    assert stream._last_id == 12
+    stream._receive([row(14)], snapshot=(110, 111))
+    assert stream._last_id == 14
+
+
+def test_events_endpoint(test_app: Flask, test_database, monkeypatch):
+    monkeypatch.setattr(user_events, "_pid", os.getpid())
+    monkeypatch.setitem(test_app.config, "USER_EVENTS_KEEPALIVE", 0.01)
+    monkeypatch.setitem(test_app.config, "USER_EVENTS_STREAM_SECONDS", 0.05)
+
+    with TestClient(create_app(test_app)) as client:
+        response = client.get("/users/events")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.headers["X-Accel-Buffering"] == "no"
+        assert response.text.startswith("retry: ")
+        assert ": keepalive\n\n" in response.text
+
+        response = client.get("/users/events", headers={"Last-Event-ID": "nope"})
+        assert response.status_code == 400
+        assert response.json()["message"] == "Sorry. Invalid event id."
+
+    # The Flask app leaves the stream to the async app.
+    assert test_app.test_client().get("/users/events").status_code == 404
@@ -1,3 +1,4 @@
+import datetime
 import json
 
 import pytest
@@ -5,8 +6,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 
 from src import bcrypt
-from src.api.users.crud import get_user_by_id
-from src.api.users.models import User
+from src.api.users.crud import archive_users, deactivate_user, get_user_by_id
+from src.api.users.models import User, UserArchive
 
 
 def test_create_user(test_app: Flask, test_database):
@@ -85,7 +86,7 @@ def test_create_user_duplicate_email(test_app: Flask, test_database):
 
 
 def test_single_user(test_app: Flask, test_database, create_user):
-    user = create_user("jpinto", "jpinto@flask.com", "mypassword123")
+    user = create_user("jpinto", "single@flask.com", "mypassword123")
 
     client = test_app.test_client()
     response = client.get(f"/users/{user.id}")
@@ -93,7 +94,7 @@ def test_single_user(test_app: Flask, test_database, create_user):
 
     assert response.status_code == 200
     assert "jpinto" in data["username"]
-    assert "jpinto@flask.com" in data["email"]
+    assert "single@flask.com" in data["email"]
     assert "password" not in data
 
 
@@ -244,3 +245,148 @@ def test_update_user_with_password(test_app: Flask, test_database, create_user):
     user = get_user_by_id(user.id)
     assert bcrypt.check_password_hash(user.password, old_password)
     assert not bcrypt.check_password_hash(user.password, new_password)
+
+
+def test_remove_user_is_soft_delete(test_app: Flask, test_database, create_user):
+    user = create_user("soft-delete-me", "soft-delete@flask.com", "mypassword123")
+    client = test_app.test_client()
+
+    response = client.delete(f"/users/{user.id}")
+    assert response.status_code == 200
+
+    assert get_user_by_id(user.id) is None
+    assert test_database.session.get(User, user.id).active is False
+
+    response = client.get(f"/users/{user.id}")
+    assert response.status_code == 404
+
+
+def test_archive_users(test_app: Flask, test_database, create_user):
+    test_database.session.query(User).delete()
+    test_database.session.query(UserArchive).delete()
+    kept = create_user("keep-me", "keep-me@flask.com", "mypassword123")
+    users = [
+        create_user(f"archive-me-{i}", f"archive-me-{i}@flask.com", "mypassword123")
+        for i in range(3)
+    ]
+    for user in users:
+        deactivate_user(user)
+
+    assert archive_users(datetime.timedelta(days=1)) == 0
+
+    archived = archive_users(datetime.timedelta(seconds=-60), batch_size=2)
+    assert archived == 3
+    assert test_database.session.query(User).all() == [kept]
+    assert test_database.session.query(UserArchive).count() == 3
+
+
+def test_lookup_users_by_ids(test_app: Flask, test_database, create_user):
+    first = create_user("first", "first@flask.com", "mypassword123")
+    second = create_user("second", "second@flask.com", "mypassword123")
+
+    client = test_app.test_client()
+    response = client.get(f"/users?ids={second.id},999,{first.id}")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert [found and found["username"] for found in data] == [
+        "second",
+        None,
+        "first",
+    ]
+    assert "password" not in data[0]
+
+
+def test_lookup_users_by_emails(test_app: Flask, test_database, create_user):
+    create_user("lookup", "lookup@flask.com", "mypassword123")
+
+    client = test_app.test_client()
+    response = client.post(
+        "/users/lookup",
+        data=json.dumps({"emails": ["missing@flask.com", "lookup@flask.com"]}),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data[0] is None
+    assert data[1]["email"] == "lookup@flask.com"
+
+
+def test_archive_dormant_users(test_app: Flask, test_database, create_user):
+    test_database.session.query(User).delete()
+    dormant = create_user("dormant", "dormant@flask.com", "mypassword123")
+    recent = create_user("recent", "recent@flask.com", "mypassword123")
+    dormant.last_login_at = datetime.datetime.utcnow() - datetime.timedelta(days=400)
+    recent.last_login_at = datetime.datetime.utcnow()
+    test_database.session.commit()
+
+    archived = archive_users(
+        datetime.timedelta(days=30), dormant_for=datetime.timedelta(days=365)
+    )
+
+    assert archived == 1
+    assert test_database.session.query(User).all() == [recent]
+
+
+def test_all_users_sparse_fields(test_app: Flask, test_database, create_user):
+    test_database.session.query(User).delete()
+    create_user("sparse", "sparse@flask.com", "mypassword123")
+
+    client = test_app.test_client()
+    response = client.get("/users?fields=id,username")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert [sorted(found) for found in data] == [["id", "username"]]
+    assert data[0]["username"] == "sparse"
+
+
+def test_lookup_users_sparse_fields(test_app: Flask, test_database, create_user):
+    user = create_user("sparseids", "sparseids@flask.com", "mypassword123")
+
+    client = test_app.test_client()
+    response = client.get(f"/users?ids={user.id},999&fields=email")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data == [{"email": "sparseids@flask.com"}, None]
+
+
+@pytest.mark.parametrize("key", ["ids", "emails"])
+def test_lookup_post_sparse_fields(test_app: Flask, test_database, create_user, key):
+    user = create_user(f"post{key}", f"post{key}@flask.com", "mypassword123")
+    keys = [user.id, 999] if key == "ids" else [user.email, "missing@flask.com"]
+
+    client = test_app.test_client()
+    response = client.post(
+        "/users/lookup?fields=username",
+        data=json.dumps({key: keys}),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data == [{"username": f"post{key}"}, None]
+
+
+def test_single_user_sparse_fields(test_app: Flask, test_database, create_user):
+    user = create_user("sparseone", "sparseone@flask.com", "mypassword123")
+
+    client = test_app.test_client()
+    response = client.get(f"/users/{user.id}?fields=email,created_date")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert sorted(data) == ["created_date", "email"]
+    assert data["email"] == "sparseone@flask.com"
+
+
+@pytest.mark.parametrize("fields", ["password", "id,bogus", ","])
+def test_sparse_fields_invalid(test_app: Flask, test_database, fields):
+    client = test_app.test_client()
+    response = client.get(f"/users?fields={fields}")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 400
+    assert "Sorry. Fields must be some of" in data["message"]
@@ -94,7 +94,7 @@ def test_add_user_duplicate_email(test_app: Flask, monkeypatch: pytest.MonkeyPat
 
 
 def test_single_user(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
-    def mock_get_user_by_id(user_id: int):
+    def mock_get_user_by_id(user_id: int, columns=None):
         return {
             "id": 1,
             "username": "jpinto",
@@ -114,7 +114,7 @@ def test_single_user(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
 
 
 def test_single_user_incorrect_id(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
-    def mock_get_user_by_id(user_id: int):
+    def mock_get_user_by_id(user_id: int, columns=None):
         return None
 
     monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
@@ -127,7 +127,7 @@ def test_single_user_incorrect_id(test_app: Flask, monkeypatch: pytest.MonkeyPat
 
 
 def test_all_users(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
-    def mock_get_all_users():
+    def mock_get_all_users(columns=None, after_id=None, limit=None):
         return [
             {
                 "id": 1,
@@ -164,7 +164,7 @@ def test_remove_user(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
             super(AttrDict, self).__init__(*args, **kwargs)
             self.__dict__ = self
 
-    def mock_get_user_by_id(user_id: int):
+    def mock_get_user_by_id(user_id: int, columns=None):
         d = AttrDict()
         d.update(
             {
@@ -189,7 +189,7 @@ def test_remove_user(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
 
 
 def test_remove_user_incorrect_id(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
-    def mock_get_user_by_id(user_id: int):
+    def mock_get_user_by_id(user_id: int, columns=None):
         return None
 
     monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
@@ -207,7 +207,7 @@ def test_update_user(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
             super(AttrDict, self).__init__(*args, **kwargs)
             self.__dict__ = self
 
-    def mock_get_user_by_id(user_id: int):
+    def mock_get_user_by_id(user_id: int, columns=None):
         d = AttrDict()
         d.update({"id": 1, "username": "me", "email": "me@flask.com"})
         return d
@@ -263,7 +263,7 @@ def test_update_user_invalid(
     status_code: int,
     message: str,
 ):
-    def mock_get_user_by_id(user_id):
+    def mock_get_user_by_id(user_id, columns=None):
         return None
 
     monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
@@ -285,7 +285,7 @@ def test_update_user_duplicate_email(test_app: Flask, monkeypatch: pytest.Monkey
             super(AttrDict, self).__init__(*args, **kwargs)
             self.__dict__ = self
 
-    def mock_get_user_by_id(user_id: int):
+    def mock_get_user_by_id(user_id: int, columns=None):
         d = AttrDict()
         d.update({"id": 1, "username": "me", "email": "me@flask.com"})
         return d
@@ -311,3 +311,55 @@ def test_update_user_duplicate_email(test_app: Flask, monkeypatch: pytest.Monkey
 
     assert response.status_code == 400
     assert "Sorry. That email already exists." in data["message"]
+
+
+def test_lookup_users(test_app: Flask, monkeypatch: pytest.MonkeyPatch):
+    def mock_get_users_by_ids(user_ids, columns=None):
+        return [
+            {"id": 1, "username": "jpinto", "email": "jpinto@flask.com"},
+            None,
+        ]
+
+    monkeypatch.setattr(src.api.users.views, "get_users_by_ids", mock_get_users_by_ids)
+    client = test_app.test_client()
+    response = client.post(
+        "/users/lookup",
+        data=json.dumps({"ids": [1, 2]}),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 200
+    assert data[0]["username"] == "jpinto"
+    assert data[1] is None
+
+
+@pytest.mark.parametrize(
+    "payload, message",
+    [
+        [{}, "Sorry. Provide either ids or emails."],
+        [{"ids": [1], "emails": ["a@b.c"]}, "Sorry. Provide either ids or emails."],
+        [{"ids": list(range(101))}, "Sorry. At most 100 users can be looked up."],
+        [{"ids": ["one"]}, "Input payload validation failed"],
+    ],
+)
+def test_lookup_users_invalid(test_app: Flask, payload, message: str):
+    client = test_app.test_client()
+    response = client.post(
+        "/users/lookup",
+        data=json.dumps(payload),
+        content_type="application/json",
+    )
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 400
+    assert message in data["message"]
+
+
+def test_lookup_users_invalid_ids(test_app: Flask):
+    client = test_app.test_client()
+    response = client.get("/users?ids=1,abc")
+    data = json.loads(response.data.decode())
+
+    assert response.status_code == 400
+    assert "Sorry. Invalid user ids." in data["message"]
@@ -0,0 +1,40 @@
+import pytest
+from flask import Flask
+from flask_restx import Model
+from werkzeug.exceptions import BadRequest
+
+from src.api import api
+from src.api.users.auth import login
+from src.api.users.views import user_post
+from src.api.validation import compiled_validator
+
+DEFINITIONS = {name: model.__schema__ for name, model in api.models.items()}
+
+
+@pytest.mark.parametrize(
+    "model, payload",
+    [
+        [login, {"email": "jpinto@flask.com", "password": "test"}],
+        [user_post, {"username": "jpinto", "email": "a@b.c", "password": "test"}],
+    ],
+)
+def test_compiled_validator_accepts_valid_payload(test_app: Flask, model, payload):
+    compiled_validator(model, DEFINITIONS)(payload)
+
+
+@pytest.mark.parametrize(
+    "model, payload",
+    [
+        [login, {}],
+        [login, {"email": 1, "password": "test"}],
+        [user_post, {"username": "jpinto", "password": "test"}],
+    ],
+)
+def test_compiled_validator_matches_default_errors(test_app: Flask, model, payload):
+    with test_app.test_request_context():
+        with pytest.raises(BadRequest) as default:
+            Model.validate(model, payload, api.refresolver)
+        with pytest.raises(BadRequest) as compiled:
+            compiled_validator(model, DEFINITIONS)(payload)
+
+    assert compiled.value.data == default.value.data